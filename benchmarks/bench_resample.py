@@ -0,0 +1,82 @@
+"""
+Micro-benchmark del remuestreo para el reconocimiento
+
+Mide cuántas muestras de entrada por segundo procesa un núcleo al convertir
+audio de 48 kHz estéreo a 16 kHz mono con utils.resample.Resampler, con
+distintos tamaños de bloque (20 ms es un paquete de voz, 0,5 s un bloque del
+mezclador, 10 s un bloque de lectura del VAD). Como referencia se mide
+también el diezmado por promedio de _convert_pcm, sin filtro antialiasing.
+
+Uso:
+    python benchmarks/bench_resample.py --seconds 60
+    python benchmarks/bench_resample.py --source-rate 44100 --target-rate 16000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+
+def make_audio(seconds, sample_rate, seed=0):
+    """Ruido con algo de tono, PCM int16 estéreo"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    mono = np.sin(2 * np.pi * 220 * t) * 6000 + rng.normal(0, 1500, len(t))
+    return np.repeat(mono.astype('<i2')[:, None], 2, axis=1).tobytes()
+
+
+def bench_resampler(audio, source_rate, target_rate, block_duration):
+    from utils.resample import Resampler
+
+    block_bytes = int(source_rate * block_duration) * 4
+    resampler = Resampler(source_rate, target_rate, channels=2)
+    started = time.process_time()
+    produced = 0
+    for offset in range(0, len(audio), block_bytes):
+        produced += len(resampler.process(audio[offset:offset + block_bytes]))
+    return time.process_time() - started, produced // 2
+
+
+def bench_average(audio, block_duration, factor):
+    from utils.audio_processing import _convert_pcm
+
+    block_bytes = int(48000 * block_duration) * 4
+    started = time.process_time()
+    produced = 0
+    for offset in range(0, len(audio), block_bytes):
+        produced += len(_convert_pcm(audio[offset:offset + block_bytes], 1, factor))
+    return time.process_time() - started, produced // 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60, help='Segundos de audio sintético')
+    parser.add_argument('--source-rate', type=int, default=48000)
+    parser.add_argument('--target-rate', type=int, default=16000)
+    args = parser.parse_args()
+
+    audio = make_audio(args.seconds, args.source_rate)
+    input_samples = len(audio) // 4
+
+    print(f"{args.seconds:.0f} s de audio, {args.source_rate} Hz estéreo -> {args.target_rate} Hz mono")
+    print(f"{'método':<22} {'bloque':>8} {'muestras/s por núcleo':>24} {'x tiempo real':>14}")
+    for block_duration in (0.02, 0.5, 10.0):
+        elapsed, _ = bench_resampler(audio, args.source_rate, args.target_rate, block_duration)
+        rate = input_samples / elapsed
+        print(f"{'polifásico':<22} {block_duration * 1000:>6.0f}ms {rate:>24,.0f} {rate / args.source_rate:>13,.0f}x")
+
+    if args.source_rate == 48000 and args.target_rate in (16000, 24000, 48000):
+        factor = 48000 // args.target_rate
+        for block_duration in (0.02, 0.5, 10.0):
+            elapsed, _ = bench_average(audio, block_duration, factor)
+            rate = input_samples / elapsed
+            print(f"{'promedio (sin filtro)':<22} {block_duration * 1000:>6.0f}ms {rate:>24,.0f} "
+                  f"{rate / args.source_rate:>13,.0f}x")
+
+
+if __name__ == '__main__':
+    main()
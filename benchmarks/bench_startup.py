@@ -0,0 +1,117 @@
+"""
+Benchmark del arranque del bot
+
+Lanza varias veces un intérprete nuevo que importa main y ejecuta
+main.main() hasta el momento en que llamaría a bot.start (la conexión a
+Discord y el servidor HTTP se sustituyen por funciones vacías, y los
+directorios se redirigen a uno temporal). Para cada arranque mide:
+
+- proceso: desde que se lanza el intérprete hasta bot.start (lo que tarda
+  un reinicio o un proceso de shard en volver a conectarse)
+- import: tiempo de "import main"
+- hasta bot.start: desde que empieza main.main() hasta bot.start
+
+y comprueba si numpy o speech_recognition llegaron a cargarse. Con --eager
+se importan antes, para comparar con la carga anticipada.
+
+Uso:
+    python benchmarks/bench_startup.py --runs 20
+    python benchmarks/bench_startup.py --runs 20 --eager
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en cada intérprete nuevo; imprime una línea JSON con las medidas
+PROBE = r"""
+import sys, time, json, asyncio
+started = time.perf_counter()
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+if {eager!r}:
+    import numpy, speech_recognition
+import config
+from fakes import isolate_config
+isolate_config(config, {workdir!r})
+import main
+imported = time.perf_counter()
+
+reached = {{}}
+
+async def fake_start(token):
+    reached['start'] = time.perf_counter()
+
+async def fake_webserver():
+    pass
+
+main.bot.start = fake_start
+main.start_webserver = fake_webserver
+main_started = time.perf_counter()
+asyncio.run(main.main())
+
+from utils.lazy import is_loaded
+print(json.dumps({{
+    'import': imported - started,
+    'main': reached['start'] - main_started,
+    'numpy': is_loaded('numpy'),
+    'speech_recognition': is_loaded('speech_recognition'),
+    'ready': reached['start'],
+}}))
+"""
+
+
+def run_once(workdir, eager):
+    probe = PROBE.format(root=ROOT, benchmarks=os.path.join(ROOT, 'benchmarks'), workdir=workdir, eager=eager)
+    env = dict(os.environ, DISCORD_TOKEN='benchmark', SHARD_PROCESSES='1', SHARD_COUNT='1')
+    env.pop('SHARD_IDS', None)
+    launched = time.perf_counter()
+    # perf_counter usa el mismo reloj monotónico en ambos procesos (Linux)
+    result = subprocess.run([sys.executable, '-c', probe], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    measures = json.loads(result.stdout.strip().splitlines()[-1])
+    measures['process'] = measures.pop('ready') - launched
+    return measures
+
+
+def summarize(values):
+    values = sorted(values)
+    p90 = values[min(len(values) - 1, int(len(values) * 0.9))]
+    return f"mediana {statistics.median(values) * 1000:7.1f} ms, p90 {p90 * 1000:7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Arranques medidos')
+    parser.add_argument('--eager', action='store_true', help='Importar numpy y speech_recognition antes que main')
+    parser.add_argument('--json', action='store_true', help='Imprimir el resultado en JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bibop-startup-')
+    try:
+        # Un arranque previo sin medir para calentar la caché de disco y los .pyc
+        run_once(workdir, args.eager)
+        runs = [run_once(workdir, args.eager) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+
+    print(f"Arranques: {args.runs}{' (carga anticipada)' if args.eager else ''}")
+    print(f"  proceso hasta bot.start: {summarize([run['process'] for run in runs])}")
+    print(f"  import main:             {summarize([run['import'] for run in runs])}")
+    print(f"  main() hasta bot.start:  {summarize([run['main'] for run in runs])}")
+    print(f"  numpy cargado: {'sí' if runs[-1]['numpy'] else 'no'}, "
+          f"speech_recognition cargado: {'sí' if runs[-1]['speech_recognition'] else 'no'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Objetos falsos de Discord para los benchmarks: cliente de voz, usuarios y
+paquetes con la misma forma que los que entrega discord-ext-voice-recv
+"""
+
+FRAME_SAMPLES = 960  # 20 ms a 48 kHz
+
+
+class FakeVoiceClient:
+    """Cliente de voz sin conexión: guarda el sink para que el benchmark lo alimente"""
+
+    def __init__(self, channel=None):
+        self.channel = channel
+        self.sink = None
+
+    def listen(self, sink):
+        self.sink = sink
+
+    def stop_listening(self):
+        self.sink = None
+
+    def is_connected(self):
+        return True
+
+    async def disconnect(self):
+        self.sink = None
+
+
+class FakeUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+
+
+class FakePacket:
+    __slots__ = ('ssrc', 'timestamp')
+
+    def __init__(self, ssrc, timestamp):
+        self.ssrc = ssrc
+        self.timestamp = timestamp
+
+
+class FakeVoiceData:
+    __slots__ = ('pcm', 'opus', 'packet')
+
+    def __init__(self, pcm, packet, opus=None):
+        self.pcm = pcm
+        self.packet = packet
+        self.opus = opus
+
+
+def make_frames(speakers, seed=0):
+    """Un frame PCM distinto (tono con ruido) por hablante"""
+    # Importación local: bench_startup usa isolate_config sin cargar numpy
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(FRAME_SAMPLES) / 48000
+    frames = []
+    for i in range(speakers):
+        tone = np.sin(2 * np.pi * (180 + 40 * i) * t) * 6000 + rng.normal(0, 300, FRAME_SAMPLES)
+        stereo = np.repeat(tone[:, None], 2, axis=1).astype('<i2')
+        frames.append(stereo.tobytes())
+    return frames
+
+
+def isolate_config(config, workdir):
+    """Redirige todos los directorios y bases de datos del bot a un directorio temporal"""
+    import os
+    config.RECORDINGS_DIR = os.path.join(workdir, 'recordings')
+    config.IN_PROGRESS_DIR = os.path.join(config.RECORDINGS_DIR, '.en_curso')
+    config.TRACKS_DIR = os.path.join(workdir, 'tracks')
+    config.TRANSCRIPTIONS_DIR = os.path.join(workdir, 'transcriptions')
+    config.DATA_DIR = os.path.join(workdir, 'data')
+    config.DECODE_CACHE_DIR = os.path.join(config.DATA_DIR, 'decodificado')
+    config.CATALOG_DB = os.path.join(config.DATA_DIR, 'catalog.db')
+    config.JOBS_DB = os.path.join(config.DATA_DIR, 'jobs.db')
+    config.CACHE_DB = os.path.join(config.DATA_DIR, 'transcription_cache.db')
+    config.SEARCH_DB = os.path.join(config.DATA_DIR, 'search.db')
+    config.SHARED_STATE_DB = os.path.join(config.DATA_DIR, 'shared_state.db')
+    config.CLIPS_DIR = os.path.join(config.DATA_DIR, 'recortes')
+    config.SUMMARIES_DIR = os.path.join(config.DATA_DIR, 'resumenes')
+    config.ARCHIVE_DIR = os.path.join(workdir, 'archivo')
+    config.ARCHIVE_TRACKS_DIR = os.path.join(config.ARCHIVE_DIR, '.pistas')
+    for path in (config.RECORDINGS_DIR, config.TRACKS_DIR, config.TRANSCRIPTIONS_DIR, config.DATA_DIR):
+        os.makedirs(path, exist_ok=True)
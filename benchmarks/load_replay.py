@@ -0,0 +1,250 @@
+"""
+Banco de carga del flujo completo grabar -> guardar -> transcribir
+
+Simula N servidores con varios hablantes cada uno, sin Discord ni red: un
+hilo por servidor hace de hilo de voz y entrega paquetes de 20 ms al
+AudioSink de un AudioRecorder conectado a un cliente de voz falso. Al
+terminar, cada grabación se guarda (finalize_recording o save_recording) y se
+transcribe con el motor 'mock'.
+
+Informa del rendimiento, las latencias p50/p99 de cada etapa, el pico de
+memoria (RSS) y el retraso del bucle de eventos.
+
+Uso:
+    python benchmarks/load_replay.py --guilds 8 --speakers 4 --seconds 60 --speed 10
+    python benchmarks/load_replay.py --input grabacion.wav --guilds 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import config
+from fakes import FRAME_SAMPLES, FakePacket, FakeUser, FakeVoiceClient, FakeVoiceData, isolate_config, make_frames
+
+FRAME_BYTES = FRAME_SAMPLES * 2 * 2
+
+
+def speech_pattern(rounds, rng):
+    """Turnos de habla y silencio de un hablante: True en las rondas de 20 ms en que habla"""
+    talking = np.zeros(rounds, dtype=bool)
+    position = int(rng.integers(0, 100))
+    while position < rounds:
+        length = int(rng.integers(100, 300))  # 2-6 s hablando
+        talking[position:position + length] = True
+        position += length + int(rng.integers(50, 150))  # 1-3 s de silencio
+    return talking
+
+
+def load_input_frames(path):
+    """Frames de 20 ms de un WAV real de 48 kHz estéreo, para reproducirlos en bucle"""
+    with wave.open(path, 'rb') as wav_file:
+        if wav_file.getframerate() != 48000 or wav_file.getnchannels() != 2 or wav_file.getsampwidth() != 2:
+            raise SystemExit("El WAV de entrada debe ser PCM de 16 bits, 48 kHz, estéreo")
+        data = wav_file.readframes(wav_file.getnframes())
+    return [data[i:i + FRAME_BYTES] for i in range(0, len(data) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+
+def feed_guild(recorder, sink_owner, speakers, seconds, speed, frames, seed, counters):
+    """Hilo de voz simulado de un servidor"""
+    rng = np.random.default_rng(seed)
+    rounds = int(seconds * 50)
+    patterns = [speech_pattern(rounds, rng) for _ in range(speakers)]
+    users = [FakeUser(seed * 100 + i) for i in range(speakers)]
+    started = time.perf_counter()
+    sent = 0
+
+    for n in range(rounds):
+        sink = sink_owner.sink
+        if sink is None:
+            break
+        for i in range(speakers):
+            if patterns[i][n]:
+                frame = frames[i][(n + i * 997) % len(frames[i])]
+                sink.write(users[i], FakeVoiceData(frame, FakePacket(seed * 100 + i, n * FRAME_SAMPLES)))
+                sent += 1
+        # Ritmo de llegada: 20 ms de audio por ronda, acelerado por speed
+        delay = started + (n + 1) * 0.02 / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    counters['packets'] += sent
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+async def sample_loop_lag(samples, stop, interval=0.05):
+    """Mide el retraso del bucle de eventos mientras dura la prueba"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(loop.time() - expected, 0.0))
+
+
+async def run_guild(index, args, frames, results, counters):
+    from utils.audio_processing import AudioRecorder, transcribe_audio
+    from utils.executors import get_executor
+    from utils.file_management import build_session_dir, finalize_recording, save_recording
+
+    executor = get_executor()
+    guild_id, channel_id = 1000 + index, 2000 + index
+    vc = FakeVoiceClient()
+    session_dir = None if args.memory else build_session_dir(guild_id, channel_id)
+    recorder = AudioRecorder(vc, session_dir=session_dir, metadata={'guild_id': guild_id, 'channel_id': channel_id})
+
+    # Reloj del mezclador acelerado igual que la llegada de paquetes
+    base = time.monotonic()
+    recorder.mixer.clock = lambda: base + (time.monotonic() - base) * args.speed
+    recorder.start()
+
+    feeder = threading.Thread(
+        target=feed_guild,
+        args=(recorder, vc, args.speakers, args.seconds, args.speed, frames, index + 1, counters),
+        name=f'voz-{index}', daemon=True
+    )
+    feeder.start()
+    await asyncio.to_thread(feeder.join)
+
+    stop_started = time.perf_counter()
+    audio_data = await executor.run_io(recorder.stop, guild_id=guild_id)
+    name = f"carga_{index}"
+    if recorder.streaming:
+        file_path = await executor.run_io(
+            finalize_recording, audio_data, name,
+            timeline=recorder.timeline_index() if recorder.tracks else None)
+    else:
+        file_path = await executor.run_io(save_recording, audio_data, name)
+    saved = time.perf_counter()
+
+    await transcribe_audio(file_path, api='mock', guild_id=guild_id)
+    transcribed = time.perf_counter()
+
+    results.append({
+        'guardar': saved - stop_started,
+        'transcribir': transcribed - saved,
+        'total': transcribed - stop_started,
+        'descartados': recorder.dropped_bytes,
+    })
+
+
+async def main_async(args):
+    from utils.executors import get_executor
+
+    if args.input:
+        recorded = load_input_frames(args.input)
+        frames = [recorded] * args.speakers
+    else:
+        frames = [[frame] for frame in make_frames(args.speakers)]
+
+    counters = {'packets': 0}
+    results = []
+    lag_samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_loop_lag(lag_samples, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_guild(i, args, frames, results, counters) for i in range(args.guilds)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await sampler
+    get_executor().shutdown()
+
+    audio_seconds = args.guilds * args.seconds
+    own_rss, children_rss = peak_rss_mb()
+    report = {
+        'servidores': args.guilds,
+        'hablantes_por_servidor': args.speakers,
+        'segundos_de_audio': audio_seconds,
+        'tiempo_total_s': elapsed,
+        'paquetes': counters['packets'],
+        'paquetes_por_segundo': counters['packets'] / elapsed,
+        'audio_procesado_x_tiempo_real': audio_seconds / elapsed,
+        'latencias_s': {
+            stage: {'p50': percentile([r[stage] for r in results], 50),
+                    'p99': percentile([r[stage] for r in results], 99)}
+            for stage in ('guardar', 'transcribir', 'total')
+        },
+        'rss_pico_mb': own_rss,
+        'rss_pico_procesos_hijos_mb': children_rss,
+        'retraso_bucle_ms': {
+            'p50': percentile(lag_samples, 50) * 1000,
+            'p99': percentile(lag_samples, 99) * 1000,
+            'max': max(lag_samples, default=0.0) * 1000,
+        },
+        'bytes_descartados': sum(r['descartados'] for r in results),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"Servidores: {report['servidores']}, hablantes por servidor: {report['hablantes_por_servidor']}, "
+          f"audio: {report['segundos_de_audio']:.0f} s en {report['tiempo_total_s']:.1f} s")
+    print(f"  paquetes:                 {report['paquetes']} ({report['paquetes_por_segundo']:,.0f}/s)")
+    print(f"  rendimiento:              {report['audio_procesado_x_tiempo_real']:.1f}x tiempo real")
+    for stage, values in report['latencias_s'].items():
+        print(f"  latencia {stage + ':':<16} p50 {values['p50'] * 1000:8.0f} ms   p99 {values['p99'] * 1000:8.0f} ms")
+    print(f"  RSS pico:                 {report['rss_pico_mb']:.0f} MB "
+          f"(procesos hijos: {report['rss_pico_procesos_hijos_mb']:.0f} MB)")
+    lag = report['retraso_bucle_ms']
+    print(f"  retraso del bucle:        p50 {lag['p50']:.1f} ms   p99 {lag['p99']:.1f} ms   máx {lag['max']:.1f} ms")
+    print(f"  bytes descartados:        {report['bytes_descartados']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=4, help='Servidores simulados')
+    parser.add_argument('--speakers', type=int, default=3, help='Hablantes por servidor')
+    parser.add_argument('--seconds', type=float, default=30, help='Segundos de audio por servidor')
+    parser.add_argument('--speed', type=float, default=10, help='Aceleración respecto al tiempo real')
+    parser.add_argument('--input', help='WAV de 48 kHz estéreo a reproducir en lugar de audio sintético')
+    parser.add_argument('--memory', action='store_true', help='Grabar en memoria y guardar con save_recording')
+    parser.add_argument('--no-tracks', action='store_true', help='Sin pistas por hablante')
+    parser.add_argument('--mock-latency', type=float, default=0.05, help='Latencia simulada del motor por fragmento')
+    parser.add_argument('--cache', action='store_true', help='Usar la caché de transcripciones')
+    parser.add_argument('--json', action='store_true', help='Imprimir el informe en JSON')
+    parser.add_argument('--keep', action='store_true', help='Conservar el directorio de trabajo')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load_replay_')
+    isolate_config(config, workdir)
+    config.TRANSCRIPTION_API = 'mock'
+    config.MOCK_BACKEND_LATENCY = args.mock_latency
+    config.TRANSCRIPTION_CACHE = args.cache
+    config.SEPARATE_TRACKS = not args.no_tracks
+
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        if args.keep:
+            print(f"Directorio de trabajo: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,40 +13,187 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Prefijo para comandos
 COMMAND_PREFIX = '!'
 
+# Este módulo solo declara valores: importarlo no crea directorios ni archivos.
+# El bot crea los directorios al arrancar (ver utils.file_management.ensure_directories)
+
 # Directorio para almacenar grabaciones
 RECORDINGS_DIR = os.path.join(BASE_DIR, 'recordings')
-if not os.path.exists(RECORDINGS_DIR):
-    os.makedirs(RECORDINGS_DIR)
 
 # Directorio para almacenar transcripciones
 TRANSCRIPTIONS_DIR = os.path.join(BASE_DIR, 'transcriptions')
-if not os.path.exists(TRANSCRIPTIONS_DIR):
-    os.makedirs(TRANSCRIPTIONS_DIR)
+
+# Directorio para las grabaciones en curso (se escriben directamente a disco)
+IN_PROGRESS_DIR = os.path.join(RECORDINGS_DIR, '.en_curso')
+
+# Directorio para las pistas separadas por hablante ({TRACKS_DIR}/{grabación}/{usuario}.ogg)
+TRACKS_DIR = os.path.join(BASE_DIR, 'tracks')
+
+# Directorio de archivo: grabaciones antiguas recodificadas y fuera del directorio principal
+# (puede estar en otro volumen). Las pistas archivadas van en su subdirectorio .pistas
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(BASE_DIR, 'archivo'))
+ARCHIVE_TRACKS_DIR = os.path.join(ARCHIVE_DIR, '.pistas')
+
+# Directorio temporal donde se decodifican las grabaciones comprimidas para transcribirlas
+DECODE_CACHE_DIR = os.path.join(BASE_DIR, 'data', 'decodificado')
 
 # Configuración de audio
-AUDIO_FORMAT = 'wav'
-AUDIO_BITRATE = '128k'
+# Formato de almacenamiento: 'ogg' (Opus), 'flac' o 'wav'. Los formatos comprimidos
+# necesitan ffmpeg; si no está instalado se guarda en WAV
+AUDIO_FORMAT = os.getenv('AUDIO_FORMAT', 'ogg')
+AUDIO_BITRATE = '128k'  # Tasa de bits de Opus al codificar la mezcla
 SAMPLE_RATE = 48000
 CHANNELS = 2
 
-# Tiempo máximo de grabación (en segundos)
+# Grabación en streaming: los paquetes se escriben a disco según llegan
+# en lugar de acumularse en memoria hasta detener la grabación
+STREAMING_RECORDING = True
+WRITE_BUFFER_SIZE = 256 * 1024  # Bytes acumulados que despiertan al hilo escritor
+WRITER_QUEUE_SIZE = 16  # Bloques que caben en el buffer circular de cada grabación (preasignado)
+SEGMENT_DURATION = 60  # Segundos por segmento; una caída pierde como mucho el buffer pendiente
+
+# Pistas por hablante: además de la mezcla, cada usuario se graba en su propio WAV
+SEPARATE_TRACKS = True
+TRACK_BUFFER_SIZE = 64 * 1024  # Buffer de escritura por hablante
+TRACK_GAP_MS = 100  # Silencio mínimo entre paquetes para abrir una nueva entrada en la línea de tiempo
+
+# Mezclador: coloca los paquetes por timestamp y mezcla por bloques
+MIX_BLOCK_DURATION = 0.5  # Segundos de audio por bloque mezclado
+MIX_LATENCY = 0.3  # Margen para paquetes con retraso antes de mezclar un bloque
+
+# Límites de grabaciones simultáneas y control de admisión
+RECORDING_MAX_SESSIONS = 20  # Grabaciones simultáneas en total; por encima se rechazan
+RECORDING_MAX_PER_GUILD = 2  # Grabaciones simultáneas por servidor
+RECORDING_DOWNGRADE_AFTER = 10  # A partir de estas sesiones las nuevas se graban en formato reducido
+RECORDING_BUFFER_BUDGET = 64 * 1024 * 1024  # Bytes pendientes en memoria a partir de los que se reduce el formato
+RECORDING_DOWNGRADE_SAMPLE_RATE = 16000
+RECORDING_DOWNGRADE_CHANNELS = 1
+
+# Ejecución del trabajo bloqueante fuera del bucle de eventos
+IO_WORKERS = 8  # Hilos para disco y peticiones de reconocimiento
+CPU_WORKERS = max((os.cpu_count() or 2) - 1, 1)  # Procesos para decodificación y VAD
+GUILD_MAX_JOBS = 2  # Trabajos simultáneos por servidor, para repartir los pools
+LOOP_LAG_WARNING_MS = 50  # Retraso del bucle de eventos a partir del cual se avisa
+
+# Despliegue por shards: varios procesos, cada uno con un grupo de shards de Discord
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))  # Shards en total (1 = sin shards)
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', '1'))  # Procesos entre los que se reparten los shards
+# El supervisor asigna a cada proceso sus shards y su índice; no se configuran a mano
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS', '').split(',') if shard] or None
+SHARD_PROCESS_INDEX = int(os.getenv('SHARD_PROCESS_INDEX', '0'))
+SHARED_STATE_INTERVAL = 10  # Segundos entre publicaciones del estado de cada proceso
+HTTP_PORT = int(os.getenv('HTTP_PORT', '5000'))  # Cada proceso escucha en HTTP_PORT + su índice
+
+# Tiempo máximo de grabación (en segundos); al alcanzarlo se pasa a un archivo nuevo
 MAX_RECORDING_TIME = 3600*3  # 3 horas
+AUTO_SPLIT_RECORDINGS = True  # Si es False, la grabación se detiene en lugar de dividirse
+
+# Parada automática de grabaciones olvidadas
+AUTO_STOP_SILENCE = 10 * 60  # Segundos sin voz tras los que se guarda y se detiene la grabación
+AUTO_STOP_EMPTY_GRACE = 30  # Segundos con el canal vacío antes de detenerla
+IDLE_MIN_DB = -50  # Energía mínima (dBFS) de la mezcla para considerar que alguien habla
+RECORDING_CHECK_INTERVAL = 15  # Segundos entre comprobaciones
+
+# Datos internos del bot (bases de datos SQLite)
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+# Catálogo de grabaciones (sustituye a recorrer RECORDINGS_DIR en cada búsqueda)
+CATALOG_DB = os.path.join(DATA_DIR, 'catalog.db')
+
+def _optional_int(name):
+    """Entero de una variable de entorno, o None si no está definida o está vacía"""
+    value = os.getenv(name, '')
+    return int(value) if value else None
+
+# Servicio de retención: borra y archiva grabaciones en segundo plano. Está desactivado
+# por defecto porque sus acciones no se pueden deshacer; para usarlo hay que activarlo
+# (RETENTION_ENABLED=1) y elegir al menos una política, por ejemplo:
+#   RETENTION_ENABLED=1 RETENTION_ARCHIVE_AFTER_DAYS=7 ARCHIVE_FORMAT=ogg
+# La vigilancia del espacio en disco (DISK_*) funciona aunque esté desactivado.
+RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', '0') == '1'
+RETENTION_INTERVAL = 600  # Segundos entre pasadas completas
+RETENTION_BATCH_SIZE = 10  # Archivos que se borran o archivan por lote
+RETENTION_BATCH_PAUSE = 5  # Segundos entre lotes mientras quede trabajo pendiente
+RETENTION_DELETE_AFTER_DAYS = _optional_int('RETENTION_DELETE_AFTER_DAYS')  # Borrar las más antiguas (None = nunca)
+RETENTION_ARCHIVE_AFTER_DAYS = _optional_int('RETENTION_ARCHIVE_AFTER_DAYS')  # Archivar las más antiguas (None = nunca)
+RETENTION_GUILD_QUOTA_MB = _optional_int('RETENTION_GUILD_QUOTA_MB')  # Espacio máximo por servidor (None = sin cuota)
+# Políticas por servidor que sustituyen a las generales, por ejemplo:
+# {123456789: {'quota_mb': 2048, 'delete_after_days': 30, 'archive_after_days': 2}}
+RETENTION_GUILD_POLICIES = {}
+# Formato de las grabaciones WAV archivadas (necesita ffmpeg; sin él se mueven tal cual).
+# Por defecto FLAC, sin pérdida; 'ogg' (Opus) ocupa mucho menos pero no se puede revertir
+ARCHIVE_FORMAT = os.getenv('ARCHIVE_FORMAT', 'flac')
+ARCHIVE_BITRATE = os.getenv('ARCHIVE_BITRATE', '48k')  # Tasa de bits de Opus si ARCHIVE_FORMAT es 'ogg'
+
+# Umbrales de ocupación del disco de las grabaciones: por encima del alto no se
+# inician grabaciones automáticas hasta bajar del bajo
+DISK_HIGH_WATERMARK = 0.90
+DISK_LOW_WATERMARK = 0.85
+DISK_CHECK_INTERVAL = 30  # Segundos entre comprobaciones del espacio libre
+
+# Fragmentos de grabaciones (!clip): se escriben aquí y se borran tras enviarlos
+CLIPS_DIR = os.path.join(DATA_DIR, 'recortes')
+CLIP_MAX_SECONDS = 60  # Duración máxima de un fragmento
+
+# Resúmenes de las grabaciones (duración, envolvente de volumen, proporción de voz
+# y tiempo de habla por hablante) calculados al grabar, uno por grabación
+SUMMARIES_DIR = os.path.join(DATA_DIR, 'resumenes')
+
+# Estado compartido entre procesos (grabaciones activas y latidos)
+SHARED_STATE_DB = os.path.join(DATA_DIR, 'shared_state.db')
+
+# Índice de búsqueda de texto completo de las transcripciones (!buscar)
+SEARCH_DB = os.path.join(DATA_DIR, 'search.db')
+SEARCH_RESULTS = 10  # Resultados por búsqueda
+
+# Cola persistente de transcripciones
+JOBS_DB = os.path.join(DATA_DIR, 'jobs.db')
+TRANSCRIPTION_WORKERS = 2  # Trabajos de transcripción simultáneos en total
+TRANSCRIPTION_GUILD_LIMIT = 1  # Trabajos de transcripción simultáneos por servidor
+PROGRESS_UPDATE_INTERVAL = 5  # Segundos mínimos entre ediciones del mensaje de progreso
+
+# Transcripción por fragmentos: se corta en los silencios (VAD por energía)
+# y los fragmentos se reconocen en paralelo
+TRANSCRIPTION_MIN_CHUNK = 5  # Segundos mínimos por fragmento antes de buscar un silencio
+TRANSCRIPTION_MAX_CHUNK = 30  # Segundos máximos; se fuerza el corte si nadie calla
+TRANSCRIPTION_PARALLELISM = 4  # Fragmentos reconocidos a la vez por trabajo
+VAD_FRAME_MS = 30  # Duración de cada trama de análisis
+VAD_MIN_SILENCE_MS = 500  # Silencio mínimo para cortar
+VAD_MIN_DB = -50  # Energía mínima (dBFS) para considerar una trama como voz
+RECOGNITION_SAMPLE_RATE = 16000  # El reconocedor recibe mono a esta frecuencia (el archivo no cambia)
+
+# Transcripción en directo durante la grabación (!grabar directo) con subtítulos en el canal
+LIVE_TRANSCRIPTION = False  # Activarla en todas las grabaciones, no solo con !grabar directo
+LIVE_MIN_CHUNK = 2  # Segundos mínimos por fragmento: cortes más frecuentes que en diferido
+LIVE_MAX_CHUNK = 15  # Segundos máximos por fragmento
+LIVE_QUEUE_SIZE = 8  # Fragmentos en espera; si se llena, se transcriben al terminar
+LIVE_WORKERS = 1  # Fragmentos reconocidos a la vez por grabación
+LIVE_CAPTION_INTERVAL = 3  # Segundos mínimos entre ediciones del mensaje de subtítulos
+LIVE_CAPTION_LINES = 10  # Frases que se muestran en los subtítulos
+
+# Motor de transcripción (ver utils/transcription_backends.py):
+# - speech_recognition: API web de Google
+# - google: Google Cloud Speech-to-Text (requiere credenciales)
+# - sphinx: PocketSphinx, local y sin red
+# - mock: determinista, para pruebas de carga
+TRANSCRIPTION_API = os.getenv('TRANSCRIPTION_API', 'speech_recognition')
+TRANSCRIPTION_LANGUAGE = 'en-US'  # Código de idioma del reconocedor, p. ej. 'es-ES'
+MOCK_BACKEND_LATENCY = 0.0  # Segundos de latencia simulada por fragmento en el motor mock
+
+# Envío de textos largos a Discord (transcripciones, listados)
+OUTPUT_CHANNEL_RATE = 5  # Mensajes por canal cada OUTPUT_CHANNEL_PER segundos
+OUTPUT_CHANNEL_PER = 5.0
+OUTPUT_GLOBAL_RATE = 40  # Mensajes por segundo en total
+OUTPUT_PAGE_SIZE = 3800  # Caracteres por página de embed
+OUTPUT_MAX_PAGES = 25  # Por encima se envía un adjunto comprimido
 
-# API de transcripción (google o speech_recognition)
-TRANSCRIPTION_API = 'speech_recognition'
+# Caché de transcripciones por huella del audio (archivo completo y fragmento)
+TRANSCRIPTION_CACHE = True
+CACHE_DB = os.path.join(DATA_DIR, 'transcription_cache.db')
 
-# Configuración para API de Google Cloud Speech-to-Text
+# Configuración para API de Google Cloud Speech-to-Text: ruta al archivo de
+# credenciales o su contenido JSON (se escribe a un archivo temporal la primera
+# vez que se usa el motor; ver utils.transcription_backends.google_credentials_file)
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-if GOOGLE_APPLICATION_CREDENTIALS:
-    # Crear archivo temporal para las credenciales
-    import json
-    import tempfile
-    
-    credentials_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
-    with open(credentials_file.name, 'w') as f:
-        f.write(GOOGLE_APPLICATION_CREDENTIALS)
-    
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_file.name
-else:
-    print("Advertencia: GOOGLE_APPLICATION_CREDENTIALS no está configurado, usando reconocimiento de voz alternativo")
+if not GOOGLE_APPLICATION_CREDENTIALS and TRANSCRIPTION_API == 'google':
+    # Sin credenciales se usa el reconocimiento de voz alternativo
     TRANSCRIPTION_API = 'speech_recognition'
\ No newline at end of file
@@ -2,11 +2,21 @@ import discord
 from discord.ext import commands
 import asyncio
 import logging
+import os
 import config
 from aiohttp import web
 from modules.recording import setup as setup_recording
 from modules.transcription import setup as setup_transcription
 from modules.help import setup as setup_help
+from utils.file_management import ensure_directories, recover_sessions, reconcile_catalog
+from utils.search_index import reconcile_search_index
+from utils import executors, metrics
+from utils.executors import get_executor, monitor_loop_lag
+from utils.recording_manager import AdmissionError, get_recording_manager
+from utils.retention import auto_recording_paused, get_retention, retention_loop
+from utils.sharding import is_primary, owns_guild, run_supervisor
+from utils.shared_state import get_shared_state
+from utils.transcription_backends import check_backend
 
 # Configurar logging
 logging.basicConfig(
@@ -20,8 +30,12 @@ intents.message_content = True
 intents.voice_states = True
 intents.guild_messages = True
 
-# Crear el bot
-bot = commands.Bot(command_prefix=config.COMMAND_PREFIX, intents=intents)
+# Crear el bot (con varios shards, este proceso solo se conecta a los suyos)
+if config.SHARD_COUNT > 1:
+    bot = commands.AutoShardedBot(command_prefix=config.COMMAND_PREFIX, intents=intents,
+                                  shard_count=config.SHARD_COUNT, shard_ids=config.SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix=config.COMMAND_PREFIX, intents=intents)
 
 # Variable para almacenar los canales activos
 active_voice_channels = {}
@@ -47,25 +61,35 @@ async def on_voice_state_update(member, before, after):
         voice_client = discord.utils.get(bot.voice_clients, guild=channel.guild)
 
         if voice_client is None:
-            try:
-                voice_client = await channel.connect(timeout=20.0, reconnect=True)
-                logger.info(f'Bot conectado al canal {channel.name} en {channel.guild.name}')
+            # Con el disco casi lleno no se inician grabaciones automáticas
+            if auto_recording_paused():
+                logger.warning(f'No se inicia la grabación automática en {channel.name}: disco casi lleno')
+                return
 
-                recording_cog = bot.get_cog('RecordingCommands')
-                if recording_cog:
-                    guild_id = channel.guild.id
-                    channel_id = channel.id
+            recording_cog = bot.get_cog('RecordingCommands')
+            if recording_cog is None:
+                return
 
-                    if guild_id in recording_cog.active_recordings and channel_id in recording_cog.active_recordings[guild_id]:
-                        logger.info(f"Ya hay una grabación activa en el canal {channel.name}")
-                        return
+            # No conectarse si el gestor de grabaciones no va a admitir otra sesión; la plaza
+            # queda reservada mientras se conecta y se libera si la grabación no llega a empezar
+            manager = get_recording_manager()
+            try:
+                reservation = manager.admit(channel.guild.id, channel.id, config.SAMPLE_RATE, config.CHANNELS)
+            except AdmissionError as e:
+                logger.warning(f'No se inicia la grabación automática en {channel.name}: {e}')
+                return
+
+            try:
+                with reservation:
+                    voice_client = await channel.connect(timeout=20.0, reconnect=True)
+                    logger.info(f'Bot conectado al canal {channel.name} en {channel.guild.name}')
 
                     system_channel = channel.guild.system_channel or channel.guild.text_channels[0]
                     ctx = await bot.get_context(await system_channel.send(""))
 
                     ctx.voice_client = voice_client
                     ctx.channel = channel
-                    await recording_cog.start_recording(ctx)
+                    await recording_cog.record_channel(ctx, channel, reservation)
             except discord.ClientException as e:
                 logger.error(f'Error de cliente al conectar al canal de voz: {e}')
             except asyncio.TimeoutError:
@@ -76,25 +100,169 @@ async def on_voice_state_update(member, before, after):
 async def health_check(request):
     return web.Response(text="Bot is running!")
 
+def register_gauges():
+    """Métricas instantáneas que se calculan al consultar /metrics"""
+    manager = get_recording_manager()
+
+    def per_guild(field):
+        def collect():
+            values = {}
+            for stat in manager.stats():
+                labels = (str(stat['guild_id']),)
+                values[labels] = values.get(labels, 0) + stat[field]
+            return values
+        return collect
+
+    def writer_queue_depth():
+        values = {}
+        for session in manager.sessions():
+            labels = (str(session.guild_id),)
+            values[labels] = values.get(labels, 0) + session.recorder.queue_depth
+        return values
+
+    def transcription_queue():
+        cog = bot.get_cog('TranscriptionCommands')
+        if cog is None:
+            return {}
+        return {(status,): count for status, count in cog.queue.count_by_status().items()}
+
+    metrics.registry.gauge(
+        'bibop_active_recordings', 'Grabaciones activas', func=lambda: len(manager))
+    metrics.registry.gauge(
+        'bibop_voice_packets_per_second', 'Paquetes de voz por segundo', ('guild',),
+        func=per_guild('packets_per_second'))
+    metrics.registry.gauge(
+        'bibop_recorder_buffered_bytes', 'Bytes de audio en memoria pendientes de mezclar o escribir', ('guild',),
+        func=per_guild('buffered_bytes'))
+    metrics.registry.gauge(
+        'bibop_writer_queue_depth', 'Bloques en cola de los hilos escritores', ('guild',),
+        func=writer_queue_depth)
+    metrics.registry.gauge(
+        'bibop_recordings_rejected', 'Grabaciones rechazadas por el control de admisión desde el arranque',
+        func=lambda: manager.rejected)
+    metrics.registry.gauge(
+        'bibop_event_loop_lag_seconds', 'Último retraso medido del bucle de eventos',
+        func=lambda: executors.loop_lag)
+    metrics.registry.gauge(
+        'bibop_disk_used_ratio', 'Fracción ocupada del disco de las grabaciones',
+        func=lambda: get_retention().watermark.ratio)
+    metrics.registry.gauge(
+        'bibop_transcription_queue_length', 'Trabajos de transcripción por estado', ('status',),
+        func=transcription_queue)
+
+async def metrics_endpoint(request):
+    # Consultar la cola y agregar los contadores puede tocar SQLite: fuera del bucle de eventos
+    body = await get_executor().run_io(metrics.registry.render)
+    return web.Response(body=body.encode('utf-8'), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
 async def start_webserver():
+    register_gauges()
     app = web.Application()
     app.router.add_get('/', health_check)
+    app.router.add_get('/metrics', metrics_endpoint)
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 5000)
+    # Cada proceso del despliegue por shards escucha en su propio puerto
+    port = config.HTTP_PORT + config.SHARD_PROCESS_INDEX
+    site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
-    logger.info("HTTP server started on port 5000")
+    logger.info(f"HTTP server started on port {port}")
+
+async def publish_shared_state():
+    """
+    Publica las grabaciones de este proceso en el estado compartido y
+    actualiza cuántas tienen los demás, para el límite global de admisión
+    """
+    state = get_shared_state()
+    manager = get_recording_manager()
+    executor = get_executor()
+    try:
+        while True:
+            try:
+                await executor.run_io(state.publish, manager.stats())
+                view = await executor.run_io(state.aggregate)
+                manager.remote_sessions = view['remote_sessions']
+            except Exception as e:
+                logger.error(f"Error al publicar el estado compartido: {e}")
+            await asyncio.sleep(config.SHARED_STATE_INTERVAL)
+    finally:
+        state.clear()
+
+def busy_recordings():
+    """Grabaciones con un trabajo de transcripción pendiente o en curso (la retención no las toca)"""
+    cog = bot.get_cog('TranscriptionCommands')
+    if cog is None:
+        return set()
+    return {job['recording_path'] for job in cog.queue.active_jobs()}
+
+async def startup_maintenance():
+    """
+    Tareas de arranque que recorren el disco; se ejecutan mientras el bot ya
+    se conecta, para no retrasar su vuelta a los canales de voz
+    """
+    executor = get_executor()
+    try:
+        # Recuperar grabaciones que quedaron a medias por una caída o reinicio
+        # (con shards, solo las de los servidores de este proceso)
+        recovered = await executor.run_io(recover_sessions, owns_guild)
+        if recovered:
+            logger.info(f"Se recuperaron {len(recovered)} grabaciones sin finalizar")
+
+        # El catálogo y el índice son comunes a todos los procesos: los sincroniza solo el primero
+        if is_primary():
+            # Sincronizar el catálogo con lo que haya en disco (archivos copiados o borrados a mano)
+            await executor.run_io(reconcile_catalog)
+            # Indexar las transcripciones que aún no estén en el índice de búsqueda
+            await executor.run_io(reconcile_search_index)
+    except Exception as e:
+        logger.error(f"Error en las tareas de arranque: {e}")
 
 async def main():
+    executor = get_executor()
+
+    try:
+        # Un motor sin sus dependencias fallaría en cada fragmento: mejor no arrancar
+        check_backend(config.TRANSCRIPTION_API)
+    except ValueError as e:
+        logger.error(f"Configuración de transcripción no válida: {e}")
+        raise SystemExit(1)
+
+    ensure_directories()
+    if not config.GOOGLE_APPLICATION_CREDENTIALS:
+        logger.warning("GOOGLE_APPLICATION_CREDENTIALS no está configurado, usando reconocimiento de voz alternativo")
+    maintenance = asyncio.create_task(startup_maintenance())
+
     await bot.load_extension('modules.recording')
     await bot.load_extension('modules.transcription')
     await bot.load_extension('modules.help')
+    await bot.load_extension('modules.search')
     
+    # Vigilar el retraso del bucle de eventos mientras corre el trabajo pesado
+    lag_monitor = asyncio.create_task(
+        monitor_loop_lag(warning_threshold=config.LOOP_LAG_WARNING_MS / 1000))
+    publisher = asyncio.create_task(publish_shared_state()) if config.SHARD_IDS is not None else None
+    # Todos los procesos vigilan el disco; solo el primero borra y archiva
+    retention = asyncio.create_task(
+        retention_loop(apply_policies=config.RETENTION_ENABLED and is_primary(), busy_paths=busy_recordings))
+
     # Start both the bot and web server
-    await asyncio.gather(
-        start_webserver(),
-        bot.start(config.DISCORD_TOKEN)
-    )
+    try:
+        await asyncio.gather(
+            start_webserver(),
+            bot.start(config.DISCORD_TOKEN)
+        )
+    finally:
+        lag_monitor.cancel()
+        maintenance.cancel()
+        retention.cancel()
+        if publisher is not None:
+            publisher.cancel()
+            await asyncio.gather(publisher, return_exceptions=True)
+        executor.shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if config.SHARD_PROCESSES > 1 and config.SHARD_IDS is None:
+        # Proceso supervisor: lanza un proceso del bot por cada grupo de shards
+        run_supervisor(os.path.abspath(__file__))
+    else:
+        asyncio.run(main())
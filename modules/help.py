@@ -23,9 +23,10 @@ class HelpCommands(commands.Cog):
             name="📹 Comandos de grabación",
             value=(
                 "**!grabar** - Comienza a grabar en el canal de voz actual\n"
+                "**!grabar directo** - Graba con subtítulos en vivo; la transcripción queda lista al detener\n"
                 "**!detener [nombre]** - Detiene la grabación actual y la guarda\n"
                 "**!salir** - Desconecta el bot del canal de voz\n"
-                "**!status** - Muestra el estado de las grabaciones activas"
+                "**!status** - Muestra el estado y el consumo (paquetes/s, memoria, escritura) de las grabaciones activas"
             ),
             inline=False
         )
@@ -34,8 +35,12 @@ class HelpCommands(commands.Cog):
         embed.add_field(
             name="📝 Comandos de transcripción",
             value=(
-                "**!transcribir [nombre]** - Transcribe una grabación a texto\n"
-                "**!listar** - Lista todas las grabaciones disponibles"
+                "**!transcribir [nombre] [prioridad]** - Encola la transcripción de una grabación (alta, normal, baja)\n"
+                "**!cola** - Muestra las transcripciones pendientes y en curso\n"
+                "**!cancelar** - Cancela las transcripciones pendientes y en curso del servidor\n"
+                "**!listar** - Lista las grabaciones del servidor con su duración y proporción de voz\n"
+                "**!clip [nombre] [inicio] [fin]** - Envía un fragmento de una grabación (p. ej. `!clip reunion 1:30 2:00`)\n"
+                "**!buscar [términos]** - Busca en las transcripciones del servidor y muestra cuándo se dijo"
             ),
             inline=False
         )
@@ -2,10 +2,18 @@ import discord
 from discord.ext import commands
 import asyncio
 import datetime
+import functools
 import os
+import time
 import logging
-from utils.audio_processing import AudioRecorder
-from utils.file_management import save_recording
+from utils.audio_processing import AudioRecorder, format_timestamp
+from utils.live_transcription import LiveCaptions, LiveTranscriber
+from utils.executors import get_executor
+from utils.output_dispatcher import get_dispatcher
+from utils.recording_manager import AdmissionError, get_recording_manager
+from utils.retention import auto_recording_paused
+from utils.shared_state import get_shared_state
+from utils.file_management import save_recording, finalize_recording, build_session_dir, discard_session
 import config
 
 logger = logging.getLogger('discord-recording-bot.recording')
@@ -13,10 +21,19 @@ logger = logging.getLogger('discord-recording-bot.recording')
 class RecordingCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active_recordings = {}  # {guild_id: {channel_id: recorder}}
+        # Grabaciones activas de todos los servidores, con límites de recursos
+        self.manager = get_recording_manager()
+        self.supervisor = None
 
-    @commands.command(name='grabar', help='Comienza a grabar audio en el canal de voz actual')
-    async def start_recording(self, ctx):
+    async def cog_load(self):
+        self.supervisor = asyncio.create_task(self._supervise())
+
+    async def cog_unload(self):
+        if self.supervisor is not None:
+            self.supervisor.cancel()
+
+    @commands.command(name='grabar', help='Comienza a grabar audio en el canal de voz actual ("directo" para subtítulos en vivo)')
+    async def start_recording(self, ctx, modo=None):
         # Verificar si el usuario está en un canal de voz
         if not ctx.author.voice and not hasattr(ctx, 'channel'):
             await ctx.send("Debes estar en un canal de voz para usar este comando.")
@@ -29,10 +46,40 @@ class RecordingCommands(commands.Cog):
         guild_id = ctx.guild.id
         channel_id = voice_channel.id
 
-        if guild_id in self.active_recordings and channel_id in self.active_recordings[guild_id]:
+        if self.manager.is_recording(guild_id, channel_id):
             await ctx.send("Ya estoy grabando en este canal. Usa `!detener [nombre_grabación]` para detener la grabación actual.")
             return
 
+        # Control de admisión: rechazar o reducir el formato si no quedan recursos
+        try:
+            reservation = self.manager.admit(guild_id, channel_id, config.SAMPLE_RATE, config.CHANNELS)
+        except AdmissionError as e:
+            await ctx.send(f"No se puede iniciar la grabación: {e}")
+            logger.warning(f'Grabación rechazada en el servidor {ctx.guild.name}: {e}')
+            return
+
+        await self.record_channel(ctx, voice_channel, reservation, modo)
+
+    async def record_channel(self, ctx, voice_channel, reservation, modo=None):
+        """
+        Se conecta a un canal de voz y empieza a grabarlo con una plaza ya admitida
+
+        La plaza se libera si la grabación no llega a registrarse.
+
+        Args:
+            ctx: Contexto del comando (o el creado para una grabación automática)
+            voice_channel: Canal de voz a grabar
+            reservation: Reservation concedida por RecordingManager.admit
+            modo: "directo" para transcribir en directo
+        """
+        with reservation:
+            await self._record_channel(ctx, voice_channel, reservation, modo)
+
+    async def _record_channel(self, ctx, voice_channel, reservation, modo):
+        guild_id = ctx.guild.id
+        channel_id = voice_channel.id
+        sample_rate, channels = reservation.sample_rate, reservation.channels
+
         # Verificar si el bot ya está conectado al canal de voz
         if ctx.voice_client and ctx.voice_client.channel.id == voice_channel.id:
             voice_client = ctx.voice_client
@@ -47,20 +94,32 @@ class RecordingCommands(commands.Cog):
 
         # Iniciar la grabación
         try:
-            recorder = AudioRecorder(voice_client) # Simplified AudioRecorder initialization
+            session_dir = build_session_dir(guild_id, channel_id) if config.STREAMING_RECORDING else None
+            recorder = AudioRecorder(
+                voice_client,
+                sample_rate=sample_rate,
+                channels=channels,
+                session_dir=session_dir,
+                metadata={'guild_id': guild_id, 'channel_id': channel_id}
+            )
+            # La transcripción en directo se conecta antes de empezar para no perder el principio
+            live = None
+            if modo == 'directo' or config.LIVE_TRANSCRIPTION:
+                live = self._start_live(recorder, guild_id, LiveCaptions(
+                    ctx.channel, config.LIVE_CAPTION_INTERVAL, config.LIVE_CAPTION_LINES))
             recorder.start()
 
             # Guardar la referencia a la grabación activa
-            if guild_id not in self.active_recordings:
-                self.active_recordings[guild_id] = {}
-
-            self.active_recordings[guild_id][channel_id] = {
-                'recorder': recorder,
-                'start_time': datetime.datetime.now(),
-                'voice_client': voice_client
-            }
+            session = self.manager.register(
+                guild_id, channel_id, recorder, voice_client, notify_channel=ctx.channel, reservation=reservation)
+            session.live = live
 
-            await ctx.send(f"Grabación iniciada en {voice_channel.name}. Usa `!detener [nombre_grabación]` cuando quieras finalizar.")
+            await ctx.send(
+                f"Grabación iniciada en {voice_channel.name}. Usa `!detener [nombre_grabación]` cuando quieras finalizar."
+                + (f"\nHay mucha carga: se grabará en formato reducido ({sample_rate // 1000} kHz, "
+                   f"{'mono' if channels == 1 else 'estéreo'})." if session.downgraded else "")
+                + ("\nLa transcripción se hará en directo y estará lista al detener la grabación." if live else "")
+            )
             logger.info(f'Grabación iniciada en canal {voice_channel.name} del servidor {ctx.guild.name}')
 
         except Exception as e:
@@ -75,57 +134,36 @@ class RecordingCommands(commands.Cog):
         guild_id = ctx.guild.id
 
         # Verificar si hay grabaciones activas en este servidor
-        if guild_id not in self.active_recordings or not self.active_recordings[guild_id]:
+        sessions = self.manager.sessions(guild_id)
+        if not sessions:
             await ctx.send("No hay grabaciones activas en este servidor.")
             return
 
-        # Si el usuario está en un canal de voz, intentar detener la grabación de ese canal
+        # Si el usuario está en un canal de voz, intentar detener la grabación de ese canal;
+        # si no, o si ese canal no tiene grabación activa, usar la primera del servidor
         channel_id = ctx.author.voice.channel.id if ctx.author.voice else None
-
-        # Si no se especificó un canal, o el canal especificado no tiene grabación activa,
-        # usar la primera grabación activa del servidor
-        if channel_id is None or channel_id not in self.active_recordings[guild_id]:
-            channel_id = next(iter(self.active_recordings[guild_id]))
+        session = self.manager.get(guild_id, channel_id) or sessions[0]
+        channel_id = session.channel_id
 
         # Detener la grabación
         try:
-            recording_info = self.active_recordings[guild_id][channel_id]
-            recorder = recording_info['recorder']
-            voice_client = recording_info['voice_client']
-            start_time = recording_info['start_time']
+            recorder = session.recorder
+            voice_client = session.voice_client
+            start_time = session.start_time
 
-            # Obtener los datos de audio
-            audio_data = recorder.stop()
+            audio_data = await self._stop_session(session)
 
             # Verificar si hay datos de audio
             if not audio_data:
                 await ctx.send("No se capturaron datos de audio. La grabación no se guardará.")
                 logger.warning("No se capturaron datos de audio. La grabación no se guardará.")
-                del self.active_recordings[guild_id][channel_id]
-                if not self.active_recordings[guild_id]:
-                    del self.active_recordings[guild_id]
                 if voice_client.is_connected():
                     await voice_client.disconnect()
                 return
 
             # Generar nombre de archivo si no se proporcionó
-            if not recording_name:
-                recording_name = f"grabacion_{ctx.guild.id}_{channel_id}_{int(datetime.datetime.now().timestamp())}"
-
-            # Guardar la grabación
-            date_str = start_time.strftime("%Y-%m-%d")
-            file_path = save_recording(
-                audio_data,
-                recording_name,
-                date=date_str,
-                sample_rate=config.SAMPLE_RATE,
-                channels=config.CHANNELS
-            )
-
-            # Eliminar la grabación de las activas
-            del self.active_recordings[guild_id][channel_id]
-            if not self.active_recordings[guild_id]:
-                del self.active_recordings[guild_id]
+            recording_name = recording_name or self._default_name(session)
+            file_path = await self._save_session(session, audio_data, recording_name)
 
             # Desconectar el cliente de voz si no hay más grabaciones activas
             if voice_client.is_connected():
@@ -138,65 +176,343 @@ class RecordingCommands(commands.Cog):
             await ctx.send(
                 f"Grabación guardada como `{recording_name}` ({hours:02}:{minutes:02}:{seconds:02}).\n"
                 f"Archivo guardado en: {file_path}"
+                + (f"\nPistas separadas por hablante: {len(recorder.tracks)}" if recorder.tracks else "")
             )
             logger.info(f'Grabación finalizada y guardada como {recording_name} en {file_path}')
 
-            # Ofrecer transcripción
-            await ctx.send(
-                f"Puedes transcribir esta grabación usando `!transcribir {recording_name}`"
-            )
+            # Ofrecer transcripción (la transcripción en directo ya se ha enviado)
+            if session.live is None:
+                await ctx.send(
+                    f"Puedes transcribir esta grabación usando `!transcribir {recording_name}`"
+                )
 
         except Exception as e:
             await ctx.send(f"Error al detener la grabación: {str(e)}")
             logger.error(f'Error al detener grabación: {e}')
 
+    def _default_name(self, session):
+        # Todas las partes de una grabación dividida comparten el nombre base
+        if session.name is None:
+            session.name = f"grabacion_{session.guild_id}_{session.channel_id}_{int(datetime.datetime.now().timestamp())}"
+        return f"{session.name}_parte{session.part}" if session.part > 1 else session.name
+
+    async def _stop_session(self, session):
+        """
+        Detiene el grabador de una sesión y la quita de las activas
+
+        Returns:
+            Datos de audio (o directorio de la sesión en modo streaming), o None si no se grabó nada
+        """
+        guild_id = session.guild_id
+        recorder = session.recorder
+        executor = get_executor()
+        session.closing = True
+
+        # Detener los hilos de escritura bloquea, así que se hace fuera del bucle de eventos.
+        # Detener y guardar no se atribuyen al servidor en el ejecutor: no deben esperar
+        # tras sus transcripciones ni se pueden cancelar con !cancelar
+        try:
+            audio_data = await executor.run_io(recorder.stop)
+        finally:
+            # Al dividir en partes, la sesión de la parte siguiente ya ocupa el canal
+            if self.manager.get(guild_id, session.channel_id) is session:
+                self.manager.remove(guild_id, session.channel_id)
+
+        if recorder.streaming and recorder.bytes_recorded == 0:
+            if audio_data:
+                await executor.run_io(discard_session, audio_data)
+            audio_data = None
+        if not audio_data and session.live is not None:
+            session.live.cancel()
+        return audio_data
+
+    async def _save_session(self, session, audio_data, recording_name):
+        """
+        Guarda el audio de una sesión ya detenida
+
+        Returns:
+            Ruta al archivo guardado
+        """
+        guild_id = session.guild_id
+        recorder = session.recorder
+        executor = get_executor()
+
+        # Resumen calculado al grabar; si se descartó audio, sus energías no casarían con el archivo
+        summary = None
+        if recorder.summary is not None:
+            summary = await executor.run_io(recorder.summary.finish, not recorder.dropped_bytes)
+
+        date_str = session.start_time.strftime("%Y-%m-%d")
+        if recorder.streaming:
+            save = functools.partial(
+                finalize_recording,
+                audio_data,
+                recording_name,
+                date=date_str,
+                timeline=recorder.timeline_index() if recorder.tracks else None,
+                guild_id=guild_id,
+                channel_id=session.channel_id,
+                summary=summary
+            )
+        else:
+            save = functools.partial(
+                save_recording,
+                audio_data,
+                recording_name,
+                date=date_str,
+                sample_rate=recorder.sample_rate,
+                channels=recorder.channels,
+                guild_id=guild_id,
+                channel_id=session.channel_id,
+                summary=summary
+            )
+        file_path = await executor.run_io(save)
+        if session.live is not None:
+            await self._finish_live(session, file_path, recording_name)
+        return file_path
+
+    def _start_live(self, recorder, guild_id, captions):
+        """Conecta una transcripción en directo a un grabador aún sin iniciar"""
+        live = LiveTranscriber(
+            sample_rate=recorder.sample_rate,
+            channels=recorder.channels,
+            api=config.TRANSCRIPTION_API,
+            guild_id=guild_id,
+            captions=captions,
+            queue_size=config.LIVE_QUEUE_SIZE,
+            workers=config.LIVE_WORKERS
+        )
+        recorder.live = live
+        return live
+
+    async def _finish_live(self, session, file_path, recording_name):
+        """Completa la transcripción en directo de una grabación guardada y la envía al canal"""
+        live = session.live
+        try:
+            await live.finish(file_path)
+            transcript_file = await get_executor().run_io(live.save, file_path)
+            if live.captions is not None:
+                await live.captions.close()
+            if session.notify_channel is not None:
+                get_dispatcher().send_file(
+                    session.notify_channel, transcript_file, os.path.basename(transcript_file),
+                    content=f"Transcripción en directo de `{recording_name}` completada."
+                )
+            logger.info(f'Transcripción en directo guardada en {transcript_file}')
+        except Exception as e:
+            live.cancel()
+            logger.error(f'Error al completar la transcripción en directo: {e}')
+            await self._notify(
+                session, f"No se pudo completar la transcripción en directo; usa `!transcribir {recording_name}`")
+
+    async def _notify(self, session, message):
+        if session.notify_channel is None:
+            return
+        try:
+            await session.notify_channel.send(message)
+        except discord.HTTPException as e:
+            logger.warning(f"No se pudo avisar en el canal {session.notify_channel}: {e}")
+
+    async def _auto_stop(self, session, reason):
+        """Finaliza y guarda una grabación sin que nadie haya usado !detener"""
+        voice_client = session.voice_client
+        try:
+            audio_data = await self._stop_session(session)
+            if audio_data:
+                recording_name = self._default_name(session)
+                file_path = await self._save_session(session, audio_data, recording_name)
+                await self._notify(
+                    session,
+                    f"Grabación detenida automáticamente ({reason}) y guardada como `{recording_name}`."
+                    + (f"\nPuedes transcribirla usando `!transcribir {recording_name}`" if session.live is None else "")
+                )
+                logger.info(f'Grabación detenida automáticamente ({reason}) y guardada en {file_path}')
+            else:
+                logger.info(f'Grabación detenida automáticamente ({reason}) sin audio')
+        except Exception as e:
+            logger.error(f'Error al detener automáticamente la grabación: {e}')
+        finally:
+            if not self.manager.sessions(session.guild_id) and voice_client.is_connected():
+                await voice_client.disconnect()
+
+    async def _rollover(self, session):
+        """
+        Cierra la parte actual de una grabación larga y continúa en un archivo nuevo
+
+        El nuevo grabador hereda el sink del anterior antes de detenerlo, de
+        modo que los paquetes que llegan mientras la parte cerrada se vacía y
+        se guarda ya van a la parte siguiente.
+        """
+        old = session.recorder
+        guild_id, channel_id = session.guild_id, session.channel_id
+        recorder = AudioRecorder(
+            session.voice_client,
+            sample_rate=old.sample_rate,
+            channels=old.channels,
+            session_dir=build_session_dir(guild_id, channel_id) if old.streaming else None,
+            metadata=old.metadata
+        )
+        live = None
+        if session.live is not None:
+            # Los subtítulos continúan en el mismo mensaje con la nueva parte
+            live = self._start_live(recorder, guild_id, session.live.captions)
+
+        recorder.start(takeover=old)
+        new_session = self.manager.register(
+            guild_id, channel_id, recorder, session.voice_client, notify_channel=session.notify_channel)
+        new_session.part = session.part + 1
+        new_session.live = live
+        audio_data = await self._stop_session(session)
+
+        if audio_data:
+            recording_name = self._default_name(session)
+            new_session.name = session.name
+            await self._save_session(session, audio_data, recording_name)
+            await self._notify(
+                session,
+                f"La grabación alcanzó la duración máxima: parte {session.part} guardada como "
+                f"`{recording_name}`; se sigue grabando en la parte {new_session.part}."
+            )
+
+    async def _supervise(self):
+        """Detiene las grabaciones olvidadas y divide las que superan la duración máxima"""
+        while True:
+            await asyncio.sleep(config.RECORDING_CHECK_INTERVAL)
+            now = time.monotonic()
+            for session in self.manager.sessions():
+                if session.closing:
+                    continue
+                try:
+                    channel = session.voice_client.channel
+                    listeners = [m for m in getattr(channel, 'members', []) if not m.bot]
+                    if listeners:
+                        session.empty_since = None
+                    elif session.empty_since is None:
+                        session.empty_since = now
+
+                    if session.empty_since is not None and now - session.empty_since >= config.AUTO_STOP_EMPTY_GRACE:
+                        await self._auto_stop(session, "el canal se quedó vacío")
+                    elif session.recorder.idle_seconds >= config.AUTO_STOP_SILENCE:
+                        await self._auto_stop(
+                            session, f"{config.AUTO_STOP_SILENCE // 60} minutos sin que nadie hable")
+                    elif (datetime.datetime.now() - session.start_time).total_seconds() >= config.MAX_RECORDING_TIME:
+                        if config.AUTO_SPLIT_RECORDINGS:
+                            await self._rollover(session)
+                        else:
+                            await self._auto_stop(session, "se alcanzó la duración máxima")
+                except asyncio.CancelledError:
+                    # Solo se detiene la supervisión si la cancelan a ella; si la cancelación
+                    # viene de la operación de una sesión, se sigue con las demás
+                    if asyncio.current_task().cancelling():
+                        raise
+                    logger.error(f'Operación cancelada supervisando la grabación del canal {session.channel_id}')
+                except Exception as e:
+                    logger.error(f'Error supervisando la grabación del canal {session.channel_id}: {e}')
 
     @commands.command(name='salir', help='Desconecta el bot del canal de voz actual')
     async def leave_voice(self, ctx):
         guild_id = ctx.guild.id
 
         # Detener todas las grabaciones activas en este servidor
-        if guild_id in self.active_recordings:
-            for channel_id, recording_info in list(self.active_recordings[guild_id].items()):
-                try:
-                    recorder = recording_info['recorder']
-                    recorder.stop()
-
-                    # No guardamos la grabación al salir forzadamente
-                    del self.active_recordings[guild_id][channel_id]
-                except Exception as e:
-                    logger.error(f'Error al detener grabación al salir: {e}')
-
-            # Eliminar el servidor si no quedan grabaciones
-            if not self.active_recordings[guild_id]:
-                del self.active_recordings[guild_id]
+        for session in self.manager.sessions(guild_id):
+            try:
+                recorder = session.recorder
+                audio_data = await get_executor().run_io(recorder.stop)
+
+                # No guardamos la grabación al salir forzadamente
+                if recorder.streaming and audio_data:
+                    await get_executor().run_io(discard_session, audio_data)
+                if session.live is not None:
+                    session.live.cancel()
+                self.manager.remove(guild_id, session.channel_id)
+            except Exception as e:
+                logger.error(f'Error al detener grabación al salir: {e}')
 
         # Desconectar el cliente de voz
         if ctx.voice_client:
             await ctx.voice_client.disconnect()
             await ctx.send("Me he desconectado del canal de voz.")
 
-    @commands.command(name='status', help='Muestra el estado de las grabaciones activas')
+    @commands.command(name='status', help='Muestra el estado y el consumo de las grabaciones activas')
     async def recording_status(self, ctx):
         guild_id = ctx.guild.id
 
-        if guild_id not in self.active_recordings or not self.active_recordings[guild_id]:
-            await ctx.send("No hay grabaciones activas en este servidor.")
+        stats = self.manager.stats(guild_id)
+        if not stats:
+            await ctx.send("No hay grabaciones activas en este servidor." + await self._cluster_summary())
             return
 
         status_message = "Grabaciones activas:\n"
 
-        for channel_id, recording_info in self.active_recordings[guild_id].items():
-            channel = self.bot.get_channel(channel_id)
-            start_time = recording_info['start_time']
-            duration = datetime.datetime.now() - start_time
-            hours, remainder = divmod(duration.seconds, 3600)
+        for stat in stats:
+            channel = self.bot.get_channel(stat['channel_id'])
+            hours, remainder = divmod(stat['duration'].seconds, 3600)
             minutes, seconds = divmod(remainder, 60)
+            audio_format = f"{stat['sample_rate'] // 1000} kHz {'mono' if stat['channels'] == 1 else 'estéreo'}"
+
+            status_message += (
+                f"- {channel.name if channel else stat['channel_id']}: {hours:02}:{minutes:02}:{seconds:02} "
+                f"({audio_format}{', reducido' if stat['downgraded'] else ''})\n"
+                f"  {stat['packets_per_second']:.0f} paquetes/s, "
+                f"{stat['buffered_bytes'] / 1024:.0f} KB en memoria, "
+                f"escritura {stat['write_rate'] / 1024:.0f} KB/s, "
+                f"{stat['bytes_recorded'] / (1024 * 1024):.1f} MB grabados"
+                + (f", {stat['dropped_bytes'] / 1024:.0f} KB descartados" if stat['dropped_bytes'] else "")
+                + (f", parte {stat['part']}" if stat['part'] > 1 else "")
+                + (f", sin voz desde hace {stat['idle_seconds'] / 60:.0f} min" if stat['idle_seconds'] >= 60 else "")
+                + "\n"
+            )
+            status_message += await self._summary_line(ctx.guild, self.manager.get(guild_id, stat['channel_id']))
 
-            status_message += f"- {channel.name}: {hours:02}:{minutes:02}:{seconds:02}\n"
+        status_message += (
+            f"Total: {len(self.manager)}/{self.manager.max_sessions} grabaciones "
+            f"(máximo {self.manager.max_per_guild} por servidor), "
+            f"{self.manager.buffered_bytes() / (1024 * 1024):.1f} MB en memoria"
+        )
+        status_message += await self._cluster_summary()
+        if auto_recording_paused():
+            status_message += "\nDisco casi lleno: las grabaciones automáticas están en pausa"
 
         await ctx.send(status_message)
 
+    async def _summary_line(self, guild, session):
+        """Proporción de voz, volumen y hablantes de una grabación en curso, según su resumen"""
+        summary = session.recorder.summary if session is not None else None
+        if summary is None:
+            return ""
+        snapshot = await get_executor().run_io(summary.snapshot)
+        line = f"  voz {snapshot['speech_ratio']:.0%}"
+        if snapshot['level_db'] is not None:
+            line += f", volumen {snapshot['level_db']:.0f} dBFS"
+        speakers = sorted(snapshot['talk_ms'].items(), key=lambda item: item[1], reverse=True)
+        if speakers:
+            line += ", hablan: " + ", ".join(
+                f"{self._speaker_name(guild, key)} {format_timestamp(ms)}" for key, ms in speakers[:3])
+        return line + "\n"
+
+    def _speaker_name(self, guild, key):
+        """Nombre visible de un hablante (ID de usuario o SSRC)"""
+        if guild and key.isdigit():
+            member = guild.get_member(int(key))
+            if member:
+                return member.display_name
+        return key
+
+    async def _cluster_summary(self):
+        """Totales de todos los procesos del bot cuando se ejecuta por shards"""
+        if config.SHARD_IDS is None:
+            return ""
+        try:
+            view = await get_executor().run_io(get_shared_state().aggregate)
+        except Exception as e:
+            logger.error(f"Error al leer el estado compartido: {e}")
+            return ""
+        return (
+            f"\nTodos los procesos ({len(view['processes'])} activos): {view['sessions']} grabaciones, "
+            f"{view['buffered_bytes'] / (1024 * 1024):.1f} MB en memoria, "
+            f"{view['packets_per_second']:.0f} paquetes/s"
+        )
+
 async def setup(bot):
     await bot.add_cog(RecordingCommands(bot))
     logger.info('Módulo de grabación cargado')
\ No newline at end of file
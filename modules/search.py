@@ -0,0 +1,46 @@
+from discord.ext import commands
+import logging
+from utils.audio_processing import format_timestamp
+from utils.executors import get_executor
+from utils.output_dispatcher import get_dispatcher
+from utils.search_index import get_search_index
+import config
+
+logger = logging.getLogger('discord-recording-bot.search')
+
+class SearchCommands(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command(name='buscar', help='Busca en las transcripciones del servidor (término* busca por prefijo)')
+    async def search(self, ctx, *terms):
+        if not terms:
+            await ctx.send("Indica qué quieres buscar. Ejemplo: `!buscar presupuesto reunión`")
+            return
+
+        try:
+            results = await get_executor().run_io(
+                get_search_index().search, list(terms), ctx.guild.id, config.SEARCH_RESULTS)
+        except Exception as e:
+            await ctx.send(f"Error al buscar: {str(e)}")
+            logger.error(f'Error al buscar en las transcripciones: {e}')
+            return
+
+        if not results:
+            await ctx.send(f"No se encontró nada para: {' '.join(terms)}")
+            return
+
+        message = ""
+        for result in results:
+            speaker = f"{result['speaker']}: " if result['speaker'] else ""
+            message += (
+                f"- `{result['recording']}` [{format_timestamp(result['start_ms'])}] "
+                f"({result['start_ms']} ms) {speaker}{result['text']}\n"
+            )
+
+        get_dispatcher().send_text(
+            ctx.channel, message, title=f"Resultados para: {' '.join(terms)}", filename="busqueda.txt")
+
+async def setup(bot):
+    await bot.add_cog(SearchCommands(bot))
+    logger.info('Módulo de búsqueda cargado')
@@ -1,8 +1,20 @@
 import discord
 from discord.ext import commands
+import asyncio
+import functools
 import os
+import time
 import logging
-from utils.audio_processing import transcribe_audio
+from utils.audio_processing import (transcribe_segments, transcribe_tracks, format_segments, format_timestamp,
+                                    parse_timestamp, NO_SPEECH_MESSAGE)
+from utils.file_management import (get_tracks_dir, get_recording_path, extract_clip,
+                                   list_recordings as list_saved_recordings)
+from utils.executors import get_executor
+from utils.output_dispatcher import get_dispatcher
+from utils.search_index import index_transcript
+from utils.sharding import process_key
+from utils.job_queue import TranscriptionQueue, PRIORITIES
+from utils import metrics
 import config
 
 logger = logging.getLogger('discord-recording-bot.transcription')
@@ -10,122 +22,318 @@ logger = logging.getLogger('discord-recording-bot.transcription')
 class TranscriptionCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        
-    @commands.command(name='transcribir', help='Transcribe una grabación de audio a texto')
-    async def transcribe(self, ctx, recording_name=None):
+        self.queue = TranscriptionQueue(config.JOBS_DB)
+        self.workers = []
+        self.running_jobs = {}  # {job_id: (guild_id, asyncio.Task)}
+        self.running_per_guild = {}  # {guild_id: número de trabajos en curso}
+        self.job_available = asyncio.Event()
+
+    async def cog_load(self):
+        # Reanudar los trabajos que quedaron a medias en el último reinicio
+        resumed = await get_executor().run_io(self.queue.requeue_interrupted, process_key())
+        if resumed:
+            logger.info(f'Se reanudan {resumed} transcripciones interrumpidas')
+        self.workers = [
+            asyncio.create_task(self._worker(i)) for i in range(config.TRANSCRIPTION_WORKERS)
+        ]
+        self.job_available.set()
+
+    async def cog_unload(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.queue.close()
+
+    def _speaker_name(self, guild, key):
+        """Nombre visible del hablante de una pista (ID de usuario o SSRC)"""
+        if guild and key.isdigit():
+            member = guild.get_member(int(key))
+            if member:
+                return member.display_name
+        return key
+
+    def _write_transcript(self, transcript_file, transcript):
+        os.makedirs(os.path.dirname(transcript_file), exist_ok=True)
+        with open(transcript_file, 'w', encoding='utf-8') as f:
+            f.write(transcript)
+
+    async def _worker(self, worker_id):
+        """Toma trabajos de la cola respetando prioridades y el límite por servidor"""
+        executor = get_executor()
+        while True:
+            await self.job_available.wait()
+            self.job_available.clear()
+
+            while True:
+                full_guilds = [g for g, n in self.running_per_guild.items()
+                               if n >= config.TRANSCRIPTION_GUILD_LIMIT]
+                # Con shards, cada proceso solo atiende los trabajos de sus servidores
+                job = await executor.run_io(
+                    self.queue.claim_next, full_guilds, process_key(), config.SHARD_COUNT, config.SHARD_IDS)
+                if job is None:
+                    break
+
+                # Puede haber más trabajos: despertar a otro worker
+                self.job_available.set()
+                metrics.transcription_wait.observe(max(time.time() - job['created'], 0.0))
+
+                guild_id = job['guild_id']
+                self.running_per_guild[guild_id] = self.running_per_guild.get(guild_id, 0) + 1
+                task = asyncio.create_task(self._run_job(job))
+                self.running_jobs[job['id']] = (guild_id, task)
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        # El propio worker se está deteniendo: el trabajo se reanudará al reiniciar
+                        raise
+                    await executor.run_io(self.queue.finish, job['id'], 'cancelled')
+                    await self._edit_progress(job, f"Transcripción cancelada: {os.path.basename(job['recording_path'])}")
+                    logger.info(f"Transcripción {job['id']} cancelada")
+                finally:
+                    self.running_jobs.pop(job['id'], None)
+                    self.running_per_guild[guild_id] -= 1
+                    if not self.running_per_guild[guild_id]:
+                        del self.running_per_guild[guild_id]
+                    self.job_available.set()
+
+    async def _edit_progress(self, job, content):
+        channel = self.bot.get_channel(job['channel_id'])
+        if channel is None or not job.get('message_id'):
+            return
+        try:
+            await channel.get_partial_message(job['message_id']).edit(content=content)
+        except discord.HTTPException as e:
+            logger.warning(f"No se pudo actualizar el progreso de la transcripción {job['id']}: {e}")
+
+    async def _run_job(self, job):
+        executor = get_executor()
+        queue = self.queue
+        job_id = job['id']
+        guild_id = job['guild_id']
+        recording_file = job['recording_path']
+        name = os.path.basename(recording_file)
+        started = time.monotonic()
+
+        try:
+            # Fragmentos ya transcritos antes de un reinicio
+            stored = await executor.run_io(queue.completed_chunks, job_id)
+            totals = {}
+            done = {'count': len(stored), 'last_update': 0.0}
+
+            async def on_chunk(track, index, total, text):
+                totals[track] = total
+                done['count'] += 1
+                progress = done['count'] / max(sum(totals.values()), done['count'])
+                chunk_key = f"{track}/{index}" if track else str(index)
+                await executor.run_io(queue.save_chunk, job_id, chunk_key, text, progress)
+                now = time.monotonic()
+                if now - done['last_update'] >= config.PROGRESS_UPDATE_INTERVAL:
+                    done['last_update'] = now
+                    await self._edit_progress(job, f"Procesando transcripción de {name}... {progress:.0%}")
+
+            # Realizar la transcripción (por hablante si la grabación tiene pistas separadas)
+            tracks_dir = get_tracks_dir(recording_file)
+            if tracks_dir:
+                completed = {}
+                for chunk_key, text in stored.items():
+                    track, index = chunk_key.rsplit('/', 1)
+                    completed.setdefault(track, {})[int(index)] = text
+                results = await transcribe_tracks(
+                    tracks_dir, api=config.TRANSCRIPTION_API, guild_id=guild_id,
+                    completed=completed, on_chunk=on_chunk
+                )
+                # Intercalar las intervenciones de todos los hablantes por orden de tiempo
+                guild = self.bot.get_guild(guild_id)
+                segments = sorted(
+                    (start, self._speaker_name(guild, key), text)
+                    for key, track_segments in results.items()
+                    for start, _, text in track_segments if text
+                )
+                transcript = "\n".join(
+                    f"[{format_timestamp(start)}] {speaker}: {text}" for start, speaker, text in segments
+                ) or NO_SPEECH_MESSAGE
+            else:
+                completed = {int(k): v for k, v in stored.items()}
+                results = await transcribe_segments(
+                    recording_file, api=config.TRANSCRIPTION_API, guild_id=guild_id,
+                    completed=completed,
+                    on_chunk=lambda index, total, text: on_chunk(None, index, total, text)
+                )
+                segments = [(start, "", text) for start, _, text in results if text]
+                transcript = format_segments(results) or NO_SPEECH_MESSAGE
+
+            # Guardar la transcripción en un archivo
+            base_name = name.rsplit('.', 1)[0]
+            transcript_file = os.path.join(config.TRANSCRIPTIONS_DIR, f"{base_name}.txt")
+
+            await executor.run_io(self._write_transcript, transcript_file, transcript)
+            # Indexar los segmentos (con milisegundos) para !buscar
+            await executor.run_io(
+                functools.partial(index_transcript, transcript_file, segments, guild_id=guild_id), guild_id=guild_id)
+            await executor.run_io(queue.finish, job_id, 'done', transcript_file)
+            metrics.transcription_duration.observe(time.monotonic() - started, ('done',))
+
+            await self._edit_progress(job, f"Transcripción completada para: {name}")
+            channel = self.bot.get_channel(job['channel_id'])
+            if channel is not None:
+                self._send_transcript(channel, transcript, transcript_file, base_name)
+
+            logger.info(f'Transcripción completada para {recording_file}')
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as e:
+            await executor.run_io(queue.finish, job_id, 'failed', error=str(e))
+            metrics.transcription_duration.observe(time.monotonic() - started, ('failed',))
+            channel = self.bot.get_channel(job['channel_id'])
+            if channel is not None:
+                await channel.send(f"Error al transcribir el audio: {str(e)}")
+            logger.error(f'Error al transcribir audio: {e}')
+
+    def _send_transcript(self, channel, transcript, transcript_file, base_name):
+        # Mensaje, embed paginado o adjunto comprimido según el tamaño; el envío no bloquea el trabajo
+        dispatcher = get_dispatcher()
+        strategy = dispatcher.send_text(
+            channel, transcript, title=f"Transcripción de {base_name}", filename=f"{base_name}.txt")
+
+        # Enviar también el archivo de transcripción (el adjunto comprimido ya lo contiene)
+        if strategy != 'attachment':
+            dispatcher.send_file(channel, transcript_file, f"{base_name}.txt")
+
+    @commands.command(name='transcribir', help='Transcribe una grabación de audio a texto (prioridad opcional: alta, normal, baja)')
+    async def transcribe(self, ctx, recording_name=None, priority='normal'):
         if not recording_name:
             await ctx.send("Por favor, proporciona el nombre de la grabación a transcribir. Ejemplo: `!transcribir mi_grabacion`")
             return
-            
-        # Buscar la grabación en el directorio de grabaciones
-        recording_files = []
-        for root, _, files in os.walk(config.RECORDINGS_DIR):
-            for file in files:
-                if recording_name in file and file.endswith(f".{config.AUDIO_FORMAT}"):
-                    recording_files.append(os.path.join(root, file))
-        
-        if not recording_files:
+
+        if priority not in PRIORITIES:
+            await ctx.send(f"Prioridad no válida. Usa una de: {', '.join(PRIORITIES)}")
+            return
+
+        executor = get_executor()
+
+        # Buscar la grabación del servidor en el catálogo (la más reciente si hay varias)
+        recording_file = await executor.run_io(get_recording_path, recording_name, ctx.guild.id)
+
+        if not recording_file:
             await ctx.send(f"No se encontró ninguna grabación con el nombre '{recording_name}'.")
             return
-            
-        # Si se encontraron múltiples grabaciones, usar la más reciente
-        recording_file = max(recording_files, key=os.path.getctime)
-        
+
         await ctx.send(f"Transcribiendo grabación: {os.path.basename(recording_file)}. Esto puede tardar unos minutos...")
-        
+
+        # Mostrar mensaje de que estamos procesando; los workers lo irán editando con el progreso
+        message = await ctx.send("Procesando transcripción...")
+
+        await executor.run_io(
+            self.queue.enqueue, ctx.guild.id, ctx.channel.id, recording_file,
+            priority=PRIORITIES[priority], message_id=message.id
+        )
+        self.job_available.set()
+
+    @commands.command(name='cola', help='Muestra las transcripciones pendientes y en curso')
+    async def show_queue(self, ctx):
+        jobs = await get_executor().run_io(self.queue.active_jobs, ctx.guild.id)
+        if not jobs:
+            await ctx.send("No hay transcripciones en cola en este servidor.")
+            return
+
+        message = "**Transcripciones en cola:**\n"
+        for job in jobs:
+            state = f"en curso ({job['progress']:.0%})" if job['status'] == 'running' else "pendiente"
+            message += f"- {os.path.basename(job['recording_path'])}: {state}\n"
+        await ctx.send(message)
+
+    @commands.command(name='cancelar', help='Cancela las transcripciones pendientes y en curso en este servidor')
+    async def cancel_jobs(self, ctx):
+        executor = get_executor()
+        cancelled = await executor.run_io(self.queue.cancel_pending, ctx.guild.id)
+        # Se cancela la tarea de cada trabajo en curso: con ella, todos sus fragmentos pendientes
+        for guild_id, task in list(self.running_jobs.values()):
+            if guild_id == ctx.guild.id and not task.done():
+                task.cancel()
+                cancelled += 1
+        if cancelled:
+            await ctx.send(f"Se cancelaron {cancelled} trabajos en curso.")
+        else:
+            await ctx.send("No hay trabajos en curso en este servidor.")
+
+    @commands.command(name='clip', help='Envía un fragmento de una grabación (inicio y fin en segundos, MM:SS o HH:MM:SS)')
+    async def clip(self, ctx, recording_name=None, start=None, end=None):
+        if not (recording_name and start and end):
+            await ctx.send("Indica la grabación, el inicio y el fin. Ejemplo: `!clip mi_grabacion 1:30 2:00`")
+            return
+
         try:
-            # Mostrar mensaje de que estamos procesando
-            message = await ctx.send("Procesando transcripción...")
-            
-            # Realizar la transcripción
-            transcript = await transcribe_audio(recording_file, api=config.TRANSCRIPTION_API)
-            
-            # Guardar la transcripción en un archivo
-            base_name = os.path.basename(recording_file).rsplit('.', 1)[0]
-            transcript_file = os.path.join(config.TRANSCRIPTIONS_DIR, f"{base_name}.txt")
-            
-            os.makedirs(os.path.dirname(transcript_file), exist_ok=True)
-            
-            with open(transcript_file, 'w', encoding='utf-8') as f:
-                f.write(transcript)
-                
-            # Dividir la transcripción en trozos si es muy larga para Discord
-            chunks = [transcript[i:i+1900] for i in range(0, len(transcript), 1900)]
-            
-            await message.edit(content=f"Transcripción completada para: {os.path.basename(recording_file)}")
-            
-            # Enviar la transcripción
-            for i, chunk in enumerate(chunks):
-                if i == 0:
-                    await ctx.send(f"**Transcripción (parte {i+1}/{len(chunks)}):**\n```{chunk}```")
-                else:
-                    await ctx.send(f"**Parte {i+1}/{len(chunks)}:**\n```{chunk}```")
-                    
-            # Enviar el archivo de transcripción
-            await ctx.send(file=discord.File(transcript_file, f"{base_name}.txt"))
-            
-            logger.info(f'Transcripción completada para {recording_file}')
-            
+            start_ms, end_ms = parse_timestamp(start), parse_timestamp(end)
+        except ValueError:
+            await ctx.send("Formato de tiempo no válido. Usa segundos, MM:SS o HH:MM:SS.")
+            return
+        if end_ms <= start_ms:
+            await ctx.send("El fin del fragmento debe ser posterior al inicio.")
+            return
+        if end_ms - start_ms > config.CLIP_MAX_SECONDS * 1000:
+            await ctx.send(f"El fragmento no puede durar más de {config.CLIP_MAX_SECONDS} segundos.")
+            return
+
+        executor = get_executor()
+        recording_file = await executor.run_io(get_recording_path, recording_name, ctx.guild.id)
+        if not recording_file:
+            await ctx.send(f"No se encontró ninguna grabación con el nombre '{recording_name}'.")
+            return
+
+        try:
+            clip_path, duration_ms = await executor.run_io(
+                extract_clip, recording_file, start_ms, end_ms, guild_id=ctx.guild.id)
         except Exception as e:
-            await ctx.send(f"Error al transcribir el audio: {str(e)}")
-            logger.error(f'Error al transcribir audio: {e}')
-            
-    @commands.command(name='listar', help='Lista todas las grabaciones disponibles')
-    async def list_recordings(self, ctx):
-        # Verificar si el directorio de grabaciones existe
-        if not os.path.exists(config.RECORDINGS_DIR):
-            await ctx.send("No hay grabaciones disponibles.")
+            await ctx.send(f"Error al recortar la grabación: {str(e)}")
+            logger.error(f'Error al recortar {recording_file}: {e}')
             return
-            
-        # Obtener todas las grabaciones
-        recordings = []
-        for root, _, files in os.walk(config.RECORDINGS_DIR):
-            for file in files:
-                if file.endswith(f".{config.AUDIO_FORMAT}"):
-                    rel_path = os.path.relpath(os.path.join(root, file), config.RECORDINGS_DIR)
-                    recordings.append(rel_path)
-                    
+
+        size = os.path.getsize(clip_path)
+        if duration_ms <= 0 or size > ctx.guild.filesize_limit:
+            os.remove(clip_path)
+            if duration_ms <= 0:
+                await ctx.send("El intervalo queda fuera de la grabación.")
+            else:
+                await ctx.send("El fragmento supera el tamaño máximo de archivo del servidor; prueba con uno más corto.")
+            return
+
+        base_name, ext = os.path.splitext(os.path.basename(recording_file))
+        get_dispatcher().send_file(
+            ctx.channel, clip_path, f"{base_name}_{start_ms // 1000}-{end_ms // 1000}{ext}",
+            content=f"Fragmento de {base_name} [{format_timestamp(start_ms)} - {format_timestamp(start_ms + duration_ms)}]",
+            remove=True)
+
+    @commands.command(name='listar', help='Lista las grabaciones del servidor')
+    async def list_recordings(self, ctx):
+        # Obtener las grabaciones del servidor del catálogo (incluye la duración y la voz de sus resúmenes)
+        recordings = await get_executor().run_io(list_saved_recordings, ctx.guild.id)
+
         if not recordings:
             await ctx.send("No hay grabaciones disponibles.")
             return
             
-        # Organizar grabaciones por fecha (asumiendo que están en carpetas con formato de fecha)
+        # Organizar grabaciones por fecha
         recordings_by_date = {}
         for recording in recordings:
-            parts = recording.split(os.sep)
-            if len(parts) > 1:
-                date = parts[0]
-                name = os.path.join(*parts[1:])
-                
-                if date not in recordings_by_date:
-                    recordings_by_date[date] = []
-                    
-                recordings_by_date[date].append(name)
-            else:
-                # Para grabaciones sin fecha en la ruta
-                if "sin_fecha" not in recordings_by_date:
-                    recordings_by_date["sin_fecha"] = []
-                    
-                recordings_by_date["sin_fecha"].append(recording)
+            recordings_by_date.setdefault(recording['date'], []).append(recording)
                 
         # Construir mensaje
-        message = "**Grabaciones disponibles:**\n"
+        message = ""
         
         for date, files in sorted(recordings_by_date.items(), reverse=True):
             message += f"\n**{date}:**\n"
-            for file in sorted(files):
-                # Obtener el nombre base sin extensión
-                name = os.path.basename(file).rsplit('.', 1)[0]
-                message += f"- {name}\n"
+            for recording in sorted(files, key=lambda item: item['name']):
+                if recording['duration_ms'] is not None:
+                    message += (f"- {recording['name']} ({format_timestamp(recording['duration_ms'])}, "
+                                f"voz {recording['speech_ratio']:.0%})\n")
+                else:
+                    message += f"- {recording['name']}\n"
                 
-        # Dividir el mensaje si es muy largo
-        chunks = [message[i:i+1900] for i in range(0, len(message), 1900)]
-        
-        for i, chunk in enumerate(chunks):
-            if i == 0:
-                await ctx.send(chunk)
-            else:
-                await ctx.send(f"...(continuación)...\n{chunk}")
+        # Mensaje, embed paginado o adjunto comprimido según la longitud del listado
+        get_dispatcher().send_text(ctx.channel, message, title="Grabaciones disponibles:", filename="grabaciones.txt")
 
 async def setup(bot):
     await bot.add_cog(TranscriptionCommands(bot))
@@ -0,0 +1,340 @@
+import os
+import shutil
+import struct
+import hashlib
+import logging
+import subprocess
+import contextlib
+import config
+from utils.audio_writer import StreamingWavWriter, iter_session_pcm, read_manifest, session_data_size, stitch_segments
+
+logger = logging.getLogger('discord-recording-bot.audio_codec')
+
+# Formatos de almacenamiento admitidos y códec de ffmpeg para cada uno
+CODECS = {
+    'ogg': ['-c:a', 'libopus', '-application', 'voip'],
+    'flac': ['-c:a', 'flac'],
+}
+AUDIO_EXTENSIONS = ('wav', 'flac', 'ogg')
+
+_warned_no_ffmpeg = False
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+
+def storage_format():
+    """
+    Formato con el que se guardan las grabaciones nuevas
+
+    Si el formato configurado requiere ffmpeg y no está instalado, se usa WAV.
+    """
+    global _warned_no_ffmpeg
+    fmt = config.AUDIO_FORMAT
+    if fmt != 'wav' and not ffmpeg_available():
+        if not _warned_no_ffmpeg:
+            logger.warning(f"ffmpeg no está disponible: las grabaciones se guardarán en WAV en lugar de {fmt}")
+            _warned_no_ffmpeg = True
+        return 'wav'
+    return fmt
+
+
+def encode_pcm(blocks, output_path, sample_rate=48000, channels=2, fmt='ogg', bitrate=None):
+    """
+    Codifica en streaming un flujo PCM de 16 bits con ffmpeg
+
+    Args:
+        blocks: Iterable de bloques PCM intercalados
+        output_path: Ruta del archivo de salida
+        sample_rate: Frecuencia de muestreo del audio
+        channels: Número de canales de audio
+        fmt: Formato de salida ('ogg' u 'flac')
+        bitrate: Tasa de bits para formatos con pérdida (p. ej. '128k')
+
+    Returns:
+        Número de bytes PCM codificados
+    """
+    command = [
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+        *CODECS[fmt]
+    ]
+    if bitrate and fmt == 'ogg':
+        command += ['-b:a', bitrate]
+    command.append(output_path)
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    total = 0
+    try:
+        for block in blocks:
+            process.stdin.write(block)
+            total += len(block)
+    finally:
+        process.stdin.close()
+        stderr = process.stderr.read()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg falló al codificar {output_path}: {stderr.decode(errors='ignore')}")
+    return total
+
+
+def write_session_audio(session_dir, output_path):
+    """
+    Une los segmentos de una sesión en el formato que indica la extensión de
+    output_path: WAV directamente o comprimido en streaming con ffmpeg
+
+    Args:
+        session_dir: Directorio de la sesión
+        output_path: Ruta del archivo resultante (.wav, .flac u .ogg)
+
+    Returns:
+        Número de bytes de audio PCM de la sesión (0 si estaba vacía y no se escribió nada)
+    """
+    fmt = output_path.rsplit('.', 1)[-1]
+    if fmt == 'wav':
+        return stitch_segments(session_dir, output_path)
+    if session_data_size(session_dir) == 0:
+        return 0
+
+    manifest = read_manifest(session_dir) or {}
+    return encode_pcm(
+        iter_session_pcm(session_dir),
+        output_path,
+        sample_rate=manifest.get('sample_rate', 48000),
+        channels=manifest.get('channels', 2),
+        fmt=fmt,
+        bitrate=config.AUDIO_BITRATE
+    )
+
+
+def encode_file(input_path, output_path, fmt='ogg', bitrate=None):
+    """
+    Recodifica un archivo de audio con ffmpeg (el servicio de retención
+    archiva así las grabaciones WAV antiguas)
+
+    Args:
+        input_path: Archivo de origen
+        output_path: Archivo de salida
+        fmt: Formato de salida ('ogg' u 'flac')
+        bitrate: Tasa de bits para formatos con pérdida (p. ej. '48k')
+    """
+    command = ['ffmpeg', '-v', 'error', '-y', '-i', input_path, *CODECS[fmt]]
+    if bitrate and fmt == 'ogg':
+        command += ['-b:a', bitrate]
+    command += ['-f', fmt, output_path]
+    result = subprocess.run(command, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg falló al codificar {output_path}: {result.stderr.decode(errors='ignore')}")
+
+
+def cut_file(input_path, output_path, start_ms, end_ms):
+    """
+    Extrae un fragmento de una grabación comprimida con ffmpeg
+
+    ffmpeg busca el inicio en el archivo de entrada sin decodificar lo
+    anterior, y solo se recodifica el fragmento (en el mismo formato).
+
+    Args:
+        input_path: Grabación de origen (FLAC u Ogg/Opus)
+        output_path: Archivo de salida, con la misma extensión
+        start_ms: Inicio del fragmento en milisegundos
+        end_ms: Fin del fragmento en milisegundos
+    """
+    fmt = output_path.rsplit('.', 1)[-1]
+    command = [
+        'ffmpeg', '-v', 'error', '-y', '-ss', f"{start_ms / 1000:.3f}", '-i', input_path,
+        '-t', f"{(end_ms - start_ms) / 1000:.3f}", *CODECS[fmt]
+    ]
+    if fmt == 'ogg':
+        command += ['-b:a', config.AUDIO_BITRATE]
+    command.append(output_path)
+    result = subprocess.run(command, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg falló al recortar {input_path}: {result.stderr.decode(errors='ignore')}")
+
+
+def decode_to_wav(input_path, output_path):
+    """Decodifica un archivo comprimido a WAV PCM de 16 bits con ffmpeg"""
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-i', input_path, '-c:a', 'pcm_s16le', '-f', 'wav', output_path],
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg falló al decodificar {input_path}: {result.stderr.decode(errors='ignore')}")
+
+
+def decode_to_temp_wav(file_path):
+    """
+    Decodifica una grabación comprimida a un WAV temporal
+
+    Args:
+        file_path: Ruta a la grabación (FLAC u Ogg/Opus)
+
+    Returns:
+        Ruta del WAV temporal; quien la pide se encarga de borrarlo
+    """
+    os.makedirs(config.DECODE_CACHE_DIR, exist_ok=True)
+    digest = hashlib.blake2b(f"{file_path}:{os.path.getmtime(file_path)}".encode(), digest_size=10).hexdigest()
+    wav_path = os.path.join(config.DECODE_CACHE_DIR, f"{digest}_{os.getpid()}_{os.urandom(3).hex()}.wav")
+    decode_to_wav(file_path, wav_path)
+    return wav_path
+
+
+@contextlib.contextmanager
+def pcm_source(file_path):
+    """
+    Devuelve una ruta WAV legible para el audio indicado
+
+    Los WAV se usan tal cual; los formatos comprimidos se decodifican solo
+    en este momento a un archivo temporal que se borra al salir.
+
+    Args:
+        file_path: Ruta a la grabación (WAV, FLAC u Ogg/Opus)
+
+    Yields:
+        Ruta a un archivo WAV con el mismo audio
+    """
+    if file_path.endswith('.wav'):
+        yield file_path
+        return
+
+    wav_path = decode_to_temp_wav(file_path)
+    try:
+        yield wav_path
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(wav_path)
+
+
+# --- Multiplexado Ogg/Opus sin recodificar ---
+
+def _ogg_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _ogg_crc_table()
+
+
+def ogg_crc(data):
+    crc = 0
+    table = _CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+# Trama Opus de 20 ms de silencio (la misma que envía Discord cuando alguien deja de hablar)
+OPUS_SILENCE_FRAME = b'\xf8\xff\xfe'
+
+
+def opus_packet_samples(packet):
+    """
+    Número de muestras (a 48 kHz) de un paquete Opus según su byte TOC
+
+    Args:
+        packet: Paquete Opus
+
+    Returns:
+        Muestras por canal que produce el paquete
+    """
+    if not packet:
+        return 0
+    toc = packet[0]
+    config_number = toc >> 3
+    if config_number < 12:
+        frame_size = (480, 960, 1920, 2880)[config_number & 3]
+    elif config_number < 16:
+        frame_size = (480, 960)[config_number & 1]
+    else:
+        frame_size = (120, 240, 480, 960)[config_number & 3]
+
+    code = toc & 3
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame_size * frames
+
+
+class OggOpusWriter(StreamingWavWriter):
+    """
+    Escribe los paquetes Opus que envía Discord directamente en un contenedor
+    Ogg, sin decodificar ni recodificar.
+
+    El hilo de voz solo copia cada paquete, precedido de su longitud, en el
+    buffer circular; las páginas Ogg (con su CRC) se construyen en el hilo
+    escritor. Cada página es autocontenida, así que un archivo cortado por
+    una caída sigue siendo reproducible hasta la última página completa.
+    """
+
+    def __init__(self, file_path, sample_rate=48000, channels=2, buffer_size=16 * 1024, **kwargs):
+        self._serial = int.from_bytes(os.urandom(4), 'little')
+        self._sequence = 0
+        self._granule = 0
+        super().__init__(file_path, sample_rate=sample_rate, channels=channels, buffer_size=buffer_size, **kwargs)
+
+    def write(self, packet):
+        """Añade un paquete Opus; bytes_received cuenta los bytes PCM equivalentes"""
+        if self._closed:
+            return
+        self.bytes_received += opus_packet_samples(packet) * self.channels * self.sample_width
+        if not self._ring.write(len(packet).to_bytes(2, 'little'), packet):
+            self._drop(len(packet))
+
+    def _write_views(self, views):
+        data = views[0] if len(views) == 1 else b''.join(views)
+        packets, position = [], 0
+        while position < len(data):
+            size = int.from_bytes(data[position:position + 2], 'little')
+            packets.append(bytes(data[position + 2:position + 2 + size]))
+            position += 2 + size
+        self._write_block(packets)
+
+    def _page(self, packets, granule, header_type=0):
+        lacing = bytearray()
+        for packet in packets:
+            lacing += b'\xff' * (len(packet) // 255) + bytes((len(packet) % 255,))
+        header = struct.pack(
+            '<4sBBqIIIB', b'OggS', 0, header_type, granule, self._serial, self._sequence, 0, len(lacing)
+        )
+        page = bytearray(header + lacing + b''.join(packets))
+        struct.pack_into('<I', page, 22, ogg_crc(page))
+        self._sequence += 1
+        return page
+
+    def _open_output(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self._file = open(self.file_path, 'wb')
+        opus_head = struct.pack('<8sBBHIhB', b'OpusHead', 1, self.channels, 0, self.sample_rate, 0, 0)
+        vendor = b'discord-recording-bot'
+        opus_tags = b'OpusTags' + struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', 0)
+        self._file.write(self._page([opus_head], 0, header_type=0x02))
+        self._file.write(self._page([opus_tags], 0))
+
+    def _write_block(self, packets):
+        page_packets, segments = [], 0
+        for packet in packets:
+            needed = len(packet) // 255 + 1
+            if segments + needed > 255:
+                self._file.write(self._page(page_packets, self._granule))
+                page_packets, segments = [], 0
+            page_packets.append(packet)
+            segments += needed
+            self._granule += opus_packet_samples(packet)
+            self.bytes_written += opus_packet_samples(packet) * self.channels * self.sample_width
+        if page_packets:
+            self._file.write(self._page(page_packets, self._granule))
+
+    def _close_output(self):
+        # Página final vacía con la marca de fin de flujo
+        self._file.write(self._page([], self._granule, header_type=0x04))
+        self._file.close()
@@ -1,83 +1,635 @@
 
 import asyncio
+import bisect
 import discord
+import json
 import wave
 import logging
+import math
 import os
-import speech_recognition as sr
 import threading
-import numpy as np
+import time
 from array import array
 from io import BytesIO
+from utils.audio_writer import SegmentedRecordingWriter
+from utils.audio_codec import (AUDIO_EXTENSIONS, OPUS_SILENCE_FRAME, OggOpusWriter, decode_to_temp_wav,
+                               storage_format)
+from utils.audio_summary import AudioSummaryBuilder, load_summary
+from utils.mixer import TimelineMixer
+from utils.resample import resample
+from utils.executors import get_executor
+from utils.vad import split_on_silence
+from utils.wav_reader import WavReader
+from utils.transcription_backends import get_backend
+from utils.transcription_cache import get_cache, hash_bytes
+from utils.lazy import lazy_import
+from utils import metrics
 import config
 
 logger = logging.getLogger('discord-recording-bot.audio_processing')
 
+# numpy solo hace falta al mezclar, analizar o transcribir audio: se carga en el primer uso
+np = lazy_import('numpy')
+
 class AudioSink:
     def __init__(self, recorder):
         self.recorder = recorder
 
-    def write(self, data):
-        self.recorder._write_audio(data.data)
+    def write(self, user, data):
+        # Camino caliente: se llama por cada paquete de 20 ms de cada hablante
+        recorder = self.recorder
+        if not recorder.recording:
+            return
+        recorder.packets_received += 1
+        metrics.voice_packets.inc(recorder.metric_labels)
+        pcm = getattr(data, 'pcm', None) or data.data
+        try:
+            if recorder.downsample:
+                pcm = _convert_pcm(pcm, recorder.channels, config.SAMPLE_RATE // recorder.sample_rate)
+            key = _speaker_key(user, data)
+            recorder.mixer.add(key, pcm, getattr(getattr(data, 'packet', None), 'timestamp', None))
+            recorder.summary.add_talk(key, len(pcm))
+            if recorder.separate_tracks:
+                recorder._write_track(key, pcm, getattr(data, 'opus', None))
+        except Exception as e:
+            logger.error(f"Error processing voice packet: {e}")
 
     def cleanup(self):
         pass
 
+def _convert_pcm(pcm, channels, factor):
+    """
+    Reduce un frame PCM estéreo de Discord a menos canales y menor frecuencia
+
+    Promedia los canales y cada grupo de `factor` muestras, lo que sirve a
+    la vez de filtro paso bajo sencillo antes de diezmar.
+
+    Args:
+        pcm: Frame PCM int16 estéreo
+        channels: Canales de salida (1 o 2)
+        factor: Factor de diezmado (3 para pasar de 48 kHz a 16 kHz)
+
+    Returns:
+        Frame PCM convertido
+    """
+    samples = np.frombuffer(pcm, dtype='<i2').reshape(-1, 2).astype(np.int32)
+    if channels == 1:
+        samples = samples.sum(axis=1, keepdims=True) // 2
+    if factor > 1:
+        usable = len(samples) - len(samples) % factor
+        samples = samples[:usable].reshape(-1, factor, samples.shape[1]).mean(axis=1)
+    return samples.astype('<i2').tobytes()
+
+def _speaker_key(user, data):
+    """Identifica al hablante por ID de usuario o, si aún no se conoce, por SSRC"""
+    if user is not None:
+        return str(user.id)
+    packet = getattr(data, 'packet', None)
+    ssrc = getattr(packet, 'ssrc', None)
+    return f"ssrc_{ssrc}" if ssrc is not None else 'desconocido'
+
+class SpeakerTrack:
+    """Pista de un hablante: escritor propio y línea de tiempo de sus intervenciones"""
+    __slots__ = ('key', 'writer', 'timeline', 'last_packet', 'opus')
+
+    def __init__(self, key, writer, opus=False):
+        self.key = key
+        self.writer = writer
+        # Si la pista guarda los paquetes Opus originales en lugar de PCM
+        self.opus = opus
+        # Lista compacta de (inicio_ms, offset_en_bytes) de cada intervención
+        self.timeline = []
+        self.last_packet = 0.0
+
 class AudioRecorder:
-    def __init__(self, voice_client, sample_rate=48000, channels=2):
+    def __init__(self, voice_client, sample_rate=48000, channels=2, session_dir=None, metadata=None):
         self.voice_client = voice_client
         self.sample_rate = sample_rate
         self.channels = channels
         self.recording = False
         self.audio_data = BytesIO()
-        self.wav_header_written = False
         self.sink = AudioSink(self)
+        # Si este grabador tiene su sink escuchando en el cliente de voz
+        self.listening = False
+
+        # Si se indica un directorio de sesión, los paquetes se escriben a disco en segmentos
+        self.session_dir = session_dir
+        self.metadata = metadata
+        self.writer = None
+        # Destino de los bloques mezclados: el escritor en streaming o el buffer en memoria
+        self._output = self.audio_data
+
+        # Pistas por hablante {clave_usuario: SpeakerTrack}
+        self.separate_tracks = config.SEPARATE_TRACKS and session_dir is not None
+        self.tracks = {}
+        self.started_at = 0.0
+
+        # Separación mínima entre paquetes (en segundos) para abrir una nueva intervención
+        self._track_gap = config.TRACK_GAP_MS / 1000
+
+        # Formato reducido (p. ej. 16 kHz mono) cuando el gestor de grabaciones lo impone
+        self.downsample = (sample_rate, channels) != (config.SAMPLE_RATE, config.CHANNELS)
+        self.packets_received = 0
+        self.metric_labels = (str((metadata or {}).get('guild_id', '')),)
+
+        # Última vez (monotonic) que la mezcla tuvo voz, para detectar grabaciones olvidadas
+        self.last_voice = 0.0
+
+        # Con Ogg/Opus las pistas guardan directamente los paquetes que envía Discord,
+        # salvo en formato reducido, donde la pista debe coincidir con el PCM convertido
+        self.track_format = storage_format() if self.separate_tracks and not self.downsample else 'wav'
+
+        # Transcripción en directo opcional (LiveTranscriber): recibe cada bloque mezclado
+        self.live = None
+
+        # Resumen de la grabación (AudioSummaryBuilder), calculado sobre los bloques mezclados
+        self.summary = None
+
+        # Mezclador que alinea los paquetes de todos los hablantes en el tiempo
+        self.mixer = TimelineMixer(
+            self._write_audio,
+            sample_rate=sample_rate,
+            channels=channels,
+            block_duration=config.MIX_BLOCK_DURATION,
+            latency=config.MIX_LATENCY
+        )
+
+    @property
+    def streaming(self):
+        return self.session_dir is not None
+
+    @property
+    def bytes_recorded(self):
+        if self.writer is not None:
+            return self.writer.bytes_written
+        return 0
+
+    @property
+    def buffered_bytes(self):
+        """Bytes en memoria pendientes de mezclar o de escribir a disco"""
+        buffered = self.mixer.pending_bytes
+        if self.writer is not None:
+            buffered += self.writer.buffered_bytes
+        return buffered + sum(track.writer.buffered_bytes for track in list(self.tracks.values()))
+
+    @property
+    def queue_depth(self):
+        """Bloques en cola de los hilos escritores (mezcla y pistas)"""
+        depth = self.writer.queue_depth if self.writer is not None else 0
+        return depth + sum(track.writer.queue_depth for track in list(self.tracks.values()))
+
+    @property
+    def dropped_bytes(self):
+        """Bytes descartados porque el disco no daba abasto"""
+        dropped = self.writer.dropped_bytes if self.writer is not None else 0
+        return dropped + sum(track.writer.dropped_bytes for track in list(self.tracks.values()))
 
     def _write_wav_header(self):
         with wave.open(self.audio_data, 'wb') as wav_file:
             wav_file.setnchannels(self.channels)
             wav_file.setsampwidth(2)
             wav_file.setframerate(self.sample_rate)
-        self.wav_header_written = True
+
+    @property
+    def idle_seconds(self):
+        """Segundos desde la última vez que alguien habló (o desde el inicio)"""
+        if not self.recording:
+            return 0.0
+        return time.monotonic() - self.last_voice
+
+    def _update_activity(self, data):
+        # Energía del bloque mezclado: los paquetes de silencio de Discord no cuentan como voz
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32)
+        if len(samples):
+            rms = math.sqrt(float(np.dot(samples, samples)) / len(samples))
+            if rms and 20 * math.log10(rms / 32768.0) > config.IDLE_MIN_DB:
+                self.last_voice = time.monotonic()
 
     def _write_audio(self, data):
+        # Recibe bloques mezclados (MIX_BLOCK_DURATION), no paquetes sueltos
         if self.recording:
             try:
-                if not self.wav_header_written:
-                    self._write_wav_header()
-                self.audio_data.write(data)
+                self._update_activity(data)
+                self._output.write(data)
+                self.summary.feed(data)
+                if self.live is not None:
+                    self.live.feed(data)
             except Exception as e:
                 logger.error(f"Error writing audio data: {e}")
 
-    def start(self):
-        self.recording = True
+    def _open_track(self, key, opus=None):
+        if opus is not None and self.track_format == 'ogg':
+            # Los paquetes Opus de Discord se guardan tal cual, sin recodificar
+            writer = OggOpusWriter(
+                os.path.join(self.session_dir, 'tracks', f"{key}.ogg"),
+                sample_rate=self.sample_rate,
+                channels=self.channels,
+                queue_size=config.WRITER_QUEUE_SIZE
+            )
+            track = SpeakerTrack(key, writer, opus=True)
+            self.tracks[key] = track
+            return track
+
+        writer = SegmentedRecordingWriter(
+            os.path.join(self.session_dir, 'tracks', key),
+            sample_rate=self.sample_rate,
+            channels=self.channels,
+            segment_duration=config.SEGMENT_DURATION,
+            metadata={'speaker': key},
+            buffer_size=config.TRACK_BUFFER_SIZE,
+            queue_size=config.WRITER_QUEUE_SIZE
+        )
+        track = SpeakerTrack(key, writer)
+        self.tracks[key] = track
+        return track
+
+    def _write_track(self, key, data, opus=None):
+        # El formato de la pista se decide con su primer paquete y no cambia después
+        track = self.tracks.get(key)
+        if track is None:
+            track = self._open_track(key, opus)
+        now = time.monotonic()
+        if now - track.last_packet > self._track_gap:
+            track.timeline.append((int((now - self.started_at) * 1000), track.writer.bytes_received))
+        track.last_packet = now
+        if not track.opus:
+            # Las pistas PCM guardan siempre el audio decodificado, traiga o no el paquete Opus
+            track.writer.write(data)
+        elif opus is not None:
+            track.writer.write(opus)
+        else:
+            # Paquete sin Opus original (p. ej. reconstruido por FEC/PLC en el decodificador):
+            # se sustituye por silencio de la misma duración para no desplazar la línea de tiempo
+            frame_bytes = self.sample_rate // 50 * self.channels * 2
+            for _ in range(max(round(len(data) / frame_bytes), 1)):
+                track.writer.write(OPUS_SILENCE_FRAME)
+            metrics.track_opus_gaps.inc(self.metric_labels)
+
+    def timeline_index(self):
+        """
+        Índice de la línea de tiempo de cada pista
+
+        Returns:
+            Diccionario serializable con las intervenciones de cada hablante
+        """
+        return {
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'tracks': {
+                key: {'bytes': track.writer.bytes_written, 'segments': track.timeline}
+                for key, track in self.tracks.items()
+            }
+        }
+
+    def start(self, takeover=None):
+        """
+        Empieza a grabar
+
+        Args:
+            takeover: Grabador que ya escucha en el mismo cliente de voz (al dividir
+                una grabación en partes). Su sink pasa a alimentar a este sin dejar
+                de escuchar, así que no se pierde ningún paquete entre las partes.
+        """
+        self.tracks = {}
+        self.packets_received = 0
+        self.started_at = time.monotonic()
+        self.last_voice = self.started_at
+        self.summary = AudioSummaryBuilder(self.sample_rate, self.channels, frame_ms=config.VAD_FRAME_MS)
         self.audio_data = BytesIO()
-        self.wav_header_written = False
-        self.voice_client.listen(self.sink)
+        self._output = self.audio_data
+        if self.streaming:
+            self.writer = SegmentedRecordingWriter(
+                self.session_dir,
+                sample_rate=self.sample_rate,
+                channels=self.channels,
+                segment_duration=config.SEGMENT_DURATION,
+                metadata=self.metadata,
+                buffer_size=config.WRITE_BUFFER_SIZE,
+                queue_size=config.WRITER_QUEUE_SIZE
+            )
+            self._output = self.writer
+        else:
+            self._write_wav_header()
+        self.recording = True
+        self.mixer.start()
+        if takeover is not None:
+            # Cambiar el destino del sink es una asignación: el siguiente paquete ya llega aquí
+            self.sink = takeover.sink
+            self.sink.recorder = self
+            self.listening, takeover.listening = takeover.listening, False
+        else:
+            self.voice_client.listen(self.sink)
+            self.listening = True
         logger.info("Recording started")
 
     def stop(self):
         if not self.recording:
             return None
 
+        if self.listening:
+            self.voice_client.stop_listening()
+            self.listening = False
+        self.mixer.close()
         self.recording = False
-        self.voice_client.stop_listening()
+
+        for track in self.tracks.values():
+            try:
+                track.writer.close()
+            except Exception as e:
+                logger.error(f"Error closing track {track.key}: {e}")
+
+        if self.writer is not None:
+            # En modo streaming devolvemos el directorio de la sesión ya cerrada
+            return self.writer.close()
 
         audio_data = self.audio_data.getvalue()
         self.audio_data.close()
 
         return audio_data
 
-async def transcribe_audio(file_path, api='speech_recognition'):
-    if api == 'speech_recognition':
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(file_path) as source:
-            audio = recognizer.record(source)
+def _plan_chunks(file_path, energies=None):
+    return split_on_silence(
+        file_path,
+        frame_ms=config.VAD_FRAME_MS,
+        min_silence_ms=config.VAD_MIN_SILENCE_MS,
+        min_chunk=config.TRANSCRIPTION_MIN_CHUNK,
+        max_chunk=config.TRANSCRIPTION_MAX_CHUNK,
+        min_db=config.VAD_MIN_DB,
+        energies=energies
+    )
+
+# Diferencia de duración admitida entre un resumen y el audio (el decodificado
+# de un Ogg/Opus puede variar unos milisegundos respecto al original)
+SUMMARY_DURATION_TOLERANCE_MS = 250
+
+def _summary_energies(summary, source):
+    """
+    Energías por trama del resumen de una grabación, si valen para planificar
+    sobre source (mismas tramas, misma frecuencia y misma duración)
+
+    Returns:
+        Tupla como la de utils.vad.frame_energies o None
+    """
+    if summary is None or summary['energies'] is None or summary['frame_ms'] != config.VAD_FRAME_MS:
+        return None
+    with WavReader(source) as reader:
+        if (reader.sample_rate != summary['sample_rate']
+                or abs(reader.duration_ms - summary['duration_ms']) > SUMMARY_DURATION_TOLERANCE_MS):
+            return None
+        sample_rate = reader.sample_rate
+    return summary['energies'], sample_rate * config.VAD_FRAME_MS // 1000, sample_rate
+
+def _read_mono_chunk(file_path, start, end):
+    # Acceso directo al intervalo sobre el archivo mapeado, sin leer lo anterior
+    with WavReader(file_path) as reader:
+        channels = reader.channels
+        sample_rate = reader.sample_rate
+        data = reader.read(start, end)
+    # El reconocedor recibe mono a RECOGNITION_SAMPLE_RATE; el archivo conserva la calidad original
+    target_rate = min(sample_rate, config.RECOGNITION_SAMPLE_RATE)
+    return resample(data, sample_rate, target_rate, channels), target_rate
+
+def _recognize_chunk(api, file_path, start, end):
+    pcm, sample_rate = _read_mono_chunk(file_path, start, end)
+    return recognize_pcm(api, pcm, sample_rate)
+
+def recognize_pcm(api, pcm, sample_rate):
+    """
+    Reconoce un fragmento PCM mono, consultando antes la caché de fragmentos
+
+    Args:
+        api: API de transcripción a utilizar
+        pcm: Audio PCM mono de 16 bits
+        sample_rate: Frecuencia de muestreo del fragmento
+
+    Returns:
+        Texto reconocido
+    """
+    backend = get_backend(api)
+
+    # Caché por fragmento: solo se reconocen los fragmentos cuyo audio no se ha visto antes
+    cache = get_cache()
+    if cache is None:
+        return backend.transcribe_chunk(pcm, sample_rate)
+    chunk_hash = hash_bytes(pcm)
+    text = cache.get_chunk(chunk_hash, backend.settings_key)
+    if text is None:
+        text = backend.transcribe_chunk(pcm, sample_rate)
+        cache.put_chunk(chunk_hash, backend.settings_key, text)
+    return text
+
+def _segments_settings_key(backend):
+    # Los cortes del VAD forman parte del resultado, así que entran en la clave
+    return (f"{backend.settings_key}|vad:{config.VAD_FRAME_MS}:{config.VAD_MIN_SILENCE_MS}:"
+            f"{config.TRANSCRIPTION_MIN_CHUNK}:{config.TRANSCRIPTION_MAX_CHUNK}:{config.VAD_MIN_DB}")
+
+def _cached_segments(file_path, settings_key):
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    audio_hash = cache.file_hash(file_path)
+    return audio_hash, cache.get_segments(audio_hash, settings_key)
+
+# Texto que se devuelve cuando no se reconoce nada en toda la grabación
+NO_SPEECH_MESSAGE = "Speech recognition could not understand audio"
+
+def format_timestamp(ms):
+    seconds = ms // 1000
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+def parse_timestamp(text):
+    """
+    Convierte un instante escrito por el usuario en milisegundos
+
+    Acepta segundos ("90", "90.5"), "MM:SS" y "HH:MM:SS".
+
+    Raises:
+        ValueError: Si el formato no es válido
+    """
+    parts = text.split(':')
+    if len(parts) > 3 or any(not part for part in parts):
+        raise ValueError(f"Instante no válido: {text}")
+    seconds = float(parts[-1])
+    for index, part in enumerate(reversed(parts[:-1])):
+        seconds += int(part) * 60 ** (index + 1)
+    if seconds < 0:
+        raise ValueError(f"Instante no válido: {text}")
+    return int(seconds * 1000)
+
+def format_segments(segments):
+    """Texto legible de una lista de segmentos (inicio_ms, fin_ms, texto)"""
+    return "\n".join(f"[{format_timestamp(start)}] {text}" for start, _, text in segments if text)
+
+async def transcribe_segments(file_path, api='speech_recognition', guild_id=None, completed=None, on_chunk=None,
+                              use_summary=True):
+    """
+    Transcribe un archivo de audio cortándolo en los silencios y procesando
+    los fragmentos en paralelo
+
+    El archivo nunca se carga entero: la detección de voz lo recorre en
+    streaming en el pool de procesos y cada fragmento se lee por separado.
+    Si la grabación tiene resumen (utils.audio_summary), el plan de
+    fragmentos sale de sus energías sin recorrer el audio, y una grabación
+    sin voz ni siquiera se decodifica.
+
+    Args:
+        file_path: Ruta al archivo de audio (WAV, FLAC u Ogg/Opus)
+        api: API de transcripción a utilizar
+        guild_id: Servidor al que se atribuye el trabajo
+        completed: Diccionario {índice: texto} de fragmentos ya transcritos, que se omiten
+        on_chunk: Corrutina opcional on_chunk(índice, total, texto) llamada tras cada fragmento
+        use_summary: Si se usa el resumen de la grabación (las pistas por hablante no tienen)
+
+    Returns:
+        Lista de segmentos (inicio_ms, fin_ms, texto) en orden
+    """
+    backend = get_backend(api)
+    executor = get_executor()
+    # Los motores locales consumen CPU y van al pool de procesos; los remotos, al de E/S
+    run = executor.run_cpu if backend.cpu_bound else executor.run_io
+
+    # Si este mismo audio ya se transcribió con la misma configuración, devolverlo directamente
+    settings_key = _segments_settings_key(backend)
+    audio_hash, cached = await executor.run_io(_cached_segments, file_path, settings_key, guild_id=guild_id)
+    if cached is not None:
+        logger.info(f"Transcripción de {file_path} obtenida de la caché")
+        return cached
+
+    summary = None
+    if use_summary:
+        summary = await executor.run_io(load_summary, file_path, True, guild_id=guild_id)
+        if summary is not None and summary['energies'] is not None and not summary['speech_ratio']:
+            logger.info(f"{file_path} no tiene voz según su resumen")
+            return []
+
+    # Los formatos comprimidos se decodifican solo ahora, cuando hace falta el PCM
+    source = file_path
+    if not file_path.endswith('.wav'):
+        source = await executor.run_io(decode_to_temp_wav, file_path, guild_id=guild_id)
+
+    try:
+        energies = await executor.run_io(_summary_energies, summary, source, guild_id=guild_id)
+        if energies is not None:
+            # Sin leer el audio el plan es barato: no hace falta el pool de procesos
+            chunks = await executor.run_io(_plan_chunks, source, energies, guild_id=guild_id)
+        else:
+            chunks = await executor.run_cpu(_plan_chunks, source, guild_id=guild_id)
+        with WavReader(source) as reader:
+            sample_rate = reader.sample_rate
+
+        total = len(chunks)
+        texts = dict(completed or {})
+        semaphore = asyncio.Semaphore(config.TRANSCRIPTION_PARALLELISM)
+
+        async def process(index, start, end):
+            async with semaphore:
+                chunk_started = time.monotonic()
+                text = await run(_recognize_chunk, api, source, start, end, guild_id=guild_id)
+                metrics.transcription_chunk_duration.observe(time.monotonic() - chunk_started, (api,))
+            texts[index] = text
+            if on_chunk is not None:
+                await on_chunk(index, total, text)
+
+        await asyncio.gather(*(
+            process(index, start, end)
+            for index, (start, end) in enumerate(chunks) if index not in texts
+        ))
+    finally:
+        if source != file_path:
             try:
-                return recognizer.recognize_google(audio)
-            except sr.UnknownValueError:
-                return "Google Speech Recognition could not understand audio"
-            except sr.RequestError as e:
-                return f"Could not request results from Google Speech Recognition service; {e}"
-    else:
-        raise ValueError(f"Unsupported transcription API: {api}")
+                os.remove(source)
+            except OSError:
+                pass
+
+    segments = [
+        (start * 1000 // sample_rate, end * 1000 // sample_rate, texts[index])
+        for index, (start, end) in enumerate(chunks)
+    ]
+    if audio_hash is not None:
+        await executor.run_io(get_cache().put_segments, audio_hash, settings_key, segments)
+    return segments
+
+async def transcribe_audio(file_path, api='speech_recognition', guild_id=None, completed=None, on_chunk=None):
+    """
+    Transcribe un archivo de audio y devuelve el texto con marcas de tiempo
+
+    Los argumentos son los de transcribe_segments.
+
+    Returns:
+        Texto transcrito
+    """
+    segments = await transcribe_segments(
+        file_path, api=api, guild_id=guild_id, completed=completed, on_chunk=on_chunk)
+    return format_segments(segments) or NO_SPEECH_MESSAGE
+
+def track_time_to_wall(timeline, byte_offset, bytes_per_ms):
+    """
+    Convierte una posición dentro de una pista de hablante a tiempo real de la grabación
+
+    Args:
+        timeline: Lista de intervenciones (inicio_ms, offset_en_bytes) de la pista
+        byte_offset: Posición en bytes dentro de la pista
+        bytes_per_ms: Bytes de audio por milisegundo
+
+    Returns:
+        Milisegundos desde el inicio de la grabación
+    """
+    entry = bisect.bisect_right([offset for _, offset in timeline], byte_offset) - 1
+    if entry < 0:
+        return int(byte_offset / bytes_per_ms)
+    start_ms, offset = timeline[entry]
+    return int(start_ms + (byte_offset - offset) / bytes_per_ms)
+
+async def transcribe_tracks(tracks_dir, api='speech_recognition', guild_id=None, completed=None, on_chunk=None):
+    """
+    Transcribe por separado y en paralelo cada pista de hablante de una grabación
+
+    Args:
+        tracks_dir: Directorio con las pistas ({usuario}.wav, .flac u .ogg)
+        api: API de transcripción a utilizar
+        guild_id: Servidor al que se atribuye el trabajo
+        completed: Diccionario {clave_usuario: {índice: texto}} de fragmentos ya transcritos
+        on_chunk: Corrutina opcional on_chunk(clave_usuario, índice, total, texto)
+
+    Returns:
+        Diccionario {clave_usuario: segmentos}, con los tiempos de cada segmento
+        referidos al inicio de la grabación si existe timeline.json
+    """
+    completed = completed or {}
+    track_files = sorted(f for f in os.listdir(tracks_dir) if f.rsplit('.', 1)[-1] in AUDIO_EXTENSIONS)
+    keys = [f.rsplit('.', 1)[0] for f in track_files]
+
+    timeline = {}
+    timeline_path = os.path.join(tracks_dir, 'timeline.json')
+    if os.path.exists(timeline_path):
+        with open(timeline_path, encoding='utf-8') as f:
+            timeline = json.load(f)
+
+    def track_callback(key):
+        if on_chunk is None:
+            return None
+        return lambda index, total, text: on_chunk(key, index, total, text)
+
+    results = await asyncio.gather(*(
+        transcribe_segments(
+            os.path.join(tracks_dir, f), api=api, guild_id=guild_id,
+            completed=completed.get(key), on_chunk=track_callback(key), use_summary=False
+        )
+        for key, f in zip(keys, track_files)
+    ))
+
+    tracks = {}
+    for key, segments in zip(keys, results):
+        track_timeline = timeline.get('tracks', {}).get(key, {}).get('segments')
+        if track_timeline:
+            bytes_per_ms = timeline['sample_rate'] * timeline['channels'] * 2 / 1000
+            segments = [
+                (track_time_to_wall(track_timeline, start * bytes_per_ms, bytes_per_ms),
+                 track_time_to_wall(track_timeline, end * bytes_per_ms, bytes_per_ms),
+                 text)
+                for start, end, text in segments
+            ]
+        tracks[key] = segments
+    return tracks
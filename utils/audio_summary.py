@@ -0,0 +1,257 @@
+import os
+import math
+import threading
+import logging
+import config
+from utils.lazy import lazy_import
+from utils.vad import speech_mask
+
+logger = logging.getLogger('discord-recording-bot.audio_summary')
+
+np = lazy_import('numpy')
+
+SUMMARY_VERSION = 1
+
+
+class AudioSummaryBuilder:
+    """
+    Resumen de una grabación calculado mientras se graba, sobre los mismos
+    bloques mezclados que se escriben a disco
+
+    Reúne, sin volver a leer el audio:
+    - la duración
+    - la envolvente por segundo (RMS y pico) para saber qué partes suenan fuerte
+    - la energía de cada trama de VAD_FRAME_MS, la misma que calcula
+      utils.vad.frame_energies, de la que salen la proporción de voz y el plan
+      de fragmentos de la transcripción
+    - el tiempo de habla de cada hablante, contado con los paquetes recibidos
+
+    feed() lo llama el hilo del mezclador y add_talk() el de recepción; el
+    resto se puede consultar desde el bucle de eventos.
+    """
+
+    def __init__(self, sample_rate, channels, frame_ms=30):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        # Muestras (por canal) procesadas
+        self.samples = 0
+        self.talk_bytes = {}
+
+        self._lock = threading.Lock()
+        self._carry = None
+        self._frame_rms = []
+        # Segundo en curso: suma de cuadrados, pico y muestras acumuladas
+        self._second = [0.0, 0, 0]
+        self._rms = []
+        self._peak = []
+
+    def add_talk(self, key, nbytes):
+        """Suma un paquete de voz de un hablante (camino caliente: solo un diccionario)"""
+        self.talk_bytes[key] = self.talk_bytes.get(key, 0) + nbytes
+
+    def feed(self, data):
+        """
+        Procesa un bloque de audio mezclado
+
+        Args:
+            data: Bytes PCM de 16 bits intercalados
+        """
+        samples = np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+        if not len(samples):
+            return
+        # Mismo cálculo que utils.vad.frame_energies para que el plan coincida con el del archivo
+        mono = samples.astype(np.float32).mean(axis=1)
+        peaks = np.abs(samples.astype(np.int32)).max(axis=1)
+
+        with self._lock:
+            if self._carry is not None and len(self._carry):
+                mono_frames = np.concatenate((self._carry, mono))
+            else:
+                mono_frames = mono
+            usable = len(mono_frames) - len(mono_frames) % self.frame_samples
+            frames = mono_frames[:usable].reshape(-1, self.frame_samples)
+            self._frame_rms.append(np.sqrt(np.mean(frames * frames, axis=1)))
+            self._carry = mono_frames[usable:]
+
+            position = 0
+            while position < len(mono):
+                take = min(self.sample_rate - self._second[2], len(mono) - position)
+                part = mono[position:position + take]
+                self._second[0] += float(np.dot(part, part))
+                self._second[1] = max(self._second[1], int(peaks[position:position + take].max()))
+                self._second[2] += take
+                position += take
+                if self._second[2] == self.sample_rate:
+                    self._close_second()
+            self.samples += len(mono)
+
+    def _close_second(self):
+        sum_squares, peak, count = self._second
+        self._rms.append(min(int(round(math.sqrt(sum_squares / count))), 32768))
+        self._peak.append(min(peak, 32768))
+        self._second = [0.0, 0, 0]
+
+    def _energies(self, include_partial=False):
+        """Energías en dBFS por trama hasta ahora (consolida las listas al consultarlas)"""
+        if len(self._frame_rms) > 1:
+            self._frame_rms = [np.concatenate(self._frame_rms)]
+        rms = self._frame_rms[0] if self._frame_rms else np.empty((0,), dtype=np.float32)
+        if include_partial and self._carry is not None and len(self._carry):
+            rms = np.concatenate((rms, np.array([np.sqrt(np.mean(self._carry * self._carry))], dtype=np.float32)))
+        return 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+    def talk_ms(self):
+        """Milisegundos de habla de cada hablante"""
+        bytes_per_ms = self.sample_rate * self.channels * 2 / 1000
+        return {key: int(nbytes / bytes_per_ms) for key, nbytes in list(self.talk_bytes.items())}
+
+    def snapshot(self):
+        """
+        Estado del resumen de una grabación en curso (para !status)
+
+        Returns:
+            Diccionario con duration_ms, speech_ratio, level_db (volumen del
+            último segundo completo, None si aún no hay) y talk_ms
+        """
+        with self._lock:
+            energies = self._energies()
+            level = self._rms[-1] if self._rms else None
+            duration_ms = self.samples * 1000 // self.sample_rate
+        return {
+            'duration_ms': duration_ms,
+            'speech_ratio': _speech_ratio(energies),
+            'level_db': 20 * math.log10(max(level, 1) / 32768.0) if level is not None else None,
+            'talk_ms': self.talk_ms(),
+        }
+
+    def finish(self, exact=True):
+        """
+        Cierra el resumen de una grabación ya detenida
+
+        Args:
+            exact: Si el archivo contiene exactamente el audio procesado; si se
+                descartaron bytes por disco lento, las energías por trama no
+                coincidirían con el archivo y no se guardan
+
+        Returns:
+            Diccionario para save_summary
+        """
+        with self._lock:
+            energies = self._energies(include_partial=True)
+            if self._second[2]:
+                self._close_second()
+            rms = np.array(self._rms, dtype=np.uint16)
+            peak = np.array(self._peak, dtype=np.uint16)
+            duration_ms = self.samples * 1000 // self.sample_rate
+        return {
+            'version': SUMMARY_VERSION,
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'duration_ms': duration_ms,
+            'frame_ms': self.frame_ms,
+            'speech_ratio': _speech_ratio(energies),
+            'rms': rms,
+            'peak': peak,
+            'energies': energies.astype(np.float32) if exact else None,
+            'talk_ms': self.talk_ms(),
+        }
+
+
+def _speech_ratio(energies):
+    if not len(energies):
+        return 0.0
+    return float(speech_mask(energies, min_db=config.VAD_MIN_DB).mean())
+
+
+def summary_path(recording_path):
+    """Ruta del resumen de una grabación (por nombre base, como las transcripciones)"""
+    base_name = os.path.splitext(os.path.basename(recording_path))[0]
+    return os.path.join(config.SUMMARIES_DIR, base_name + '.npz')
+
+
+def save_summary(recording_path, summary):
+    """
+    Guarda el resumen de una grabación como arrays de NumPy comprimidos
+
+    Args:
+        recording_path: Ruta a la grabación
+        summary: Diccionario devuelto por AudioSummaryBuilder.finish
+
+    Returns:
+        Ruta del resumen guardado
+    """
+    os.makedirs(config.SUMMARIES_DIR, exist_ok=True)
+    path = summary_path(recording_path)
+    speakers = sorted(summary['talk_ms'].items(), key=lambda item: item[1], reverse=True)
+    energies = summary['energies']
+    arrays = {
+        'version': np.array(SUMMARY_VERSION),
+        'sample_rate': np.array(summary['sample_rate']),
+        'channels': np.array(summary['channels']),
+        'duration_ms': np.array(summary['duration_ms']),
+        'frame_ms': np.array(summary['frame_ms']),
+        'speech_ratio': np.array(summary['speech_ratio'], dtype=np.float32),
+        'rms': summary['rms'],
+        'peak': summary['peak'],
+        'energies': energies if energies is not None else np.empty((0,), dtype=np.float32),
+        'exact': np.array(energies is not None),
+        'speakers': np.array([key for key, _ in speakers], dtype=np.str_),
+        'talk_ms': np.array([ms for _, ms in speakers], dtype=np.int64),
+    }
+    # Se escribe a un temporal para no dejar nunca un resumen a medias
+    partial = path + '.parcial'
+    with open(partial, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(partial, path)
+    return path
+
+
+def load_summary(recording_path, energies=False, envelope=False):
+    """
+    Lee el resumen de una grabación
+
+    Cada array del .npz se descomprime solo al leerlo, así que las partes
+    grandes únicamente se cargan si se piden.
+
+    Args:
+        recording_path: Ruta a la grabación
+        energies: Si se cargan también las energías por trama (solo las usa
+            el plan de la transcripción)
+        envelope: Si se carga también la envolvente por segundo (rms y peak)
+
+    Returns:
+        Diccionario como el de AudioSummaryBuilder.finish (talk_ms ordenado de
+        más a menos tiempo; rms, peak y energies a None si no se pidieron) o
+        None si la grabación no tiene resumen
+    """
+    path = summary_path(recording_path)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != SUMMARY_VERSION:
+                return None
+            return {
+                'sample_rate': int(data['sample_rate']),
+                'channels': int(data['channels']),
+                'duration_ms': int(data['duration_ms']),
+                'frame_ms': int(data['frame_ms']),
+                'speech_ratio': float(data['speech_ratio']),
+                'rms': data['rms'] if envelope else None,
+                'peak': data['peak'] if envelope else None,
+                'energies': data['energies'] if energies and bool(data['exact']) else None,
+                'talk_ms': dict(zip(data['speakers'].tolist(), data['talk_ms'].tolist())),
+            }
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Resumen ilegible {path}: {e}")
+        return None
+
+
+def remove_summary(recording_path):
+    """Elimina el resumen de una grabación si existe"""
+    try:
+        os.remove(summary_path(recording_path))
+    except FileNotFoundError:
+        pass
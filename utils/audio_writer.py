@@ -0,0 +1,378 @@
+import os
+import json
+import shutil
+import struct
+import threading
+import logging
+import datetime
+from utils.ring_buffer import RingBuffer
+
+logger = logging.getLogger('discord-recording-bot.audio_writer')
+
+# Tamaño de la cabecera WAV canónica (RIFF + fmt + data)
+WAV_HEADER_SIZE = 44
+
+# Nombre del manifiesto de una sesión de grabación segmentada
+MANIFEST_NAME = 'manifest.json'
+
+
+def build_wav_header(data_size, sample_rate=48000, channels=2, sample_width=2):
+    """
+    Construye una cabecera WAV PCM de 44 bytes
+
+    Args:
+        data_size: Tamaño en bytes del bloque de datos
+        sample_rate: Frecuencia de muestreo del audio
+        channels: Número de canales de audio
+        sample_width: Bytes por muestra
+
+    Returns:
+        Cabecera WAV en bytes
+    """
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, byte_rate, block_align, sample_width * 8,
+        b'data', data_size
+    )
+
+
+def patch_wav_header(f, data_size):
+    """
+    Actualiza en el sitio los tamaños RIFF y data de un archivo WAV abierto
+
+    Args:
+        f: Archivo abierto en modo binario de escritura
+        data_size: Tamaño final en bytes del bloque de datos
+    """
+    f.seek(4)
+    f.write(struct.pack('<I', 36 + data_size))
+    f.seek(40)
+    f.write(struct.pack('<I', data_size))
+    f.seek(0, os.SEEK_END)
+
+
+class StreamingWavWriter:
+    """
+    Escribe audio PCM en un archivo WAV a medida que llega.
+
+    Los paquetes se copian en un buffer circular preasignado; un hilo
+    escritor lo vacía en bloques grandes directamente desde el buffer, sin
+    copias intermedias. El hilo de recepción de voz nunca toca el disco ni
+    reserva memoria, y la memoria usada no depende de la duración de la
+    grabación.
+    """
+
+    def __init__(self, file_path, sample_rate=48000, channels=2, sample_width=2,
+                 buffer_size=256 * 1024, queue_size=64, flush_interval=1.0):
+        self.file_path = file_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        # El escritor se despierta con cada bloque de buffer_size bytes; el buffer
+        # admite hasta queue_size bloques pendientes antes de descartar audio
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self.bytes_received = 0
+        self.bytes_written = 0
+        self.dropped_bytes = 0
+
+        self._ring = RingBuffer(buffer_size * queue_size, notify_threshold=buffer_size)
+        self._error = None
+        self._closed = False
+        self._stopping = False
+
+        self._open_output()
+
+        self._thread = threading.Thread(target=self._run, name='wav-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        """Copia datos PCM al buffer circular; nunca bloquea"""
+        if self._closed:
+            return
+        self.bytes_received += len(data)
+        if not self._ring.write(data):
+            self._drop(len(data))
+
+    def _drop(self, size):
+        # El disco no da abasto: descartamos el paquete antes que bloquear la recepción
+        if not self.dropped_bytes:
+            logger.warning(f"Buffer de escritura lleno, se descarta audio de {self.file_path}")
+        self.dropped_bytes += size
+
+    def _drain(self):
+        views = self._ring.peek()
+        if not views:
+            return
+        size = sum(len(view) for view in views)
+        try:
+            if self._error is None:
+                self._write_views(views)
+        except Exception as e:
+            self._error = e
+            logger.error(f"Error escribiendo audio en {self.file_path}: {e}")
+        finally:
+            self._ring.consume(size)
+
+    def _write_views(self, views):
+        for view in views:
+            self._write_block(view)
+
+    def _run(self):
+        ring = self._ring
+        while not self._stopping:
+            # Despertar al llenarse un bloque o, como mucho, cada flush_interval
+            ring.data_ready.wait(self.flush_interval)
+            ring.data_ready.clear()
+            self._drain()
+        self._drain()
+
+    def _open_output(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self._file = open(self.file_path, 'wb')
+        self._file.write(build_wav_header(0, self.sample_rate, self.channels, self.sample_width))
+
+    def _write_block(self, block):
+        self._file.write(block)
+        self.bytes_written += len(block)
+
+    def _close_output(self):
+        # Alinear al tamaño de frame para que el WAV sea válido
+        frame_size = self.channels * self.sample_width
+        data_size = self.bytes_written - (self.bytes_written % frame_size)
+        if data_size != self.bytes_written:
+            self._file.truncate(WAV_HEADER_SIZE + data_size)
+            self.bytes_written = data_size
+
+        patch_wav_header(self._file, data_size)
+        self._file.close()
+
+    @property
+    def buffered_bytes(self):
+        """Bytes pendientes de escribir"""
+        return len(self._ring)
+
+    @property
+    def queue_depth(self):
+        """Bloques completos esperando al hilo escritor"""
+        return len(self._ring) // self.buffer_size
+
+    def close(self):
+        """
+        Vacía los datos pendientes, corrige la cabecera y cierra el archivo
+
+        Returns:
+            Ruta al archivo (o directorio de sesión) escrito
+        """
+        if self._closed:
+            return self.file_path
+        self._closed = True
+        self._stopping = True
+        self._ring.data_ready.set()
+        self._thread.join()
+
+        self._close_output()
+
+        if self._error is not None:
+            raise self._error
+        return self.file_path
+
+
+def write_manifest(session_dir, manifest):
+    """
+    Escribe el manifiesto de una sesión de forma atómica
+
+    Args:
+        session_dir: Directorio de la sesión
+        manifest: Diccionario con los metadatos de la sesión
+    """
+    manifest_path = os.path.join(session_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(session_dir):
+    """
+    Lee el manifiesto de una sesión
+
+    Args:
+        session_dir: Directorio de la sesión
+
+    Returns:
+        Diccionario con los metadatos o None si no existe o está dañado
+    """
+    try:
+        with open(os.path.join(session_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class SegmentedRecordingWriter(StreamingWavWriter):
+    """
+    Variante de StreamingWavWriter que escribe segmentos WAV de duración fija.
+
+    Cada segmento cerrado queda con su cabecera corregida y se anota en el
+    manifiesto de la sesión, así que una caída del proceso solo pierde lo que
+    aún estaba en el buffer. El cambio de segmento ocurre en el hilo escritor,
+    nunca en el de recepción de voz.
+    """
+
+    def __init__(self, session_dir, sample_rate=48000, channels=2, sample_width=2,
+                 segment_duration=60, metadata=None, **kwargs):
+        self.session_dir = session_dir
+        self.segment_bytes = segment_duration * sample_rate * channels * sample_width
+        self.metadata = metadata or {}
+        self._segment_file = None
+        self._segment_bytes_written = 0
+        self._segment_index = 0
+        self.manifest = None
+        super().__init__(session_dir, sample_rate=sample_rate, channels=channels,
+                         sample_width=sample_width, **kwargs)
+
+    def _open_output(self):
+        os.makedirs(self.session_dir, exist_ok=True)
+        self.manifest = {
+            'version': 1,
+            'status': 'recording',
+            'started': datetime.datetime.now().isoformat(),
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'sample_width': self.sample_width,
+            'segments': [],
+            **self.metadata
+        }
+        write_manifest(self.session_dir, self.manifest)
+
+    def _segment_path(self, index):
+        return os.path.join(self.session_dir, f"segment_{index:05d}.wav")
+
+    def _open_segment(self):
+        self._segment_file = open(self._segment_path(self._segment_index), 'wb')
+        self._segment_file.write(build_wav_header(0, self.sample_rate, self.channels, self.sample_width))
+        self._segment_bytes_written = 0
+
+    def _close_segment(self):
+        frame_size = self.channels * self.sample_width
+        data_size = self._segment_bytes_written - (self._segment_bytes_written % frame_size)
+        if data_size != self._segment_bytes_written:
+            self._segment_file.truncate(WAV_HEADER_SIZE + data_size)
+            self.bytes_written -= self._segment_bytes_written - data_size
+
+        patch_wav_header(self._segment_file, data_size)
+        self._segment_file.flush()
+        os.fsync(self._segment_file.fileno())
+        self._segment_file.close()
+        self._segment_file = None
+
+        self.manifest['segments'].append({
+            'file': os.path.basename(self._segment_path(self._segment_index)),
+            'bytes': data_size
+        })
+        write_manifest(self.session_dir, self.manifest)
+        self._segment_index += 1
+
+    def _write_block(self, block):
+        view = memoryview(block)
+        while view:
+            if self._segment_file is None:
+                self._open_segment()
+            room = self.segment_bytes - self._segment_bytes_written
+            part = view[:room]
+            self._segment_file.write(part)
+            self._segment_bytes_written += len(part)
+            self.bytes_written += len(part)
+            view = view[len(part):]
+            if self._segment_bytes_written >= self.segment_bytes:
+                self._close_segment()
+
+    def _close_output(self):
+        if self._segment_file is not None:
+            self._close_segment()
+        self.manifest['status'] = 'closed'
+        write_manifest(self.session_dir, self.manifest)
+
+
+def _session_segments(session_dir):
+    """Segmentos de una sesión en orden, con los bytes de audio aprovechables de cada uno"""
+    manifest = read_manifest(session_dir) or {}
+    frame_size = manifest.get('channels', 2) * manifest.get('sample_width', 2)
+
+    segments = []
+    for segment in sorted(f for f in os.listdir(session_dir) if f.startswith('segment_') and f.endswith('.wav')):
+        segment_path = os.path.join(session_dir, segment)
+        size = os.path.getsize(segment_path) - WAV_HEADER_SIZE
+        size -= size % frame_size
+        if size > 0:
+            segments.append((segment_path, size))
+    return segments
+
+
+def session_data_size(session_dir):
+    """Bytes de audio PCM que contiene una sesión"""
+    return sum(size for _, size in _session_segments(session_dir))
+
+
+def iter_session_pcm(session_dir, copy_buffer_size=1024 * 1024):
+    """
+    Recorre el audio PCM de los segmentos de una sesión, en orden
+
+    Se usan los tamaños reales de los archivos en disco, de modo que también
+    se recupera el segmento que quedó a medias si el proceso se cayó.
+
+    Args:
+        session_dir: Directorio de la sesión
+        copy_buffer_size: Tamaño de cada bloque
+
+    Yields:
+        Bloques de audio PCM
+    """
+    for segment_path, size in _session_segments(session_dir):
+        with open(segment_path, 'rb') as f:
+            f.seek(WAV_HEADER_SIZE)
+            remaining = size
+            while remaining:
+                chunk = f.read(min(copy_buffer_size, remaining))
+                if not chunk:
+                    break
+                yield chunk
+                remaining -= len(chunk)
+
+
+def stitch_segments(session_dir, output_path, copy_buffer_size=1024 * 1024):
+    """
+    Une los segmentos de una sesión en un único archivo WAV
+
+    Args:
+        session_dir: Directorio de la sesión
+        output_path: Ruta del WAV resultante
+        copy_buffer_size: Tamaño del bloque de copia
+
+    Returns:
+        Número de bytes de audio escritos
+    """
+    manifest = read_manifest(session_dir) or {}
+    sample_rate = manifest.get('sample_rate', 48000)
+    channels = manifest.get('channels', 2)
+    sample_width = manifest.get('sample_width', 2)
+
+    data_size = 0
+    with open(output_path, 'wb') as out:
+        out.write(build_wav_header(0, sample_rate, channels, sample_width))
+        for chunk in iter_session_pcm(session_dir, copy_buffer_size):
+            out.write(chunk)
+            data_size += len(chunk)
+        patch_wav_header(out, data_size)
+
+    return data_size
+
+
+def remove_session(session_dir):
+    """Elimina el directorio de una sesión ya unida"""
+    shutil.rmtree(session_dir, ignore_errors=True)
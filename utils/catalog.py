@@ -0,0 +1,300 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+import config
+from utils import metrics
+
+logger = logging.getLogger('discord-recording-bot.catalog')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    base_name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    guild_id INTEGER,
+    channel_id INTEGER,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    format TEXT NOT NULL,
+    duration_ms INTEGER,
+    speech_ratio REAL
+);
+CREATE INDEX IF NOT EXISTS recordings_name ON recordings (name);
+CREATE INDEX IF NOT EXISTS recordings_base_name ON recordings (base_name, created);
+CREATE INDEX IF NOT EXISTS recordings_guild ON recordings (guild_id, channel_id, created);
+CREATE INDEX IF NOT EXISTS recordings_date ON recordings (date);
+CREATE INDEX IF NOT EXISTS recordings_size ON recordings (size);
+"""
+
+# Nombre por defecto de las grabaciones: grabacion_{servidor}_{canal}_{timestamp}
+_DEFAULT_NAME = re.compile(r'^grabacion_(\d+)_(\d+)_')
+# Sufijo _HHMMSS que save_recording añade al nombre elegido por el usuario
+_TIME_SUFFIX = re.compile(r'_\d{6}$')
+
+
+class RecordingCatalog:
+    """
+    Índice persistente de las grabaciones guardadas.
+
+    Se actualiza al guardar y al borrar grabaciones, de modo que las
+    búsquedas por nombre, servidor, canal, fecha o tamaño no recorren el
+    directorio de grabaciones ni consultan el sistema de archivos.
+    reconcile() lo sincroniza con el disco al arrancar.
+
+    Incluye también las grabaciones que el servicio de retención ha movido
+    al directorio de archivo, con la misma organización por fechas.
+    """
+
+    def __init__(self, db_path, recordings_dir, archive_dir=None):
+        self.db_path = db_path
+        self.recordings_dir = recordings_dir
+        self.archive_dir = archive_dir
+        self.roots = [recordings_dir] + ([archive_dir] if archive_dir else [])
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(recordings)")}
+        if 'duration_ms' not in columns:
+            # Catálogos creados antes de los resúmenes de audio
+            self._conn.execute("ALTER TABLE recordings ADD COLUMN duration_ms INTEGER")
+            self._conn.execute("ALTER TABLE recordings ADD COLUMN speech_ratio REAL")
+        self._conn.commit()
+
+    def _entry(self, path, guild_id=None, channel_id=None):
+        stat = os.stat(path)
+        root = next((root for root in self.roots if path.startswith(root + os.sep)), self.recordings_dir)
+        rel_dir = os.path.relpath(os.path.dirname(path), root)
+        name, ext = os.path.splitext(os.path.basename(path))
+
+        if guild_id is None:
+            match = _DEFAULT_NAME.match(name)
+            if match:
+                guild_id, channel_id = int(match.group(1)), int(match.group(2))
+
+        return (
+            path,
+            name,
+            _TIME_SUFFIX.sub('', name),
+            rel_dir if rel_dir != "." else "sin_fecha",
+            guild_id,
+            channel_id,
+            stat.st_size,
+            stat.st_ctime,
+            ext.lstrip('.')
+        )
+
+    def add(self, path, guild_id=None, channel_id=None, duration_ms=None, speech_ratio=None):
+        """
+        Registra (o actualiza) una grabación en el catálogo
+
+        Args:
+            path: Ruta al archivo de la grabación
+            guild_id: ID del servidor donde se grabó (opcional)
+            channel_id: ID del canal de voz donde se grabó (opcional)
+            duration_ms: Duración según el resumen de la grabación (opcional)
+            speech_ratio: Proporción de voz según el resumen (opcional)
+        """
+        entry = self._entry(path, guild_id, channel_id) + (duration_ms, speech_ratio)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recordings "
+                "(path, name, base_name, date, guild_id, channel_id, size, created, format, duration_ms, speech_ratio) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                entry
+            )
+
+    def remove(self, path):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM recordings WHERE path = ?", (path,))
+
+    def relocate(self, old_path, new_path):
+        """
+        Actualiza una grabación que se ha movido o recodificado
+
+        Conserva el servidor, el canal, la fecha de creación originales (al
+        mover un archivo cambia su ctime, y las políticas de retención se
+        basan en la antigüedad) y los datos del resumen.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM recordings WHERE path = ?", (old_path,)).fetchone()
+        entry = list(self._entry(new_path, row['guild_id'] if row else None, row['channel_id'] if row else None))
+        if row is not None:
+            entry[7] = row['created']
+            entry += [row['duration_ms'], row['speech_ratio']]
+        else:
+            entry += [None, None]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM recordings WHERE path = ?", (old_path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recordings "
+                "(path, name, base_name, date, guild_id, channel_id, size, created, format, duration_ms, speech_ratio) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                entry
+            )
+
+    def usage_by_guild(self):
+        """
+        Returns:
+            Diccionario {guild_id: (grabaciones, bytes)}; las grabaciones sin
+            servidor conocido aparecen con la clave None
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT guild_id, COUNT(*), SUM(size) FROM recordings GROUP BY guild_id").fetchall()
+        return {guild_id: (count, size or 0) for guild_id, count, size in rows}
+
+    def oldest(self, guild_id, created_before=None, root=None, limit=20):
+        """
+        Grabaciones más antiguas de un servidor, para el servicio de retención
+
+        Args:
+            guild_id: ID del servidor (None para las grabaciones sin servidor)
+            created_before: Solo las creadas antes de este instante (opcional)
+            root: Solo las que están bajo este directorio (opcional)
+            limit: Número máximo de grabaciones
+
+        Returns:
+            Lista de diccionarios, de la más antigua a la más reciente
+        """
+        query = "SELECT * FROM recordings WHERE guild_id IS ?"
+        params = [guild_id]
+        if created_before is not None:
+            query += " AND created < ?"
+            params.append(created_before)
+        if root is not None:
+            prefix = root + os.sep
+            query += " AND substr(path, 1, ?) = ?"
+            params += [len(prefix), prefix]
+        query += " ORDER BY created LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params).fetchall()]
+
+    def guild_of(self, name):
+        """
+        Servidor de una grabación por su nombre exacto (el del archivo, sin extensión)
+
+        Returns:
+            ID del servidor o None si la grabación no está o no se conoce su servidor
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT guild_id FROM recordings WHERE name = ? AND guild_id IS NOT NULL "
+                "ORDER BY created DESC LIMIT 1", (name,)).fetchone()
+        return row['guild_id'] if row else None
+
+    def find(self, name, guild_id=None):
+        """
+        Busca la grabación más reciente por nombre
+
+        Primero por nombre exacto (con o sin el sufijo de hora) usando los
+        índices y, si no hay coincidencia, por subcadena como hacía la
+        búsqueda original en disco.
+
+        Args:
+            name: Nombre (o parte del nombre) de la grabación
+            guild_id: Restringir la búsqueda a un servidor (opcional)
+
+        Returns:
+            Diccionario con la grabación o None si no se encuentra
+        """
+        started = time.perf_counter()
+        guild_filter = " AND guild_id = ?" if guild_id is not None else ""
+        guild_params = (guild_id,) if guild_id is not None else ()
+        queries = (
+            ("SELECT * FROM recordings WHERE (base_name = ? OR name = ?)" + guild_filter
+             + " ORDER BY created DESC LIMIT 1", (name, name) + guild_params),
+            ("SELECT * FROM recordings WHERE instr(name, ?) > 0" + guild_filter
+             + " ORDER BY created DESC LIMIT 1", (name,) + guild_params),
+        )
+        try:
+            with self._lock:
+                for query, params in queries:
+                    row = self._conn.execute(query, params).fetchone()
+                    if row is not None:
+                        return dict(row)
+            return None
+        finally:
+            metrics.catalog_lookup.observe(time.perf_counter() - started, ('find',))
+
+    def list(self, guild_id=None, channel_id=None, date=None, min_size=None):
+        """
+        Lista las grabaciones del catálogo, opcionalmente filtradas
+
+        Returns:
+            Lista de diccionarios con name, date, path, created, size, guild_id, channel_id y format
+        """
+        started = time.perf_counter()
+        conditions, params = [], []
+        for column, value in (('guild_id', guild_id), ('channel_id', channel_id), ('date', date)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_size is not None:
+            conditions.append("size >= ?")
+            params.append(min_size)
+
+        query = "SELECT * FROM recordings"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY date DESC, name"
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(query, params).fetchall()]
+        metrics.catalog_lookup.observe(time.perf_counter() - started, ('list',))
+        return rows
+
+    def reconcile(self, extensions):
+        """
+        Sincroniza el catálogo con el disco: añade los archivos que falten y
+        elimina las entradas cuyos archivos ya no existen
+
+        Args:
+            extensions: Extensiones de archivo que se consideran grabaciones
+
+        Returns:
+            Tupla (añadidas, eliminadas)
+        """
+        with self._lock:
+            known = {row[0] for row in self._conn.execute("SELECT path FROM recordings")}
+
+        on_disk = set()
+        for top in self.roots:
+            for root, dirs, files in os.walk(top):
+                # No entrar en las sesiones en curso ni en los temporales del archivo
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for file in files:
+                    if file.rsplit('.', 1)[-1] in extensions:
+                        on_disk.add(os.path.join(root, file))
+
+        added = 0
+        for path in on_disk - known:
+            try:
+                self.add(path)
+                added += 1
+            except OSError as e:
+                logger.warning(f"No se pudo catalogar {path}: {e}")
+
+        missing = known - on_disk
+        if missing:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM recordings WHERE path = ?", [(p,) for p in missing])
+
+        return added, len(missing)
+
+
+_catalog = None
+
+
+def get_catalog():
+    """Devuelve el catálogo compartido del proceso"""
+    global _catalog
+    if _catalog is None:
+        _catalog = RecordingCatalog(config.CATALOG_DB, config.RECORDINGS_DIR, config.ARCHIVE_DIR)
+    return _catalog
@@ -0,0 +1,132 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import config
+
+logger = logging.getLogger('discord-recording-bot.executors')
+
+
+class JobExecutor:
+    """
+    Capa de ejecución para el trabajo bloqueante del bot.
+
+    - Pool de hilos para E/S (disco, peticiones HTTP de reconocimiento)
+    - Pool de procesos, creado bajo demanda, para el trabajo de CPU (decodificación, VAD)
+
+    Cada servidor tiene un límite de trabajos simultáneos para que uno solo
+    no acapare los pools. La cancelación no es cosa del ejecutor: la hace
+    quien es dueño de la tarea (la cola de transcripción con !cancelar).
+    """
+
+    def __init__(self, io_workers=8, cpu_workers=2, guild_max_jobs=2):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.guild_max_jobs = guild_max_jobs
+        self._io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='bot-io')
+        self._cpu_pool = None
+        self._guild_semaphores = {}  # {guild_id: asyncio.Semaphore}
+        self._guild_tasks = {}  # {guild_id: set(asyncio.Task)}
+
+    def _get_cpu_pool(self):
+        if self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        return self._cpu_pool
+
+    def _semaphore(self, guild_id):
+        semaphore = self._guild_semaphores.get(guild_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.guild_max_jobs)
+            self._guild_semaphores[guild_id] = semaphore
+        return semaphore
+
+    async def _submit(self, pool, func, args, kwargs, guild_id):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        if guild_id is None:
+            return await loop.run_in_executor(pool, call)
+
+        task = asyncio.current_task()
+        tasks = self._guild_tasks.setdefault(guild_id, set())
+        tasks.add(task)
+        try:
+            async with self._semaphore(guild_id):
+                return await loop.run_in_executor(pool, call)
+        finally:
+            tasks.discard(task)
+            if not tasks:
+                self._guild_tasks.pop(guild_id, None)
+
+    async def run_io(self, func, *args, guild_id=None, **kwargs):
+        """
+        Ejecuta una función bloqueante de E/S en el pool de hilos
+
+        Args:
+            func: Función a ejecutar
+            guild_id: Servidor al que se atribuye el trabajo (para el reparto)
+
+        Returns:
+            Resultado de la función
+        """
+        return await self._submit(self._io_pool, func, args, kwargs, guild_id)
+
+    async def run_cpu(self, func, *args, guild_id=None, **kwargs):
+        """
+        Ejecuta una función de CPU en el pool de procesos
+
+        La función y sus argumentos deben poder serializarse con pickle.
+
+        Args:
+            func: Función a ejecutar
+            guild_id: Servidor al que se atribuye el trabajo (para el reparto)
+
+        Returns:
+            Resultado de la función
+        """
+        return await self._submit(self._get_cpu_pool(), func, args, kwargs, guild_id)
+
+    def active_jobs(self, guild_id):
+        """Número de trabajos en espera o en ejecución de un servidor"""
+        return len(self._guild_tasks.get(guild_id, ()))
+
+    def shutdown(self):
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor = None
+
+
+def get_executor():
+    """Devuelve la instancia compartida de JobExecutor, creándola con la configuración"""
+    global _executor
+    if _executor is None:
+        _executor = JobExecutor(
+            io_workers=config.IO_WORKERS,
+            cpu_workers=config.CPU_WORKERS,
+            guild_max_jobs=config.GUILD_MAX_JOBS
+        )
+    return _executor
+
+
+# Último retraso medido del bucle de eventos (en segundos)
+loop_lag = 0.0
+
+
+async def monitor_loop_lag(interval=1.0, warning_threshold=0.05):
+    """
+    Mide periódicamente cuánto se retrasa el bucle de eventos respecto a lo previsto
+
+    Args:
+        interval: Segundos entre mediciones
+        warning_threshold: Retraso (en segundos) a partir del cual se registra un aviso
+    """
+    global loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag = max(loop.time() - expected, 0.0)
+        if loop_lag > warning_threshold:
+            logger.warning(f"El bucle de eventos se retrasó {loop_lag * 1000:.1f} ms")
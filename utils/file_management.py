@@ -1,15 +1,31 @@
 import os
+import json
+import shutil
 import wave
 import datetime
 import logging
 import config
+from utils.audio_writer import read_manifest, remove_session
+from utils.audio_codec import AUDIO_EXTENSIONS, cut_file, storage_format, write_session_audio
+from utils.audio_summary import remove_summary, save_summary
+from utils.transcription_cache import get_cache
+from utils.catalog import get_catalog
+from utils.search_index import get_search_index
+from utils.wav_reader import write_clip
 
 logger = logging.getLogger('discord-recording-bot.file_management')
 
 
-def save_recording(audio_data, name, date=None, sample_rate=48000, channels=2):
+def ensure_directories():
+    """Crea los directorios de trabajo del bot si no existen (se llama una vez al arrancar)"""
+    for path in (config.RECORDINGS_DIR, config.TRANSCRIPTIONS_DIR, config.TRACKS_DIR, config.DATA_DIR):
+        os.makedirs(path, exist_ok=True)
+
+
+def save_recording(audio_data, name, date=None, sample_rate=48000, channels=2, guild_id=None, channel_id=None,
+                   summary=None):
     """
-    Guarda los datos de audio en un archivo WAV
+    Guarda los datos de audio en un archivo WAV (modo de grabación en memoria)
 
     Args:
         audio_data: Datos binarios del audio en formato WAV
@@ -17,30 +33,22 @@ def save_recording(audio_data, name, date=None, sample_rate=48000, channels=2):
         date: Fecha para organizar las grabaciones (formato YYYY-MM-DD)
         sample_rate: Frecuencia de muestreo del audio
         channels: Número de canales de audio
+        guild_id: ID del servidor donde se grabó (para el catálogo)
+        channel_id: ID del canal de voz donde se grabó (para el catálogo)
+        summary: Resumen calculado durante la grabación (AudioSummaryBuilder.finish, opcional)
 
     Returns:
         Ruta al archivo guardado
     """
     try:
-        # Sanitizar el nombre del archivo
-        name = sanitize_filename(name)
-
-        # Si no se proporciona fecha, usar la actual
-        if not date:
-            date = datetime.datetime.now().strftime("%Y-%m-%d")
-
-        # Crear directorio para la fecha si no existe
-        dir_path = os.path.join(config.RECORDINGS_DIR, date)
-        os.makedirs(dir_path, exist_ok=True)
-
-        # Crear ruta completa
-        timestamp = datetime.datetime.now().strftime("%H%M%S")
-        file_path = os.path.join(dir_path,
-                                 f"{name}_{timestamp}.{config.AUDIO_FORMAT}")
+        # Los datos en memoria ya vienen como WAV
+        file_path = build_recording_path(name, date, fmt='wav')
 
         # Guardar el archivo si los datos son un BytesIO
         with open(file_path, 'wb') as f:
             f.write(audio_data)
+        get_catalog().add(file_path, guild_id=guild_id, channel_id=channel_id, **_summary_columns(summary))
+        _save_summary(file_path, summary)
 
         logger.info(f"Grabación guardada en {file_path}")
         return file_path
@@ -50,6 +58,215 @@ def save_recording(audio_data, name, date=None, sample_rate=48000, channels=2):
         raise
 
 
+def build_recording_path(name, date=None, fmt=None):
+    """
+    Construye la ruta definitiva de una grabación y crea su directorio
+
+    Args:
+        name: Nombre base para el archivo
+        date: Fecha para organizar las grabaciones (formato YYYY-MM-DD)
+        fmt: Formato del archivo (por defecto el de almacenamiento configurado)
+
+    Returns:
+        Ruta completa del archivo de grabación
+    """
+    # Sanitizar el nombre del archivo
+    name = sanitize_filename(name)
+
+    # Si no se proporciona fecha, usar la actual
+    if not date:
+        date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    # Crear directorio para la fecha si no existe
+    dir_path = os.path.join(config.RECORDINGS_DIR, date)
+    os.makedirs(dir_path, exist_ok=True)
+
+    # Crear ruta completa
+    timestamp = datetime.datetime.now().strftime("%H%M%S")
+    return os.path.join(dir_path, f"{name}_{timestamp}.{fmt or storage_format()}")
+
+
+def build_session_dir(guild_id, channel_id):
+    """
+    Construye el directorio donde se escriben los segmentos de una grabación en curso
+
+    Args:
+        guild_id: ID del servidor
+        channel_id: ID del canal de voz
+
+    Returns:
+        Ruta del directorio de la sesión
+    """
+    timestamp = int(datetime.datetime.now().timestamp())
+    return os.path.join(config.IN_PROGRESS_DIR, f"{guild_id}_{channel_id}_{timestamp}")
+
+
+def get_tracks_dir(recording_path):
+    """
+    Devuelve el directorio de pistas por hablante asociado a una grabación
+
+    Args:
+        recording_path: Ruta al archivo de la grabación mezclada
+
+    Returns:
+        Ruta al directorio de pistas o None si la grabación no tiene pistas
+    """
+    base_name = os.path.splitext(os.path.basename(recording_path))[0]
+    # Las pistas de las grabaciones archivadas se mueven con ellas
+    for root in (config.TRACKS_DIR, config.ARCHIVE_TRACKS_DIR):
+        tracks_dir = os.path.join(root, base_name)
+        if os.path.isdir(tracks_dir):
+            return tracks_dir
+    return None
+
+
+def _stitch_tracks(session_dir, file_path, timeline=None):
+    """
+    Une los segmentos de cada pista de hablante de una sesión
+
+    Las pistas Ogg/Opus, que ya se escribieron como un único archivo, solo se mueven.
+
+    Args:
+        session_dir: Directorio de la sesión
+        file_path: Ruta definitiva de la grabación mezclada
+        timeline: Índice de la línea de tiempo de las pistas (opcional)
+
+    Returns:
+        Directorio con las pistas o None si la sesión no tenía pistas
+    """
+    tracks_root = os.path.join(session_dir, 'tracks')
+    if not os.path.isdir(tracks_root):
+        return None
+
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    tracks_dir = os.path.join(config.TRACKS_DIR, base_name)
+    os.makedirs(tracks_dir, exist_ok=True)
+
+    fmt = storage_format()
+    for entry in sorted(os.listdir(tracks_root)):
+        track_session = os.path.join(tracks_root, entry)
+        if os.path.isdir(track_session):
+            write_session_audio(track_session, os.path.join(tracks_dir, f"{entry}.{fmt}"))
+        elif entry.endswith('.ogg'):
+            shutil.move(track_session, os.path.join(tracks_dir, entry))
+
+    if timeline is not None:
+        with open(os.path.join(tracks_dir, 'timeline.json'), 'w', encoding='utf-8') as f:
+            json.dump(timeline, f)
+
+    return tracks_dir
+
+
+def finalize_recording(session_dir, name, date=None, timeline=None, guild_id=None, channel_id=None, summary=None):
+    """
+    Une los segmentos de una grabación en streaming en su ubicación definitiva
+
+    Args:
+        session_dir: Directorio de la sesión ya cerrada
+        name: Nombre base para el archivo
+        date: Fecha para organizar las grabaciones (formato YYYY-MM-DD)
+        timeline: Índice de la línea de tiempo de las pistas por hablante (opcional)
+        guild_id: ID del servidor donde se grabó (para el catálogo)
+        channel_id: ID del canal de voz donde se grabó (para el catálogo)
+        summary: Resumen calculado durante la grabación (AudioSummaryBuilder.finish, opcional)
+
+    Returns:
+        Ruta al archivo guardado
+    """
+    try:
+        file_path = build_recording_path(name, date)
+        write_session_audio(session_dir, file_path)
+        _stitch_tracks(session_dir, file_path, timeline)
+        get_catalog().add(file_path, guild_id=guild_id, channel_id=channel_id, **_summary_columns(summary))
+        _save_summary(file_path, summary)
+        remove_session(session_dir)
+
+        logger.info(f"Grabación guardada en {file_path}")
+        return file_path
+
+    except Exception as e:
+        logger.error(f"Error al guardar la grabación: {e}")
+        raise
+
+
+def _summary_columns(summary):
+    # Lo que !listar muestra de cada grabación se guarda en el catálogo para no abrir los resúmenes
+    if summary is None:
+        return {}
+    return {'duration_ms': summary['duration_ms'], 'speech_ratio': summary['speech_ratio']}
+
+
+def _save_summary(file_path, summary):
+    # Sin resumen la grabación sigue siendo válida: quien lo necesite leerá el audio
+    if summary is None:
+        return
+    try:
+        save_summary(file_path, summary)
+    except Exception as e:
+        logger.error(f"No se pudo guardar el resumen de {file_path}: {e}")
+
+
+def discard_session(session_dir):
+    """
+    Elimina una sesión en curso sin guardarla
+
+    Args:
+        session_dir: Directorio de la sesión
+    """
+    remove_session(session_dir)
+
+
+def recover_sessions(owns_guild=None):
+    """
+    Busca grabaciones que quedaron sin finalizar (caída o reinicio del proceso)
+    y une sus segmentos en un archivo válido
+
+    Args:
+        owns_guild: Función opcional owns_guild(guild_id); con shards, cada proceso
+                    solo recupera las sesiones de sus servidores (las de otros
+                    pueden seguir grabándose)
+
+    Returns:
+        Lista de rutas de las grabaciones recuperadas
+    """
+    recovered = []
+    if not os.path.isdir(config.IN_PROGRESS_DIR):
+        return recovered
+
+    for entry in sorted(os.listdir(config.IN_PROGRESS_DIR)):
+        session_dir = os.path.join(config.IN_PROGRESS_DIR, entry)
+        if not os.path.isdir(session_dir):
+            continue
+
+        manifest = read_manifest(session_dir)
+        if manifest is None:
+            logger.warning(f"Sesión sin manifiesto, se ignora: {session_dir}")
+            continue
+        if owns_guild is not None and not owns_guild(manifest.get('guild_id')):
+            continue
+
+        started = manifest.get('started', '')
+        date = started[:10] or None
+        name = manifest.get('name') or f"grabacion_{entry}_recuperada"
+
+        try:
+            file_path = build_recording_path(name, date)
+            if write_session_audio(session_dir, file_path) == 0:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                logger.info(f"Sesión vacía descartada: {session_dir}")
+            else:
+                _stitch_tracks(session_dir, file_path)
+                get_catalog().add(file_path, guild_id=manifest.get('guild_id'), channel_id=manifest.get('channel_id'))
+                recovered.append(file_path)
+                logger.info(f"Grabación recuperada en {file_path}")
+            remove_session(session_dir)
+        except Exception as e:
+            logger.error(f"Error al recuperar la sesión {session_dir}: {e}")
+
+    return recovered
+
+
 def sanitize_filename(filename):
     """
     Elimina caracteres no válidos para nombres de archivo
@@ -74,59 +291,78 @@ def sanitize_filename(filename):
     return filename
 
 
-def get_recording_path(name):
+def get_recording_path(name, guild_id=None):
     """
-    Busca un archivo de grabación por nombre
+    Busca un archivo de grabación por nombre en el catálogo
 
     Args:
         name: Nombre de la grabación a buscar
+        guild_id: Restringir la búsqueda a un servidor (opcional)
 
     Returns:
         Ruta al archivo o None si no se encuentra
     """
-    for root, _, files in os.walk(config.RECORDINGS_DIR):
-        for file in files:
-            if name in file and file.endswith(f".{config.AUDIO_FORMAT}"):
-                return os.path.join(root, file)
-
-    return None
+    recording = get_catalog().find(name, guild_id=guild_id)
+    return recording['path'] if recording else None
 
 
-def list_recordings():
+def list_recordings(guild_id=None, channel_id=None, date=None, min_size=None):
     """
-    Lista todas las grabaciones disponibles
+    Lista las grabaciones disponibles según el catálogo
+
+    Args:
+        guild_id: Filtrar por servidor (opcional)
+        channel_id: Filtrar por canal de voz (opcional)
+        date: Filtrar por fecha YYYY-MM-DD (opcional)
+        min_size: Tamaño mínimo en bytes (opcional)
 
     Returns:
-        Lista de diccionarios con información de las grabaciones
+        Lista de diccionarios con información de las grabaciones (duration_ms
+        y speech_ratio a None si la grabación no tiene resumen)
     """
-    recordings = []
+    recordings = get_catalog().list(guild_id=guild_id, channel_id=channel_id, date=date, min_size=min_size)
+    for recording in recordings:
+        recording['created'] = datetime.datetime.fromtimestamp(recording['created'])
+    return recordings
 
-    for root, _, files in os.walk(config.RECORDINGS_DIR):
-        for file in files:
-            if file.endswith(f".{config.AUDIO_FORMAT}"):
-                # Extraer fecha de la ruta
-                rel_path = os.path.relpath(root, config.RECORDINGS_DIR)
 
-                # Si la ruta relativa es ".", estamos en el directorio base
-                date = rel_path if rel_path != "." else "sin_fecha"
+def reconcile_catalog():
+    """
+    Sincroniza el catálogo de grabaciones con el contenido del disco
 
-                # Extraer nombre base (sin extensión)
-                name = os.path.splitext(file)[0]
+    Returns:
+        Tupla (añadidas, eliminadas)
+    """
+    added, removed = get_catalog().reconcile(set(AUDIO_EXTENSIONS))
+    if added or removed:
+        logger.info(f"Catálogo sincronizado: {added} grabaciones añadidas, {removed} eliminadas")
+    return added, removed
 
-                # Obtener fecha de creación del archivo
-                file_path = os.path.join(root, file)
-                created_time = datetime.datetime.fromtimestamp(
-                    os.path.getctime(file_path))
 
-                recordings.append({
-                    'name': name,
-                    'date': date,
-                    'path': file_path,
-                    'created': created_time,
-                    'size': os.path.getsize(file_path)
-                })
+def extract_clip(recording_path, start_ms, end_ms):
+    """
+    Recorta un fragmento de una grabación en CLIPS_DIR
 
-    return recordings
+    Los WAV se recortan sobre el archivo mapeado en memoria, copiando solo
+    el intervalo; los formatos comprimidos, con ffmpeg.
+
+    Args:
+        recording_path: Ruta a la grabación
+        start_ms: Inicio del fragmento en milisegundos
+        end_ms: Fin del fragmento en milisegundos
+
+    Returns:
+        Tupla (ruta del fragmento, duración en milisegundos); la duración es 0
+        si el intervalo queda fuera de la grabación
+    """
+    os.makedirs(config.CLIPS_DIR, exist_ok=True)
+    base_name, ext = os.path.splitext(os.path.basename(recording_path))
+    clip_path = os.path.join(
+        config.CLIPS_DIR, f"{base_name}_{start_ms // 1000}-{end_ms // 1000}_{os.urandom(3).hex()}{ext}")
+    if ext == '.wav':
+        return clip_path, write_clip(recording_path, clip_path, start_ms, end_ms)
+    cut_file(recording_path, clip_path, start_ms, end_ms)
+    return clip_path, end_ms - start_ms
 
 
 def delete_recording(name):
@@ -143,18 +379,41 @@ def delete_recording(name):
 
     if path and os.path.exists(path):
         try:
-            os.remove(path)
-
-            # Eliminar transcripción si existe
-            transcript_path = os.path.join(
-                config.TRANSCRIPTIONS_DIR,
-                os.path.splitext(os.path.basename(path))[0] + ".txt")
-
-            if os.path.exists(transcript_path):
-                os.remove(transcript_path)
-
+            delete_recording_file(path)
             return True
         except Exception as e:
             logger.error(f"Error al eliminar grabación: {e}")
 
     return False
+
+
+def delete_recording_file(path):
+    """
+    Elimina el archivo de una grabación junto con su transcripción, su
+    resumen, sus pistas por hablante y sus entradas en el catálogo, la caché
+    y el índice
+
+    Args:
+        path: Ruta al archivo de la grabación
+    """
+    os.remove(path)
+    get_catalog().remove(path)
+
+    # Eliminar transcripción si existe
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    transcript_path = os.path.join(config.TRANSCRIPTIONS_DIR, base_name + ".txt")
+
+    if os.path.exists(transcript_path):
+        os.remove(transcript_path)
+    get_search_index().remove(base_name)
+    remove_summary(path)
+
+    # Olvidar la huella memorizada del archivo en la caché de transcripciones
+    cache = get_cache()
+    if cache is not None:
+        cache.forget_path(path)
+
+    # Eliminar las pistas por hablante si existen
+    tracks_dir = get_tracks_dir(path)
+    if tracks_dir:
+        shutil.rmtree(tracks_dir, ignore_errors=True)
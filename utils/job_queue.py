@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger('discord-recording-bot.job_queue')
+
+# Prioridades de los trabajos (mayor número, antes se procesa)
+PRIORITIES = {'alta': 10, 'normal': 5, 'baja': 0}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER,
+    recording_path TEXT NOT NULL,
+    owner TEXT,
+    priority INTEGER NOT NULL DEFAULT 5,
+    status TEXT NOT NULL DEFAULT 'pending',
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    transcript_path TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id INTEGER NOT NULL,
+    chunk_key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (job_id, chunk_key)
+);
+"""
+
+
+class TranscriptionQueue:
+    """
+    Cola persistente de trabajos de transcripción en SQLite.
+
+    Además del estado de cada trabajo se guarda el texto de cada fragmento
+    ya transcrito, de modo que un trabajo interrumpido por un reinicio
+    continúa desde el último fragmento completado.
+
+    Todos los métodos son síncronos y seguros entre hilos; el bot los llama
+    a través del pool de E/S.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'owner' not in columns:
+            # Bases creadas antes del despliegue por shards
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.commit()
+
+    def enqueue(self, guild_id, channel_id, recording_path, priority=PRIORITIES['normal'], message_id=None):
+        """
+        Añade un trabajo a la cola
+
+        Returns:
+            ID del trabajo creado
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (guild_id, channel_id, message_id, recording_path, priority, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (guild_id, channel_id, message_id, recording_path, priority, now, now)
+            )
+            return cursor.lastrowid
+
+    def set_message(self, job_id, message_id):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET message_id = ? WHERE id = ?", (message_id, job_id))
+
+    def claim_next(self, excluded_guilds=(), owner=None, shard_count=None, shard_ids=None):
+        """
+        Marca como en curso el trabajo pendiente de mayor prioridad
+
+        La selección y el cambio de estado son una sola sentencia, así que
+        dos procesos que comparten la base nunca reclaman el mismo trabajo.
+
+        Args:
+            excluded_guilds: Servidores que ya alcanzaron su límite de trabajos simultáneos
+            owner: Proceso que reclama el trabajo (ver utils.sharding.process_key)
+            shard_count: Número total de shards, si el bot se ejecuta por shards
+            shard_ids: Shards de este proceso; solo se reclaman trabajos de sus servidores
+
+        Returns:
+            Fila del trabajo reclamado o None si no hay ninguno disponible
+        """
+        excluded = list(excluded_guilds)
+        subquery = "SELECT id FROM jobs WHERE status = 'pending'"
+        params = []
+        if excluded:
+            subquery += f" AND guild_id NOT IN ({','.join('?' * len(excluded))})"
+            params += excluded
+        if shard_ids is not None:
+            subquery += f" AND ((guild_id >> 22) % ?) IN ({','.join('?' * len(shard_ids))})"
+            params += [shard_count] + list(shard_ids)
+        subquery += " ORDER BY priority DESC, id LIMIT 1"
+
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"UPDATE jobs SET status = 'running', owner = ?, updated = ? WHERE id = ({subquery}) RETURNING *",
+                [owner, time.time()] + params
+            ).fetchone()
+            return dict(row) if row is not None else None
+
+    def save_chunk(self, job_id, chunk_key, text, progress):
+        """Guarda el texto de un fragmento transcrito y el progreso del trabajo"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_chunks (job_id, chunk_key, text) VALUES (?, ?, ?)",
+                (job_id, chunk_key, text)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, updated = ? WHERE id = ?",
+                (progress, time.time(), job_id)
+            )
+
+    def completed_chunks(self, job_id):
+        """
+        Returns:
+            Diccionario {clave_fragmento: texto} de los fragmentos ya transcritos
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_key, text FROM job_chunks WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {row['chunk_key']: row['text'] for row in rows}
+
+    def finish(self, job_id, status, transcript_path=None, error=None):
+        """Marca un trabajo como terminado ('done', 'failed' o 'cancelled') y libera sus fragmentos"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, transcript_path = ?, error = ?, updated = ?, "
+                "progress = CASE WHEN ? = 'done' THEN 1.0 ELSE progress END WHERE id = ?",
+                (status, transcript_path, error, time.time(), status, job_id)
+            )
+            self._conn.execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+
+    def cancel_pending(self, guild_id):
+        """
+        Cancela los trabajos pendientes de un servidor
+
+        Returns:
+            Número de trabajos cancelados
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE guild_id = ? AND status = 'pending'",
+                (time.time(), guild_id)
+            )
+            return cursor.rowcount
+
+    def requeue_interrupted(self, owner=None):
+        """
+        Devuelve a la cola los trabajos que estaban en curso cuando el proceso se detuvo
+
+        Args:
+            owner: Solo los trabajos de este proceso (y los que no tienen dueño);
+                   los de otros procesos siguen en curso
+
+        Returns:
+            Número de trabajos reanudados
+        """
+        query = "UPDATE jobs SET status = 'pending', updated = ? WHERE status = 'running'"
+        params = [time.time()]
+        if owner is not None:
+            query += " AND (owner = ? OR owner IS NULL)"
+            params.append(owner)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(query, params)
+            return cursor.rowcount
+
+    def active_jobs(self, guild_id=None):
+        """
+        Returns:
+            Lista de trabajos pendientes o en curso (de un servidor o de todos)
+        """
+        query = "SELECT * FROM jobs WHERE status IN ('pending', 'running')"
+        params = ()
+        if guild_id is not None:
+            query += " AND guild_id = ?"
+            params = (guild_id,)
+        query += " ORDER BY status DESC, priority DESC, id"
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params).fetchall()]
+
+    def count_by_status(self):
+        """
+        Returns:
+            Diccionario {estado: número de trabajos} de los trabajos pendientes y en curso
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN ('pending', 'running') GROUP BY status"
+            ).fetchall()
+        counts = {'pending': 0, 'running': 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
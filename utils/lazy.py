@@ -0,0 +1,46 @@
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Sustituto de un módulo que lo importa al acceder al primer atributo
+
+    No se registra en sys.modules: el import real pasa por importlib (que ya
+    es seguro entre hilos) y, una vez cargado, sus atributos se copian al
+    sustituto para que los accesos siguientes no pasen por __getattr__.
+    """
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    Importa un módulo de forma diferida
+
+    El módulo se carga de verdad la primera vez que se accede a uno de sus
+    atributos. Así las dependencias pesadas (numpy, speech_recognition) no
+    retrasan el arranque de los procesos que todavía no las usan.
+
+    Args:
+        name: Nombre del módulo (por ejemplo 'numpy')
+
+    Returns:
+        El módulo, si ya estaba importado, o un sustituto diferido
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return _LazyModule(name)
+
+
+def is_loaded(name):
+    """Si el módulo ya se ha importado en este proceso"""
+    return name in sys.modules
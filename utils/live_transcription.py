@@ -0,0 +1,343 @@
+import asyncio
+import os
+import time
+import logging
+import discord
+from utils.audio_processing import recognize_pcm, _recognize_chunk, format_timestamp, format_segments, NO_SPEECH_MESSAGE
+from utils.audio_codec import decode_to_temp_wav
+from utils.resample import Resampler
+from utils.search_index import index_transcript
+from utils.executors import get_executor
+from utils.transcription_backends import get_backend
+from utils.lazy import lazy_import
+from utils import metrics
+import config
+
+logger = logging.getLogger('discord-recording-bot.live_transcription')
+
+np = lazy_import('numpy')
+
+
+class StreamingSegmenter:
+    """
+    Detección de voz incremental sobre el audio mezclado.
+
+    Recibe los bloques del mezclador a medida que se producen y corta un
+    fragmento cada vez que, tras al menos min_chunk segundos, hay un silencio
+    de min_silence_ms (o cuando se alcanza max_chunk). Es la versión en
+    streaming de utils.vad.split_on_silence: como no se conoce la grabación
+    entera, el ruido de fondo se estima sobre la marcha en lugar de con un
+    percentil.
+    """
+
+    def __init__(self, emit, sample_rate=48000, channels=2, frame_ms=30, min_silence_ms=500,
+                 min_chunk=2.0, max_chunk=15.0, padding_ms=200, min_db=-50.0, margin_db=10.0):
+        self.emit = emit
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.min_silence_frames = max(min_silence_ms // frame_ms, 1)
+        self.min_samples = int(min_chunk * sample_rate)
+        self.max_samples = int(max_chunk * sample_rate)
+        self.padding_samples = padding_ms * sample_rate // 1000
+        self.min_db = min_db
+        self.margin_db = margin_db
+
+        self.position = 0  # Muestras procesadas desde el inicio de la grabación
+        self._noise_floor = min_db - margin_db
+        self._carry = np.empty((0,), dtype=np.int16)
+        self._buffer = bytearray()  # Audio mono del fragmento en curso
+        self._start = 0  # Muestra inicial del fragmento en curso
+        self._first_voice = None
+        self._voice_end = 0
+        self._silence = 0
+
+    def feed(self, data):
+        """Procesa un bloque PCM int16 intercalado (se llama desde el hilo mezclador)"""
+        samples = np.frombuffer(data, dtype='<i2')
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1).astype(np.int16)
+        mono = np.concatenate((self._carry, samples))
+        usable = len(mono) - len(mono) % self.frame_samples
+        self._carry = mono[usable:]
+        if not usable:
+            return
+
+        frames = mono[:usable].reshape(-1, self.frame_samples)
+        floats = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(floats * floats, axis=1))
+        energies = 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+        for frame, energy in zip(frames, energies):
+            self._process_frame(frame, float(energy))
+
+    def _process_frame(self, frame, energy):
+        # El ruido de fondo baja enseguida y sube despacio, para no confundirse con la voz
+        if energy < self._noise_floor:
+            self._noise_floor = energy
+        else:
+            self._noise_floor += (energy - self._noise_floor) * 0.01
+        voiced = energy > max(self.min_db, self._noise_floor + self.margin_db)
+
+        self._buffer += frame.tobytes()
+        frame_end = self.position + len(frame)
+        if voiced:
+            if self._first_voice is None:
+                self._first_voice = self.position
+            self._voice_end = frame_end
+            self._silence = 0
+        else:
+            self._silence += 1
+        self.position = frame_end
+
+        length = frame_end - self._start
+        if self._first_voice is None:
+            # Sin voz todavía: solo se conserva el margen previo
+            excess = len(self._buffer) // 2 - self.padding_samples
+            if excess > 0:
+                del self._buffer[:excess * 2]
+                self._start += excess
+        elif length >= self.max_samples or (
+                length >= self.min_samples and self._silence >= self.min_silence_frames):
+            self._cut()
+
+    def _cut(self):
+        if self._first_voice is not None:
+            first = max(self._first_voice - self.padding_samples, self._start)
+            last = min(self._voice_end + self.padding_samples, self.position)
+            pcm = bytes(self._buffer[(first - self._start) * 2:(last - self._start) * 2])
+            self.emit(first, last, pcm)
+        self._buffer = bytearray()
+        self._start = self.position
+        self._first_voice = None
+        self._silence = 0
+
+    def flush(self):
+        """Corta el fragmento en curso al terminar la grabación"""
+        if len(self._carry):
+            frame = self._carry
+            self._carry = np.empty((0,), dtype=np.int16)
+            floats = frame.astype(np.float32)
+            rms = float(np.sqrt(np.mean(floats * floats)))
+            self._process_frame(frame, 20 * np.log10(max(rms, 1.0) / 32768.0))
+        self._cut()
+
+
+class LiveCaptions:
+    """
+    Subtítulos en directo en un canal de texto: un único mensaje que se
+    edita con las últimas frases reconocidas, como mucho cada `interval`
+    segundos para no agotar el límite de ediciones de Discord.
+    """
+
+    def __init__(self, channel, interval=3.0, max_lines=10):
+        self.channel = channel
+        self.interval = interval
+        self.max_lines = max_lines
+        self.lines = []
+        self.message = None
+        self._last_update = 0.0
+        self._pending = None  # Edición diferida que publicará las líneas nuevas
+
+    def _content(self):
+        lines = list(self.lines)
+        content = "**Subtítulos en directo:**\n" + "\n".join(lines)
+        while len(content) > 1900 and len(lines) > 1:
+            lines.pop(0)
+            content = "**Subtítulos en directo:**\n" + "\n".join(lines)
+        return content[:1900]
+
+    async def add(self, start_ms, text):
+        """Añade una frase y actualiza el mensaje si ha pasado el intervalo mínimo"""
+        if not text:
+            return
+        self.lines.append(f"[{format_timestamp(start_ms)}] {text}")
+        del self.lines[:-self.max_lines]
+
+        wait = self._last_update + self.interval - time.monotonic()
+        if wait <= 0:
+            await self._publish()
+        elif self._pending is None:
+            self._pending = asyncio.create_task(self._publish_later(wait))
+
+    async def _publish_later(self, wait):
+        await asyncio.sleep(wait)
+        self._pending = None
+        await self._publish()
+
+    async def _publish(self):
+        self._last_update = time.monotonic()
+        try:
+            if self.message is None:
+                self.message = await self.channel.send(self._content())
+            else:
+                await self.message.edit(content=self._content())
+        except discord.HTTPException as e:
+            logger.warning(f"No se pudieron actualizar los subtítulos en {self.channel}: {e}")
+
+    async def close(self):
+        """Publica las frases pendientes"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+            await self._publish()
+
+
+class LiveTranscriber:
+    """
+    Transcripción incremental de una grabación en curso.
+
+    El hilo mezclador entrega cada bloque a feed(); el segmentador corta los
+    fragmentos en los silencios y los pasa al bucle de eventos, donde unos
+    pocos workers los reconocen en segundo plano.
+
+    La cola de fragmentos está acotada: si el motor no da abasto, los
+    fragmentos que no caben se anotan (solo su posición) y se transcriben
+    desde el archivo guardado al terminar. La captura nunca espera al
+    reconocimiento.
+    """
+
+    def __init__(self, sample_rate=48000, channels=2, api='speech_recognition', guild_id=None,
+                 captions=None, queue_size=8, workers=1):
+        # El audio se reduce a mono a RECOGNITION_SAMPLE_RATE antes de segmentarlo
+        self.source_rate = sample_rate
+        self.sample_rate = min(sample_rate, config.RECOGNITION_SAMPLE_RATE)
+        self.resampler = Resampler(sample_rate, self.sample_rate, channels)
+        self.api = api
+        self.guild_id = guild_id
+        # Subtítulos (LiveCaptions) donde se publica cada frase; se reutilizan entre partes
+        self.captions = captions
+        self.segments = []  # (inicio_ms, fin_ms, texto)
+        self.deferred = []  # (muestra_inicial, muestra_final) pendientes de transcribir desde el archivo
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self.segmenter = StreamingSegmenter(
+            self._emit,
+            sample_rate=self.sample_rate,
+            channels=1,
+            frame_ms=config.VAD_FRAME_MS,
+            min_silence_ms=config.VAD_MIN_SILENCE_MS,
+            min_chunk=config.LIVE_MIN_CHUNK,
+            max_chunk=config.LIVE_MAX_CHUNK,
+            min_db=config.VAD_MIN_DB
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    def feed(self, data):
+        self.segmenter.feed(self.resampler.process(data))
+
+    def _emit(self, start, end, pcm):
+        # Se llama desde el hilo mezclador: el fragmento se encola en el bucle de eventos
+        self._loop.call_soon_threadsafe(self._enqueue, start, end, pcm)
+
+    def _enqueue(self, start, end, pcm):
+        try:
+            self._queue.put_nowait((start, end, pcm))
+        except asyncio.QueueFull:
+            if not self.deferred:
+                logger.warning(f"El reconocimiento en directo no da abasto en el servidor {self.guild_id}; "
+                               f"los fragmentos pendientes se transcribirán al terminar")
+            self.deferred.append((start, end))
+            metrics.live_segments.inc(('deferred',))
+
+    async def _worker(self):
+        backend = get_backend(self.api)
+        executor = get_executor()
+        # Sin guild_id: el reconocimiento en directo no debe ocupar los turnos del servidor
+        # (detener la grabación) ni cancelarse con !cancelar
+        run = executor.run_cpu if backend.cpu_bound else executor.run_io
+        while True:
+            start, end, pcm = await self._queue.get()
+            try:
+                started = time.monotonic()
+                text = await run(recognize_pcm, self.api, pcm, self.sample_rate)
+                metrics.transcription_chunk_duration.observe(time.monotonic() - started, (self.api,))
+                metrics.live_segments.inc(('transcribed',))
+                start_ms = start * 1000 // self.sample_rate
+                self.segments.append((start_ms, end * 1000 // self.sample_rate, text))
+                if self.captions is not None:
+                    await self.captions.add(start_ms, text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error en el reconocimiento en directo; el fragmento se repetirá al terminar: {e}")
+                self.deferred.append((start, end))
+            finally:
+                self._queue.task_done()
+
+    async def finish(self, file_path):
+        """
+        Termina la transcripción una vez detenida y guardada la grabación
+
+        Espera a los fragmentos en curso y transcribe desde el archivo los que
+        se aplazaron.
+
+        Args:
+            file_path: Archivo guardado de la grabación (mezcla)
+
+        Returns:
+            Lista de segmentos (inicio_ms, fin_ms, texto) en orden
+        """
+        self.segmenter.flush()
+        # Dejar que se encolen los fragmentos emitidos por flush y por el hilo mezclador
+        await asyncio.sleep(0)
+        await self._queue.join()
+        self.cancel()
+
+        if self.deferred:
+            executor = get_executor()
+            # Mismo pool que el worker: los motores locales reconocen en el de CPU
+            run = executor.run_cpu if get_backend(self.api).cpu_bound else executor.run_io
+            source = file_path
+            if not file_path.endswith('.wav'):
+                source = await executor.run_io(decode_to_temp_wav, file_path)
+            try:
+                texts = await asyncio.gather(*(
+                    run(
+                        _recognize_chunk, self.api, source,
+                        start * self.source_rate // self.sample_rate, end * self.source_rate // self.sample_rate)
+                    for start, end in self.deferred
+                ))
+            finally:
+                if source != file_path:
+                    try:
+                        os.remove(source)
+                    except OSError:
+                        pass
+            self.segments.extend(
+                (start * 1000 // self.sample_rate, end * 1000 // self.sample_rate, text)
+                for (start, end), text in zip(self.deferred, texts)
+            )
+            self.deferred = []
+
+        self.segments.sort()
+        return self.segments
+
+    def transcript(self):
+        """Texto de la transcripción con marcas de tiempo"""
+        return format_segments(self.segments) or NO_SPEECH_MESSAGE
+
+    def save(self, recording_file):
+        """
+        Guarda la transcripción junto a las de !transcribir y la indexa para !buscar
+
+        Args:
+            recording_file: Archivo de la grabación
+
+        Returns:
+            Ruta al archivo de la transcripción
+        """
+        base_name = os.path.basename(recording_file).rsplit('.', 1)[0]
+        transcript_file = os.path.join(config.TRANSCRIPTIONS_DIR, f"{base_name}.txt")
+        os.makedirs(os.path.dirname(transcript_file), exist_ok=True)
+        with open(transcript_file, 'w', encoding='utf-8') as f:
+            f.write(self.transcript())
+        index_transcript(transcript_file, [(start, "", text) for start, _, text in self.segments], self.guild_id)
+        return transcript_file
+
+    def cancel(self):
+        """Detiene los workers sin esperar a los fragmentos pendientes"""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
@@ -0,0 +1,214 @@
+import bisect
+import threading
+import logging
+
+logger = logging.getLogger('discord-recording-bot.metrics')
+
+# Límites (en segundos) por defecto de los histogramas de latencia
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class _Metric:
+    """
+    Base de las métricas con valores repartidos por hilo.
+
+    Cada hilo escribe solo en su propio diccionario, así que incrementar no
+    necesita cerrojos y sirve en el hilo de recepción de voz. Los valores de
+    todos los hilos se suman al consultar /metrics.
+    """
+
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []  # Diccionarios {etiquetas: valor} de cada hilo
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            self._local.values = values
+            # Solo se bloquea la primera vez que cada hilo usa la métrica
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _collect_shards(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict() copia cada diccionario de una vez, sin iterar mientras otro hilo escribe
+        return [dict(shard) for shard in shards]
+
+    def _format_labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Contador que solo crece"""
+
+    type_name = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def totals(self):
+        totals = {}
+        for shard in self._collect_shards():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def samples(self):
+        return [f"{self.name}{self._format_labels(labels)} {value}" for labels, value in sorted(self.totals().items())]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con límites fijos, al estilo de Prometheus"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # Un contador por límite, más el de +Inf, la suma y el número de observaciones
+            entry = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            shard[labels] = entry
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def samples(self):
+        merged = {}
+        for shard in self._collect_shards():
+            for labels, entry in shard.items():
+                total = merged.setdefault(labels, [0] * len(entry))
+                for i, value in enumerate(list(entry)):
+                    total[i] += value
+
+        lines = []
+        for labels, entry in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {entry[-2]}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {entry[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Valor instantáneo calculado al consultar /metrics
+
+    La función devuelve un número o un diccionario {etiquetas: valor}.
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        self.func = func
+
+    def set_function(self, func):
+        self.func = func
+
+    def samples(self):
+        if self.func is None:
+            return []
+        try:
+            values = self.func()
+        except Exception as e:
+            logger.error(f"Error calculando la métrica {self.name}: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{self._format_labels(labels)} {value}" for labels, value in sorted(values.items())]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Conjunto de métricas del proceso, exportadas en el formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        gauge = self._register(Gauge(name, help_text, labelnames, func))
+        if func is not None:
+            gauge.set_function(func)
+        return gauge
+
+    def render(self):
+        """Texto de todas las métricas para el endpoint /metrics"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Métricas que se actualizan desde distintos módulos
+voice_packets = registry.counter(
+    'bibop_voice_packets_total', 'Paquetes de voz recibidos', ('guild',))
+transcription_wait = registry.histogram(
+    'bibop_transcription_queue_wait_seconds', 'Tiempo que un trabajo espera en la cola de transcripción')
+transcription_duration = registry.histogram(
+    'bibop_transcription_duration_seconds', 'Duración de los trabajos de transcripción', ('status',))
+transcription_chunk_duration = registry.histogram(
+    'bibop_transcription_chunk_seconds', 'Tiempo de reconocimiento de cada fragmento', ('backend',))
+live_segments = registry.counter(
+    'bibop_live_segments_total', 'Fragmentos de la transcripción en directo', ('status',))
+search_lookup = registry.histogram(
+    'bibop_search_seconds', 'Tiempo de las búsquedas en el índice de transcripciones',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+track_opus_gaps = registry.counter(
+    'bibop_track_opus_gaps_total', 'Paquetes sin Opus original rellenados con silencio en pistas Ogg/Opus', ('guild',))
+retention_actions = registry.counter(
+    'bibop_retention_actions_total', 'Grabaciones borradas o archivadas por el servicio de retención', ('action',))
+catalog_lookup = registry.histogram(
+    'bibop_catalog_lookup_seconds', 'Tiempo de las consultas al catálogo de grabaciones', ('operation',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
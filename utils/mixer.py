@@ -0,0 +1,178 @@
+import threading
+import time
+import logging
+from utils.lazy import lazy_import
+
+logger = logging.getLogger('discord-recording-bot.mixer')
+
+np = lazy_import('numpy')
+
+# Reloj RTP de Opus en Discord (muestras por segundo)
+RTP_CLOCK_RATE = 48000
+
+
+class TimelineMixer:
+    """
+    Mezclador en tiempo real sobre una línea de tiempo común.
+
+    Cada paquete de 20 ms se coloca en su posición (timestamp RTP o hora de
+    llegada) y se añade a la "racha" contigua de su hablante, lo que en el
+    hilo de voz se reduce a ampliar un bytearray. Un hilo mezclador procesa
+    la línea de tiempo en bloques: suma los hablantes solapados en int32 con
+    NumPy, recorta a int16 y rellena con ceros los huecos de silencio, de
+    modo que el archivo resultante conserva la duración real.
+    """
+
+    def __init__(self, output, sample_rate=48000, channels=2, block_duration=0.5,
+                 latency=0.3, tolerance=0.06, clock=time.monotonic):
+        self.output = output
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = channels * 2
+        self.block_samples = int(sample_rate * block_duration)
+        self.block_duration = block_duration
+        self.latency_samples = int(sample_rate * latency)
+        self.tolerance_samples = int(sample_rate * tolerance)
+        self.clock = clock
+
+        self.samples_mixed = 0
+        self.late_packets = 0
+
+        self._start = None
+        self._runs = []  # [inicio_en_muestras, bytearray] por racha contigua
+        self._open_runs = {}  # {hablante: racha abierta}
+        self._rtp_anchors = {}  # {hablante: (timestamp_rtp, offset)}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start = self.clock()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='timeline-mixer', daemon=True)
+        self._thread.start()
+
+    def _now_samples(self):
+        return int((self.clock() - self._start) * self.sample_rate)
+
+    def _place(self, key, arrival, timestamp):
+        if timestamp is None:
+            return arrival
+        anchor = self._rtp_anchors.get(key)
+        if anchor is not None:
+            offset = anchor[1] + ((timestamp - anchor[0]) & 0xFFFFFFFF) * self.sample_rate // RTP_CLOCK_RATE
+            # Si el reloj RTP se ha desviado mucho (reinicio de SSRC), reanclar a la llegada
+            if abs(offset - arrival) <= self.sample_rate:
+                return offset
+        self._rtp_anchors[key] = (timestamp, arrival)
+        return arrival
+
+    def add(self, key, pcm, timestamp=None):
+        """
+        Coloca un frame PCM de un hablante en la línea de tiempo
+
+        Args:
+            key: Identificador del hablante
+            pcm: Datos PCM int16 intercalados
+            timestamp: Timestamp RTP del paquete (opcional)
+        """
+        if self._start is None:
+            return
+        with self._lock:
+            offset = self._place(key, self._now_samples(), timestamp)
+            run = self._open_runs.get(key)
+            if run is not None:
+                # Los paquetes que llegan en ráfaga (antes de lo esperado) siguen siendo contiguos
+                run_end = run[0] + len(run[1]) // self.frame_size
+                if -self.sample_rate <= offset - run_end <= self.tolerance_samples:
+                    run[1] += pcm
+                    return
+            if offset < self.samples_mixed:
+                # El bloque ya se mezcló: el paquete llega tarde y se coloca al final
+                self.late_packets += 1
+                offset = self.samples_mixed
+            run = [offset, bytearray(pcm)]
+            self._runs.append(run)
+            self._open_runs[key] = run
+
+    @property
+    def pending_bytes(self):
+        """Bytes de audio recibidos que aún no se han mezclado"""
+        return sum(len(run[1]) for run in list(self._runs))
+
+    def _mix_block(self, block_end):
+        block_start = self.samples_mixed
+        channels = self.channels
+        acc = np.zeros((block_end - block_start) * channels, dtype=np.int32)
+
+        remaining = []
+        for run in self._runs:
+            run_start = run[0]
+            run_end = run_start + len(run[1]) // self.frame_size
+            if run_start >= block_end:
+                remaining.append(run)
+                continue
+            start = max(run_start, block_start)
+            end = min(run_end, block_end)
+            if end > start:
+                samples = np.frombuffer(run[1], dtype='<i2', count=(end - run_start) * channels)
+                acc[(start - block_start) * channels:(end - block_start) * channels] += \
+                    samples[(start - run_start) * channels:]
+                # Liberar la vista sobre el bytearray antes de recortarlo
+                del samples
+            if run_end > block_end:
+                del run[1][:(block_end - run_start) * self.frame_size]
+                run[0] = block_end
+                remaining.append(run)
+        self._runs = remaining
+        alive = {id(run) for run in remaining}
+        self._open_runs = {k: r for k, r in self._open_runs.items() if id(r) in alive}
+        self.samples_mixed = block_end
+
+        np.clip(acc, -32768, 32767, out=acc)
+        return acc.astype('<i2').tobytes()
+
+    def flush(self, until=None, partial=False):
+        """
+        Mezcla y entrega todos los bloques completos hasta una posición
+
+        Args:
+            until: Posición en muestras hasta la que mezclar (por defecto, ahora menos la latencia)
+            partial: Si es True, también se entrega el último bloque incompleto
+        """
+        if self._start is None:
+            return
+        with self._lock:
+            if until is None:
+                until = self._now_samples() - self.latency_samples
+            blocks = []
+            while self.samples_mixed < until:
+                block_end = self.samples_mixed + self.block_samples
+                if block_end > until:
+                    if not partial:
+                        break
+                    block_end = until
+                blocks.append(self._mix_block(block_end))
+        for block in blocks:
+            self.output(block)
+
+    def _run(self):
+        while not self._stop_event.wait(self.block_duration):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error mezclando audio: {e}")
+
+    def close(self):
+        """Detiene el hilo mezclador y entrega el audio pendiente hasta el momento actual"""
+        if self._start is None:
+            return
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            end = self._now_samples()
+            for run in self._runs:
+                end = max(end, run[0] + len(run[1]) // self.frame_size)
+        self.flush(until=end, partial=True)
+        self._start = None
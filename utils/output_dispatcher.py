@@ -0,0 +1,273 @@
+import asyncio
+import collections
+import gzip
+import io
+import os
+import time
+import logging
+import discord
+import config
+
+logger = logging.getLogger('discord-recording-bot.output_dispatcher')
+
+# Límites de Discord
+MESSAGE_LIMIT = 2000
+EMBED_DESCRIPTION_LIMIT = 4096
+
+
+class RateLimitBucket:
+    """
+    Cubo de fichas: permite `rate` envíos cada `per` segundos
+
+    Se respeta antes de enviar, en lugar de esperar a que Discord responda
+    con un 429 y discord.py bloquee la ruta.
+    """
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def delay(self):
+        """Segundos que hay que esperar para tener una ficha (0 si ya hay)"""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if not wait:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+
+class PaginatedView(discord.ui.View):
+    """Botones para recorrer las páginas de un embed"""
+
+    def __init__(self, pages, title, timeout=600):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.title = title
+        self.index = 0
+        self._sync_buttons()
+
+    def embed(self):
+        embed = discord.Embed(title=self.title, description=self.pages[self.index], color=discord.Color.blue())
+        embed.set_footer(text=f"Página {self.index + 1}/{len(self.pages)}")
+        return embed
+
+    def _sync_buttons(self):
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = self.index == len(self.pages) - 1
+
+    async def _show(self, interaction):
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        self.index = max(self.index - 1, 0)
+        await self._show(interaction)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        self.index = min(self.index + 1, len(self.pages) - 1)
+        await self._show(interaction)
+
+
+def split_text(text, limit):
+    """
+    Divide un texto en trozos de como mucho `limit` caracteres, cortando en
+    los saltos de línea siempre que se pueda
+
+    Returns:
+        Lista de trozos
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class OutputDispatcher:
+    """
+    Envío a Discord de textos largos (transcripciones, listados) sin bloquear
+    los comandos.
+
+    Cada canal tiene su propia cola y su propia tarea de envío con su cubo de
+    límite de peticiones, de modo que una transcripción enorme en un servidor
+    no retrasa los mensajes de otros. Además, todos los canales comparten un
+    cubo global.
+
+    La forma de envío depende del tamaño del texto:
+    - Pequeño (cabe en un mensaje): un mensaje; los mensajes pequeños que se
+      acumulan en la cola de un canal se agrupan en uno solo.
+    - Mediano (hasta max_pages páginas): un embed paginado con botones.
+    - Grande: un único adjunto comprimido con gzip.
+    """
+
+    def __init__(self, channel_rate=5, channel_per=5.0, global_rate=40, global_per=1.0,
+                 page_size=3800, max_pages=25):
+        self.channel_rate = channel_rate
+        self.channel_per = channel_per
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._global_bucket = RateLimitBucket(global_rate, global_per)
+        self._queues = {}  # {channel_id: deque de envíos pendientes}
+        self._buckets = {}  # {channel_id: RateLimitBucket}
+        self._senders = {}  # {channel_id: asyncio.Task}
+
+    def strategy(self, text, title=None):
+        """Forma de envío de un texto: 'message', 'pages' o 'attachment'"""
+        if len(self._as_message(text, title)) <= MESSAGE_LIMIT:
+            return 'message'
+        if len(split_text(text, self.page_size)) <= self.max_pages:
+            return 'pages'
+        return 'attachment'
+
+    def send_text(self, channel, text, title=None, filename='salida.txt'):
+        """
+        Encola un texto para un canal y vuelve sin esperar al envío
+
+        Args:
+            channel: Canal de texto de destino
+            text: Texto completo
+            title: Título del mensaje o del embed
+            filename: Nombre del adjunto si el texto es demasiado grande
+
+        Returns:
+            Forma de envío elegida (ver strategy)
+        """
+        strategy = self.strategy(text, title)
+        if strategy == 'message':
+            item = ('message', self._as_message(text, title))
+        elif strategy == 'pages':
+            item = ('pages', (title or "", split_text(text, self.page_size)))
+        else:
+            item = ('attachment', (f"{title}\n" if title else "", text, filename))
+        self._enqueue(channel, item)
+        return strategy
+
+    def _as_message(self, text, title):
+        return f"**{title}**\n{text}" if title else text
+
+    def send_file(self, channel, file_path, filename=None, content=None, remove=False):
+        """
+        Encola un archivo adjunto para un canal
+
+        Args:
+            remove: Borrar el archivo después de enviarlo (o de fallar el envío)
+        """
+        self._enqueue(channel, ('file', (file_path, filename, content, remove)))
+
+    def pending(self, channel_id=None):
+        """Envíos en cola, de un canal o de todos"""
+        if channel_id is not None:
+            return len(self._queues.get(channel_id, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _enqueue(self, channel, item):
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = collections.deque()
+            self._queues[channel.id] = queue
+        if channel.id not in self._buckets:
+            # El cubo se conserva entre ráfagas para que cada ráfaga no empiece con fichas nuevas
+            self._buckets[channel.id] = RateLimitBucket(self.channel_rate, self.channel_per)
+        queue.append(item)
+        sender = self._senders.get(channel.id)
+        if sender is None or sender.done():
+            self._senders[channel.id] = asyncio.create_task(self._sender(channel))
+
+    async def _sender(self, channel):
+        queue = self._queues[channel.id]
+        try:
+            # La tarea termina cuando se vacía la cola; se vuelve a crear con el siguiente envío
+            while queue:
+                kind, payload = queue.popleft()
+                if kind == 'message':
+                    payload = self._batch_messages(queue, payload)
+                try:
+                    await self._deliver(channel, kind, payload)
+                except discord.HTTPException as e:
+                    logger.warning(f"No se pudo enviar la salida al canal {channel.id}: {e}")
+                except Exception as e:
+                    logger.error(f"Error enviando la salida al canal {channel.id}: {e}")
+        finally:
+            if not queue:
+                self._queues.pop(channel.id, None)
+                self._senders.pop(channel.id, None)
+
+    def _batch_messages(self, queue, text):
+        # Agrupar los mensajes pequeños consecutivos que quepan en uno
+        while queue:
+            kind, payload = queue[0]
+            if kind != 'message' or len(text) + 1 + len(payload) > MESSAGE_LIMIT:
+                break
+            queue.popleft()
+            text = f"{text}\n{payload}"
+        return text
+
+    async def _send(self, channel, **kwargs):
+        await self._buckets[channel.id].acquire()
+        await self._global_bucket.acquire()
+        return await channel.send(**kwargs)
+
+    async def _deliver(self, channel, kind, payload):
+        if kind == 'message':
+            await self._send(channel, content=payload)
+        elif kind == 'pages':
+            title, pages = payload
+            if len(pages) == 1:
+                await self._send(channel, embed=discord.Embed(
+                    title=title, description=pages[0], color=discord.Color.blue()))
+            else:
+                view = PaginatedView(pages, title)
+                await self._send(channel, embed=view.embed(), view=view)
+        elif kind == 'attachment':
+            header, text, filename = payload
+            data = gzip.compress(text.encode('utf-8'))
+            await self._send(
+                channel,
+                content=f"{header}Texto demasiado largo para mostrarlo ({len(text)} caracteres); se adjunta comprimido.",
+                file=discord.File(io.BytesIO(data), f"{filename}.gz")
+            )
+        elif kind == 'file':
+            file_path, filename, content, remove = payload
+            try:
+                await self._send(channel, content=content, file=discord.File(file_path, filename))
+            finally:
+                if remove:
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    """Devuelve el despachador de salida compartido, creándolo con la configuración"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = OutputDispatcher(
+            channel_rate=config.OUTPUT_CHANNEL_RATE,
+            channel_per=config.OUTPUT_CHANNEL_PER,
+            global_rate=config.OUTPUT_GLOBAL_RATE,
+            page_size=config.OUTPUT_PAGE_SIZE,
+            max_pages=config.OUTPUT_MAX_PAGES
+        )
+    return _dispatcher
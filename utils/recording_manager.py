@@ -0,0 +1,270 @@
+import datetime
+import time
+import logging
+import config
+
+logger = logging.getLogger('discord-recording-bot.recording_manager')
+
+
+class AdmissionError(Exception):
+    """No se admite una nueva grabación porque se alcanzó un límite de recursos"""
+
+
+class Reservation:
+    """
+    Plaza concedida por RecordingManager.admit hasta que register() la ocupa
+
+    Mientras existe cuenta para los límites, de modo que varias grabaciones
+    que se inician a la vez (y esperan a conectarse al canal) no pueden
+    superarlos. Se usa como gestor de contexto para liberarla si la
+    grabación no llega a registrarse:
+
+        with manager.admit(guild_id, channel_id) as reservation:
+            ...
+            manager.register(..., reservation=reservation)
+    """
+    __slots__ = ('manager', 'guild_id', 'channel_id', 'sample_rate', 'channels', 'active')
+
+    def __init__(self, manager, guild_id, channel_id, sample_rate, channels):
+        self.manager = manager
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.active = True
+
+    def release(self):
+        """Devuelve la plaza (no hace nada si ya se ocupó o se liberó)"""
+        if self.active:
+            self.active = False
+            self.manager._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RecordingSession:
+    """Grabación activa: el grabador, su cliente de voz y las estadísticas de uso"""
+
+    def __init__(self, guild_id, channel_id, recorder, voice_client, downgraded=False, notify_channel=None):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.recorder = recorder
+        self.voice_client = voice_client
+        self.start_time = datetime.datetime.now()
+        self.downgraded = downgraded
+        # Canal de texto donde avisar de las paradas y divisiones automáticas
+        self.notify_channel = notify_channel
+        # Nombre base y parte actual en grabaciones divididas por duración máxima
+        self.name = None
+        self.part = 1
+        # Desde cuándo (monotonic) no queda nadie en el canal de voz
+        self.empty_since = None
+        # Se está deteniendo; la supervisión ya no debe tocarla
+        self.closing = False
+        # Transcripción en directo (LiveTranscriber) si se pidió al empezar
+        self.live = None
+
+        # Última muestra (instante, paquetes, bytes escritos) y tasas calculadas con ella
+        self._last_sample = (time.monotonic(), 0, 0)
+        self.packets_per_second = 0.0
+        self.write_rate = 0.0
+
+    def sample(self, min_interval=1.0):
+        """
+        Actualiza las tasas de paquetes y de escritura a disco
+
+        Las tasas se calculan sobre el intervalo desde la muestra anterior; si
+        ha pasado menos de min_interval se conservan las últimas calculadas.
+
+        Returns:
+            Diccionario con las estadísticas de la sesión
+        """
+        now = time.monotonic()
+        packets = self.recorder.packets_received
+        written = self.recorder.bytes_recorded
+        last_time, last_packets, last_written = self._last_sample
+        elapsed = now - last_time
+        if elapsed >= min_interval:
+            self.packets_per_second = (packets - last_packets) / elapsed
+            self.write_rate = (written - last_written) / elapsed
+            self._last_sample = (now, packets, written)
+
+        return {
+            'guild_id': self.guild_id,
+            'channel_id': self.channel_id,
+            'duration': datetime.datetime.now() - self.start_time,
+            'sample_rate': self.recorder.sample_rate,
+            'channels': self.recorder.channels,
+            'downgraded': self.downgraded,
+            'buffered_bytes': self.recorder.buffered_bytes,
+            'packets_per_second': self.packets_per_second,
+            'write_rate': self.write_rate,
+            'bytes_recorded': written,
+            'dropped_bytes': self.recorder.dropped_bytes,
+            'tracks': len(self.recorder.tracks),
+            'idle_seconds': self.recorder.idle_seconds,
+            'part': self.part,
+        }
+
+
+class RecordingManager:
+    """
+    Registro de las grabaciones activas de todos los servidores con control
+    de admisión.
+
+    Antes de iniciar una grabación se pide admit(): si se ha alcanzado el
+    límite global o el del servidor, se rechaza; si hay muchas sesiones o
+    demasiados datos pendientes de escribir, se admite con un formato
+    reducido (por defecto 16 kHz mono) que ocupa una sexta parte. La plaza
+    admitida queda reservada hasta que register() la ocupa.
+    """
+
+    def __init__(self, max_sessions=20, max_per_guild=2, downgrade_after=10,
+                 buffer_budget=64 * 1024 * 1024, downgrade_sample_rate=16000, downgrade_channels=1):
+        self.max_sessions = max_sessions
+        self.max_per_guild = max_per_guild
+        self.downgrade_after = downgrade_after
+        self.buffer_budget = buffer_budget
+        self.downgrade_sample_rate = downgrade_sample_rate
+        self.downgrade_channels = downgrade_channels
+        self._sessions = {}  # {guild_id: {channel_id: RecordingSession}}
+        self._reservations = {}  # {guild_id: {channel_id: Reservation}}
+        self.rejected = 0
+        # Grabaciones de los demás procesos (despliegue por shards), según el estado compartido
+        self.remote_sessions = 0
+
+    def __len__(self):
+        return sum(len(channels) for channels in self._sessions.values())
+
+    def sessions(self, guild_id=None):
+        """Sesiones activas, de un servidor o de todos"""
+        if guild_id is not None:
+            return list(self._sessions.get(guild_id, {}).values())
+        return [session for channels in self._sessions.values() for session in channels.values()]
+
+    def get(self, guild_id, channel_id):
+        return self._sessions.get(guild_id, {}).get(channel_id)
+
+    def is_recording(self, guild_id, channel_id):
+        return self.get(guild_id, channel_id) is not None
+
+    def buffered_bytes(self):
+        """Bytes de audio en memoria pendientes de mezclar o escribir, en total"""
+        return sum(session.recorder.buffered_bytes for session in self.sessions())
+
+    def admit(self, guild_id, channel_id, sample_rate=48000, channels=2):
+        """
+        Decide si se puede iniciar una grabación y con qué formato, y reserva su plaza
+
+        Args:
+            guild_id: Servidor que pide la grabación
+            channel_id: Canal de voz que se quiere grabar
+            sample_rate: Frecuencia de muestreo deseada
+            channels: Número de canales deseado
+
+        Returns:
+            Reservation con la frecuencia de muestreo y los canales con los que grabar
+
+        Raises:
+            AdmissionError: Si el canal ya se graba o se alcanzó el límite global o el del servidor
+        """
+        guild_reservations = self._reservations.get(guild_id, {})
+        if self.is_recording(guild_id, channel_id) or channel_id in guild_reservations:
+            raise AdmissionError("Ya se está grabando en este canal.")
+
+        # Los límites cuentan las plazas reservadas y, el global, las grabaciones de los demás procesos
+        reserved = sum(len(channels) for channels in self._reservations.values())
+        total = len(self) + reserved + self.remote_sessions
+        if total >= self.max_sessions:
+            self.rejected += 1
+            raise AdmissionError(f"Se alcanzó el límite de {self.max_sessions} grabaciones simultáneas.")
+        if len(self._sessions.get(guild_id, {})) + len(guild_reservations) >= self.max_per_guild:
+            self.rejected += 1
+            raise AdmissionError(
+                f"Este servidor ya tiene {self.max_per_guild} grabaciones activas; detén alguna antes de empezar otra.")
+
+        buffered = self.buffered_bytes()
+        if total >= self.downgrade_after or buffered >= self.buffer_budget:
+            logger.warning(
+                f"Grabación admitida con formato reducido en el servidor {guild_id} "
+                f"({total} sesiones activas, {buffered} bytes pendientes)")
+            sample_rate, channels = self.downgrade_sample_rate, self.downgrade_channels
+
+        reservation = Reservation(self, guild_id, channel_id, sample_rate, channels)
+        self._reservations.setdefault(guild_id, {})[channel_id] = reservation
+        return reservation
+
+    def _release(self, reservation):
+        channels = self._reservations.get(reservation.guild_id)
+        if channels and channels.get(reservation.channel_id) is reservation:
+            del channels[reservation.channel_id]
+            if not channels:
+                del self._reservations[reservation.guild_id]
+
+    def register(self, guild_id, channel_id, recorder, voice_client, notify_channel=None, reservation=None):
+        """
+        Registra una grabación ya iniciada
+
+        Args:
+            guild_id: ID del servidor
+            channel_id: ID del canal de voz
+            recorder: AudioRecorder ya iniciado
+            voice_client: Cliente de voz del que escucha
+            notify_channel: Canal de texto para los avisos automáticos (opcional)
+            reservation: Plaza concedida por admit(), que pasa a ocupar la sesión
+                (sin ella, la sesión sustituye a otra del mismo canal, como al
+                dividir una grabación en partes)
+
+        Returns:
+            La RecordingSession creada
+        """
+        if reservation is not None:
+            reservation.release()
+        session = RecordingSession(
+            guild_id, channel_id, recorder, voice_client,
+            downgraded=(recorder.sample_rate, recorder.channels) != (config.SAMPLE_RATE, config.CHANNELS),
+            notify_channel=notify_channel
+        )
+        self._sessions.setdefault(guild_id, {})[channel_id] = session
+        return session
+
+    def remove(self, guild_id, channel_id):
+        """Quita una grabación del registro y la devuelve (o None si no estaba)"""
+        channels = self._sessions.get(guild_id)
+        if not channels:
+            return None
+        session = channels.pop(channel_id, None)
+        if not channels:
+            del self._sessions[guild_id]
+        return session
+
+    def stats(self, guild_id=None):
+        """
+        Estadísticas de las sesiones activas
+
+        Returns:
+            Lista de diccionarios, uno por sesión (ver RecordingSession.sample)
+        """
+        return [session.sample() for session in self.sessions(guild_id)]
+
+
+_manager = None
+
+
+def get_recording_manager():
+    """Devuelve el gestor de grabaciones compartido, creándolo con la configuración"""
+    global _manager
+    if _manager is None:
+        _manager = RecordingManager(
+            max_sessions=config.RECORDING_MAX_SESSIONS,
+            max_per_guild=config.RECORDING_MAX_PER_GUILD,
+            downgrade_after=config.RECORDING_DOWNGRADE_AFTER,
+            buffer_budget=config.RECORDING_BUFFER_BUDGET,
+            downgrade_sample_rate=config.RECORDING_DOWNGRADE_SAMPLE_RATE,
+            downgrade_channels=config.RECORDING_DOWNGRADE_CHANNELS
+        )
+    return _manager
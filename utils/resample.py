@@ -0,0 +1,128 @@
+import math
+from utils.lazy import lazy_import
+
+# numpy se carga al crear el primer remuestreador, no al importar el módulo
+np = lazy_import('numpy')
+
+
+def design_lowpass(up, down, zero_crossings=16, beta=8.0):
+    """
+    Diseña el filtro paso bajo FIR de un remuestreo up/down
+
+    Sinc con ventana de Kaiser, con el corte justo por debajo de la mitad de
+    la frecuencia más baja (entrada o salida) para evitar el aliasing.
+
+    Args:
+        up: Factor de interpolación
+        down: Factor de diezmado
+        zero_crossings: Cruces por cero del sinc a cada lado (más = más selectivo)
+        beta: Parámetro de la ventana de Kaiser
+
+    Returns:
+        Coeficientes del filtro (float32), a la frecuencia interpolada
+    """
+    factor = max(up, down)
+    cutoff = 0.95 / factor  # Frecuencia de corte normalizada (1 = Nyquist de la señal interpolada)
+    half = zero_crossings * factor
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    taps = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), beta)
+    # Ganancia up: la interpolación con ceros reparte la energía entre las fases
+    taps *= up / taps.sum()
+    return taps.astype(np.float32)
+
+
+class Resampler:
+    """
+    Remuestreador polifásico en streaming con NumPy.
+
+    Convierte audio PCM int16 intercalado a mono y a otra frecuencia de
+    muestreo (p. ej. 48 kHz estéreo -> 16 kHz mono para el reconocimiento),
+    bloque a bloque y con cualquier tamaño de bloque: el final de cada bloque
+    se conserva como historia del filtro para el siguiente, así que el
+    resultado es el mismo que procesando todo el audio de una vez.
+
+    Solo se calculan las muestras de salida (nunca la señal interpolada): cada
+    una es el producto de una ventana de la entrada por una de las `up` fases
+    del filtro, todo en una operación vectorizada por bloque.
+
+    El filtro es de fase lineal y retrasa la salida (zero_crossings muestras
+    de la frecuencia más baja, 1 ms a 16 kHz); no se compensa.
+    """
+
+    def __init__(self, source_rate, target_rate, channels=2, zero_crossings=16):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.channels = channels
+        g = math.gcd(source_rate, target_rate)
+        self.up = target_rate // g
+        self.down = source_rate // g
+
+        taps = design_lowpass(self.up, self.down, zero_crossings)
+        # Fases del filtro: fase p = taps[p::up], invertidas para multiplicar por ventanas crecientes
+        self.phase_length = -(-len(taps) // self.up)
+        padded = np.zeros(self.phase_length * self.up, dtype=np.float32)
+        padded[:len(taps)] = taps
+        self.phases = np.ascontiguousarray(padded.reshape(self.phase_length, self.up).T[:, ::-1])
+
+        self._history = np.zeros(self.phase_length - 1, dtype=np.float32)
+        self._input_count = 0  # Muestras de entrada recibidas
+        self._output_count = 0  # Muestras de salida producidas
+
+    def _to_mono(self, pcm):
+        samples = np.frombuffer(pcm, dtype='<i2')
+        if self.channels > 1:
+            samples = samples[:len(samples) - len(samples) % self.channels]
+            return samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        return samples.astype(np.float32)
+
+    def process(self, pcm):
+        """
+        Remuestrea un bloque
+
+        Args:
+            pcm: Datos PCM int16 intercalados con self.channels canales
+
+        Returns:
+            Datos PCM int16 mono a target_rate
+        """
+        return self._process(self._to_mono(pcm))
+
+    def _process(self, mono):
+        if self.up == self.down:
+            return np.clip(mono, -32768, 32767).astype('<i2').tobytes()
+
+        signal = np.concatenate((self._history, mono))
+        first_input = self._input_count - len(self._history)  # Índice global de signal[0]
+        self._input_count += len(mono)
+
+        # La salida n usa la fase (n*down) % up y termina en la entrada (n*down) // up
+        end = -(-self._input_count * self.up // self.down)
+        positions = np.arange(self._output_count, end, dtype=np.int64) * self.down
+        self._output_count = end
+        bases = positions // self.up - first_input - (self.phase_length - 1)
+
+        windows = np.lib.stride_tricks.sliding_window_view(signal, self.phase_length)
+        if self.up == 1:
+            # Diezmado entero (48 kHz -> 16 kHz): una sola fase, un producto matriz-vector
+            output = windows[bases] @ self.phases[0]
+        else:
+            output = np.einsum('nk,nk->n', windows[bases], self.phases[positions % self.up])
+
+        self._history = signal[len(signal) - (self.phase_length - 1):]
+        return np.clip(np.rint(output), -32768, 32767).astype('<i2').tobytes()
+
+
+def resample(pcm, source_rate, target_rate, channels=2):
+    """
+    Remuestrea de una vez un fragmento completo a mono
+
+    Args:
+        pcm: Datos PCM int16 intercalados
+        source_rate: Frecuencia de muestreo de entrada
+        target_rate: Frecuencia de muestreo de salida
+        channels: Canales de la entrada
+
+    Returns:
+        Datos PCM int16 mono a target_rate
+    """
+    return Resampler(source_rate, target_rate, channels).process(pcm)
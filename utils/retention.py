@@ -0,0 +1,273 @@
+import asyncio
+import os
+import shutil
+import time
+import logging
+import config
+from utils.audio_codec import encode_file, ffmpeg_available
+from utils.catalog import get_catalog
+from utils.executors import get_executor
+from utils.file_management import delete_recording_file, get_tracks_dir
+from utils.transcription_cache import get_cache
+from utils import metrics
+
+logger = logging.getLogger('discord-recording-bot.retention')
+
+DAY = 24 * 60 * 60
+MB = 1024 * 1024
+
+
+def policy_for(guild_id):
+    """
+    Política de retención de un servidor: la general, con lo que indique
+    config.RETENTION_GUILD_POLICIES para ese servidor
+
+    Returns:
+        Diccionario con delete_after_days, archive_after_days y quota_mb (None = sin límite)
+    """
+    policy = {
+        'delete_after_days': config.RETENTION_DELETE_AFTER_DAYS,
+        'archive_after_days': config.RETENTION_ARCHIVE_AFTER_DAYS,
+        'quota_mb': config.RETENTION_GUILD_QUOTA_MB,
+    }
+    policy.update(config.RETENTION_GUILD_POLICIES.get(guild_id, {}))
+    return policy
+
+
+class DiskWatermark:
+    """
+    Ocupación del volumen de las grabaciones con histéresis: se activa al
+    superar el umbral alto y solo se desactiva al bajar del bajo, para no
+    alternar con cada grabación que se guarda o se borra
+    """
+
+    def __init__(self, path, high, low):
+        self.path = path
+        self.high = high
+        self.low = low
+        self.ratio = 0.0
+        self.paused = False
+
+    def check(self):
+        """
+        Mide la ocupación del disco y actualiza el estado
+
+        Returns:
+            Fracción del disco ocupada
+        """
+        usage = shutil.disk_usage(self.path)
+        self.ratio = usage.used / usage.total if usage.total else 0.0
+        if not self.paused and self.ratio >= self.high:
+            self.paused = True
+            logger.warning(f"Disco al {self.ratio:.0%}: se pausan las grabaciones automáticas")
+        elif self.paused and self.ratio <= self.low:
+            self.paused = False
+            logger.info(f"Disco al {self.ratio:.0%}: se reanudan las grabaciones automáticas")
+        return self.ratio
+
+
+class RetentionService:
+    """
+    Aplica las políticas de retención a las grabaciones del catálogo.
+
+    Por cada servidor, en este orden:
+    - borra las grabaciones más antiguas que delete_after_days
+    - borra las más antiguas mientras el servidor supere su cuota (quota_mb)
+    - archiva las más antiguas que archive_after_days: los WAV se recodifican
+      a ARCHIVE_FORMAT y todo se mueve a ARCHIVE_DIR junto con sus pistas
+
+    El trabajo se hace por lotes de como mucho batch_size archivos; cada lote
+    consulta el catálogo (sin recorrer el disco) y las grabaciones con un
+    trabajo de transcripción activo se dejan para más adelante.
+    """
+
+    def __init__(self, catalog, recordings_dir, archive_dir, archive_tracks_dir, batch_size=10):
+        self.catalog = catalog
+        self.recordings_dir = recordings_dir
+        self.archive_dir = archive_dir
+        self.archive_tracks_dir = archive_tracks_dir
+        self.batch_size = batch_size
+        self.watermark = DiskWatermark(recordings_dir, config.DISK_HIGH_WATERMARK, config.DISK_LOW_WATERMARK)
+
+    def run_batch(self, busy_paths=None, now=None):
+        """
+        Procesa un lote de grabaciones
+
+        Args:
+            busy_paths: Función que devuelve las rutas que no se deben tocar (opcional)
+            now: Instante de referencia para las antigüedades (por defecto, ahora)
+
+        Returns:
+            Diccionario con deleted, archived, freed (bytes) y more (si quedó
+            trabajo pendiente por agotar el lote)
+        """
+        now = now or time.time()
+        busy = set(busy_paths()) if busy_paths else set()
+        result = {'deleted': 0, 'archived': 0, 'freed': 0, 'more': False}
+        budget = self.batch_size
+
+        for guild_id, (_, size) in self.catalog.usage_by_guild().items():
+            if budget <= 0:
+                result['more'] = True
+                break
+            policy = policy_for(guild_id)
+
+            quota = policy['quota_mb'] * MB if policy['quota_mb'] is not None else None
+            expired = now - policy['delete_after_days'] * DAY if policy['delete_after_days'] is not None else None
+            # Por encima de la cuota se borra desde la más antigua, haya caducado o no
+            if quota is not None and size > quota:
+                candidates = self.catalog.oldest(guild_id, limit=budget + len(busy))
+            elif expired is not None:
+                candidates = self.catalog.oldest(guild_id, created_before=expired, limit=budget + len(busy))
+            else:
+                candidates = []
+            for recording in candidates:
+                over_quota = quota is not None and size > quota
+                too_old = expired is not None and recording['created'] < expired
+                if budget <= 0 or not (over_quota or too_old):
+                    break
+                if recording['path'] in busy:
+                    continue
+                if self._delete(recording):
+                    size -= recording['size']
+                    result['deleted'] += 1
+                    result['freed'] += recording['size']
+                budget -= 1
+
+            if budget > 0 and policy['archive_after_days'] is not None:
+                cold = self.catalog.oldest(
+                    guild_id, created_before=now - policy['archive_after_days'] * DAY,
+                    root=self.recordings_dir, limit=budget + len(busy))
+                for recording in cold:
+                    if budget <= 0:
+                        break
+                    if recording['path'] in busy:
+                        continue
+                    freed = self._archive(recording)
+                    if freed is not None:
+                        result['archived'] += 1
+                        result['freed'] += freed
+                    budget -= 1
+
+            if budget <= 0:
+                result['more'] = True
+
+        if result['deleted'] or result['archived']:
+            logger.info(f"Retención: {result['deleted']} grabaciones borradas, {result['archived']} archivadas, "
+                        f"{result['freed'] / MB:.1f} MB liberados")
+        return result
+
+    def _delete(self, recording):
+        try:
+            delete_recording_file(recording['path'])
+        except FileNotFoundError:
+            # Ya no estaba en disco: basta con olvidarla
+            self.catalog.remove(recording['path'])
+        except OSError as e:
+            logger.error(f"No se pudo borrar {recording['path']}: {e}")
+            return False
+        metrics.retention_actions.inc(('delete',))
+        return True
+
+    def _archive(self, recording):
+        """
+        Mueve una grabación al archivo, recodificándola si es WAV
+
+        Returns:
+            Bytes liberados en el disco de las grabaciones o None si falló
+        """
+        path = recording['path']
+        rel_path = os.path.relpath(path, self.recordings_dir)
+        base, ext = os.path.splitext(rel_path)
+        encode = ext == '.wav' and config.ARCHIVE_FORMAT != 'wav' and ffmpeg_available()
+        target = os.path.join(self.archive_dir, base + ('.' + config.ARCHIVE_FORMAT if encode else ext))
+        if os.path.exists(target):
+            logger.warning(f"Ya existe {target}; no se archiva {path}")
+            return None
+
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if encode:
+                # Se codifica a un nombre temporal (que el catálogo ignora) y se renombra al terminar
+                partial = target + '.parcial'
+                try:
+                    encode_file(path, partial, fmt=config.ARCHIVE_FORMAT, bitrate=config.ARCHIVE_BITRATE)
+                    shutil.copystat(path, partial)
+                    os.replace(partial, target)
+                except Exception:
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                    raise
+                self.catalog.relocate(path, target)
+                os.remove(path)
+            else:
+                shutil.move(path, target)
+                self.catalog.relocate(path, target)
+        except (OSError, RuntimeError) as e:
+            logger.error(f"No se pudo archivar {path}: {e}")
+            return None
+
+        # La caché memoriza la huella del archivo por ruta
+        cache = get_cache()
+        if cache is not None:
+            cache.forget_path(path)
+
+        tracks_dir = get_tracks_dir(path)
+        if tracks_dir and not tracks_dir.startswith(self.archive_tracks_dir + os.sep):
+            try:
+                os.makedirs(self.archive_tracks_dir, exist_ok=True)
+                shutil.move(tracks_dir, os.path.join(self.archive_tracks_dir, os.path.basename(tracks_dir)))
+            except OSError as e:
+                logger.error(f"No se pudieron archivar las pistas de {path}: {e}")
+
+        metrics.retention_actions.inc(('archive',))
+        # Con el archivo en otro volumen se libera la grabación entera
+        if os.stat(target).st_dev != os.stat(self.recordings_dir).st_dev:
+            return recording['size']
+        return max(recording['size'] - os.path.getsize(target), 0) if encode else 0
+
+
+_service = None
+
+
+def get_retention():
+    """Devuelve el servicio de retención del proceso"""
+    global _service
+    if _service is None:
+        _service = RetentionService(get_catalog(), config.RECORDINGS_DIR, config.ARCHIVE_DIR,
+                                    config.ARCHIVE_TRACKS_DIR, batch_size=config.RETENTION_BATCH_SIZE)
+    return _service
+
+
+def auto_recording_paused():
+    """Si no se deben iniciar grabaciones automáticas por falta de espacio en disco"""
+    return _service is not None and _service.watermark.paused
+
+
+async def retention_loop(apply_policies=True, busy_paths=None):
+    """
+    Bucle del servicio de retención: vigila el disco cada DISK_CHECK_INTERVAL
+    segundos y aplica las políticas por lotes cada RETENTION_INTERVAL (o
+    enseguida si el disco está por encima del umbral)
+
+    Args:
+        apply_policies: Si este proceso borra y archiva (con shards, solo el primero)
+        busy_paths: Función que devuelve las grabaciones en uso (ver RetentionService.run_batch)
+    """
+    service = get_retention()
+    executor = get_executor()
+    last_pass = None
+    more = False
+    while True:
+        try:
+            await executor.run_io(service.watermark.check)
+            due = last_pass is None or time.monotonic() - last_pass >= config.RETENTION_INTERVAL
+            if apply_policies and (more or due or service.watermark.paused):
+                if not more:
+                    last_pass = time.monotonic()
+                result = await executor.run_io(service.run_batch, busy_paths)
+                more = result['more']
+        except Exception as e:
+            logger.error(f"Error en el servicio de retención: {e}")
+            more = False
+        await asyncio.sleep(config.RETENTION_BATCH_PAUSE if more else config.DISK_CHECK_INTERVAL)
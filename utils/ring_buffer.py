@@ -0,0 +1,93 @@
+import threading
+
+
+class RingBuffer:
+    """
+    Buffer circular de bytes preasignado para un productor y un consumidor.
+
+    El hilo de voz (productor) copia cada paquete en el espacio libre con una
+    asignación de slice sobre un memoryview: no crea objetos nuevos ni toma
+    cerrojos. El consumidor obtiene vistas de los datos pendientes (sin
+    copiarlos), los escribe en bloques grandes y después libera el espacio.
+
+    Cada posición solo la modifica un hilo (write_pos el productor, read_pos
+    el consumidor), y una escritura se publica al avanzar write_pos después
+    de copiar los datos, así que el consumidor nunca ve datos a medias.
+    """
+
+    def __init__(self, capacity, notify_threshold=None):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._write_pos = 0  # Total de bytes escritos (solo crece)
+        self._read_pos = 0  # Total de bytes consumidos (solo crece)
+        # El consumidor se despierta cuando hay al menos notify_threshold bytes pendientes
+        self.notify_threshold = notify_threshold or capacity // 4
+        self.data_ready = threading.Event()
+
+    def __len__(self):
+        """Bytes pendientes de consumir"""
+        return self._write_pos - self._read_pos
+
+    @property
+    def free(self):
+        return self.capacity - (self._write_pos - self._read_pos)
+
+    def write(self, *parts):
+        """
+        Copia uno o varios trozos de datos seguidos en el buffer
+
+        Los trozos se publican juntos: el consumidor ve todos o ninguno.
+
+        Args:
+            parts: Objetos compatibles con el protocolo buffer (bytes, bytearray, memoryview)
+
+        Returns:
+            False si no hay espacio para todos (no se copia nada), True en caso contrario
+        """
+        total = 0
+        for part in parts:
+            total += len(part)
+        if total > self.capacity - (self._write_pos - self._read_pos):
+            return False
+
+        capacity = self.capacity
+        view = self._view
+        position = self._write_pos
+        for part in parts:
+            size = len(part)
+            start = position % capacity
+            first = capacity - start
+            if size <= first:
+                view[start:start + size] = part
+            else:
+                part = memoryview(part)
+                view[start:] = part[:first]
+                view[:size - first] = part[first:]
+            position += size
+
+        self._write_pos = position
+        if position - self._read_pos >= self.notify_threshold and not self.data_ready.is_set():
+            self.data_ready.set()
+        return True
+
+    def peek(self):
+        """
+        Vistas de los datos pendientes, sin copiarlos
+
+        Returns:
+            Lista con una o dos memoryview (dos si los datos dan la vuelta al buffer)
+        """
+        read_pos, write_pos = self._read_pos, self._write_pos
+        size = write_pos - read_pos
+        if not size:
+            return []
+        start = read_pos % self.capacity
+        end = start + size
+        if end <= self.capacity:
+            return [self._view[start:end]]
+        return [self._view[start:], self._view[:end - self.capacity]]
+
+    def consume(self, size):
+        """Libera los primeros size bytes pendientes, ya procesados por el consumidor"""
+        self._read_pos += size
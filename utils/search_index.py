@@ -0,0 +1,298 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+import config
+from utils import metrics
+from utils.catalog import get_catalog
+
+logger = logging.getLogger('discord-recording-bot.search_index')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    recording TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    guild_id INTEGER,
+    indexed REAL NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_guild ON transcripts (guild_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments USING fts5(
+    text,
+    speaker,
+    start_ms UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# El rowid de cada segmento es (id_transcripción << SEGMENT_BITS) | índice, de modo que
+# los segmentos de una transcripción se borran por rango de rowid sin recorrer la tabla
+SEGMENT_BITS = 20
+
+# Líneas de los archivos de transcripción: "[HH:MM:SS] hablante: texto" o "[HH:MM:SS] texto"
+_LINE = re.compile(r'^\[(\d+):(\d{2}):(\d{2})\] (.*)$')
+
+
+def parse_transcript(text, with_speakers=False):
+    """
+    Recupera los segmentos de un archivo de transcripción ya escrito
+
+    Las marcas de tiempo de los archivos tienen resolución de segundos.
+
+    Args:
+        text: Contenido del archivo
+        with_speakers: Si las líneas llevan "hablante: " delante del texto
+
+    Returns:
+        Lista de tuplas (inicio_ms, hablante, texto)
+    """
+    segments = []
+    for line in text.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        hours, minutes, seconds, content = match.groups()
+        speaker = ""
+        if with_speakers and ": " in content:
+            speaker, content = content.split(": ", 1)
+        start_ms = (int(hours) * 3600 + int(minutes) * 60 + int(seconds)) * 1000
+        segments.append((start_ms, speaker, content))
+    return segments
+
+
+def build_query(terms):
+    """
+    Convierte los términos del usuario en una consulta FTS5
+
+    Cada término se busca literalmente (sin la sintaxis de FTS5) y todos
+    deben aparecer; un término acabado en * busca por prefijo.
+    """
+    parts = []
+    for term in terms:
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            parts.append(f'"{term}"' + ('*' if prefix else ''))
+    return " ".join(parts)
+
+
+class SearchIndex:
+    """
+    Índice de texto completo (SQLite FTS5) de las transcripciones.
+
+    Cada segmento se guarda con su grabación, su hablante y su instante de
+    inicio en milisegundos. El índice se actualiza al escribir cada
+    transcripción (reindexar una grabación sustituye sus segmentos) y las
+    búsquedas se ordenan por relevancia (BM25) dentro del propio FTS5, sin
+    leer los archivos de transcripción.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def add(self, recording, path, segments, guild_id=None):
+        """
+        Indexa (o reindexa) la transcripción de una grabación
+
+        Args:
+            recording: Nombre de la grabación
+            path: Ruta al archivo de la transcripción
+            segments: Iterable de tuplas (inicio_ms, hablante, texto)
+            guild_id: ID del servidor de la grabación (opcional)
+
+        Returns:
+            Número de segmentos indexados
+        """
+        rows = [(text, speaker or "", start_ms) for start_ms, speaker, text in segments if text]
+        rows = rows[:1 << SEGMENT_BITS]
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = time.time()
+
+        with self._lock, self._conn:
+            existing = self._conn.execute(
+                "SELECT id FROM transcripts WHERE recording = ?", (recording,)).fetchone()
+            if existing is not None:
+                transcript_id = existing[0]
+                self._delete_segments(transcript_id)
+                self._conn.execute(
+                    "UPDATE transcripts SET path = ?, guild_id = ?, indexed = ?, mtime = ? WHERE id = ?",
+                    (path, guild_id, time.time(), mtime, transcript_id))
+            else:
+                transcript_id = self._conn.execute(
+                    "INSERT INTO transcripts (recording, path, guild_id, indexed, mtime) VALUES (?, ?, ?, ?, ?)",
+                    (recording, path, guild_id, time.time(), mtime)).lastrowid
+            base = transcript_id << SEGMENT_BITS
+            self._conn.executemany(
+                "INSERT INTO segments (rowid, text, speaker, start_ms) VALUES (?, ?, ?, ?)",
+                [(base + i, text, speaker, start_ms) for i, (text, speaker, start_ms) in enumerate(rows)])
+        return len(rows)
+
+    def _delete_segments(self, transcript_id):
+        base = transcript_id << SEGMENT_BITS
+        self._conn.execute(
+            "DELETE FROM segments WHERE rowid BETWEEN ? AND ?", (base, base + (1 << SEGMENT_BITS) - 1))
+
+    def remove(self, recording):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM transcripts WHERE recording = ?", (recording,)).fetchone()
+            if row is not None:
+                self._delete_segments(row[0])
+                self._conn.execute("DELETE FROM transcripts WHERE id = ?", (row[0],))
+
+    def search(self, terms, guild_id=None, limit=10):
+        """
+        Busca segmentos que contengan todos los términos
+
+        Args:
+            terms: Lista de términos de búsqueda
+            guild_id: Restringir la búsqueda a un servidor (opcional)
+            limit: Número máximo de resultados
+
+        Returns:
+            Lista de diccionarios con recording, speaker, start_ms y text (con
+            los términos resaltados en negrita), de más a menos relevante
+        """
+        query = build_query(terms)
+        if not query:
+            return []
+
+        started = time.perf_counter()
+        guild_filter = " AND t.guild_id = ?" if guild_id is not None else ""
+        params = (query,) + ((guild_id,) if guild_id is not None else ()) + (limit,)
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT t.recording, s.speaker, s.start_ms, highlight(segments, 0, '**', '**') AS text "
+                    f"FROM segments s JOIN transcripts t ON t.id = (s.rowid >> {SEGMENT_BITS}) "
+                    "WHERE segments MATCH ?" + guild_filter + " ORDER BY s.rank LIMIT ?",
+                    params
+                ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            metrics.search_lookup.observe(time.perf_counter() - started)
+
+    def count(self):
+        """Tupla (transcripciones, segmentos) indexados"""
+        with self._lock:
+            transcripts = self._conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+            segments = self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        return transcripts, segments
+
+    def reconcile(self, transcriptions_dir, guild_of=None):
+        """
+        Indexa los archivos de transcripción que falten o hayan cambiado en
+        disco y olvida los que ya no existen
+
+        Args:
+            transcriptions_dir: Directorio con los archivos .txt
+            guild_of: Función que da el servidor de una grabación por su nombre
+                (el catálogo); si no lo conoce, se deduce del nombre por defecto
+
+        Returns:
+            Tupla (indexadas, eliminadas)
+        """
+        with self._lock:
+            known = {row['recording']: (row['mtime'], row['guild_id']) for row in
+                     self._conn.execute("SELECT recording, mtime, guild_id FROM transcripts")}
+
+        def guild_for(recording):
+            guild_id = guild_of(recording) if guild_of is not None else None
+            return guild_id if guild_id is not None else _guild_from_name(recording)
+
+        on_disk = {}
+        if os.path.isdir(transcriptions_dir):
+            for file in os.listdir(transcriptions_dir):
+                if file.endswith('.txt'):
+                    on_disk[file[:-len('.txt')]] = os.path.join(transcriptions_dir, file)
+
+        indexed = 0
+        for recording, path in on_disk.items():
+            try:
+                mtime, guild_id = known.get(recording, (None, None))
+                if mtime == os.path.getmtime(path):
+                    # Sin cambios; solo se completa el servidor si antes no se conocía
+                    if guild_id is None:
+                        guild_id = guild_for(recording)
+                        if guild_id is not None:
+                            self._set_guild(recording, guild_id)
+                            indexed += 1
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+                # Las transcripciones por hablante tienen "nombre: " tras la marca de tiempo
+                segments = parse_transcript(text, with_speakers=self._has_speakers(text))
+                self.add(recording, path, segments, guild_id=guild_for(recording))
+                indexed += 1
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"No se pudo indexar {path}: {e}")
+
+        missing = set(known) - set(on_disk)
+        for recording in missing:
+            self.remove(recording)
+        return indexed, len(missing)
+
+    def _set_guild(self, recording, guild_id):
+        with self._lock:
+            self._conn.execute("UPDATE transcripts SET guild_id = ? WHERE recording = ?", (guild_id, recording))
+            self._conn.commit()
+
+    @staticmethod
+    def _has_speakers(text):
+        lines = [match.group(4) for match in map(_LINE.match, text.splitlines()[:20]) if match]
+        return bool(lines) and all(": " in line for line in lines)
+
+
+# Nombre por defecto de las grabaciones: grabacion_{servidor}_{canal}_{timestamp}
+_DEFAULT_NAME = re.compile(r'^grabacion_(\d+)_')
+
+
+def _guild_from_name(recording):
+    match = _DEFAULT_NAME.match(recording)
+    return int(match.group(1)) if match else None
+
+
+_index = None
+
+
+def get_search_index():
+    """Devuelve el índice de búsqueda compartido del proceso"""
+    global _index
+    if _index is None:
+        _index = SearchIndex(config.SEARCH_DB)
+    return _index
+
+
+def index_transcript(transcript_file, segments, guild_id=None):
+    """
+    Indexa una transcripción recién escrita
+
+    Args:
+        transcript_file: Ruta al archivo de la transcripción
+        segments: Iterable de tuplas (inicio_ms, hablante, texto)
+        guild_id: ID del servidor de la grabación
+
+    Returns:
+        Número de segmentos indexados
+    """
+    recording = os.path.basename(transcript_file).rsplit('.', 1)[0]
+    return get_search_index().add(recording, transcript_file, segments, guild_id=guild_id)
+
+
+def reconcile_search_index():
+    """Sincroniza el índice de búsqueda con las transcripciones en disco"""
+    indexed, removed = get_search_index().reconcile(config.TRANSCRIPTIONS_DIR, guild_of=get_catalog().guild_of)
+    if indexed or removed:
+        logger.info(f"Índice de búsqueda sincronizado: {indexed} transcripciones indexadas, {removed} eliminadas")
+    return indexed, removed
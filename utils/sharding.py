@@ -0,0 +1,101 @@
+import os
+import sys
+import signal
+import subprocess
+import time
+import logging
+import config
+
+logger = logging.getLogger('discord-recording-bot.sharding')
+
+
+def shard_for_guild(guild_id, shard_count):
+    """Shard de Discord al que pertenece un servidor"""
+    return (guild_id >> 22) % shard_count
+
+
+def partition_shards(shard_count, processes):
+    """
+    Reparte los shards entre procesos de forma alterna
+
+    Returns:
+        Lista con los IDs de shard de cada proceso
+    """
+    processes = max(min(processes, shard_count), 1)
+    return [list(range(index, shard_count, processes)) for index in range(processes)]
+
+
+def owns_guild(guild_id):
+    """Si este proceso atiende al servidor (siempre, si no se ejecuta por shards)"""
+    if config.SHARD_IDS is None or guild_id is None:
+        return True
+    return shard_for_guild(guild_id, config.SHARD_COUNT) in config.SHARD_IDS
+
+
+def process_key():
+    """Identificador estable del proceso, el mismo tras cada reinicio"""
+    if config.SHARD_IDS is None:
+        return 'principal'
+    return 'shards-' + '-'.join(str(shard) for shard in config.SHARD_IDS)
+
+
+def is_primary():
+    """El primer proceso se encarga de las tareas globales (sincronizar el catálogo, el índice...)"""
+    return config.SHARD_PROCESS_INDEX == 0
+
+
+def run_supervisor(script):
+    """
+    Lanza un proceso del bot por cada grupo de shards y los reinicia si caen
+
+    Cada proceso ejecuta el mismo script con SHARD_IDS y SHARD_PROCESS_INDEX
+    en el entorno. El supervisor no se conecta a Discord: solo vigila a los
+    procesos y les reenvía la señal de parada.
+
+    Args:
+        script: Ruta del script principal del bot
+    """
+    groups = partition_shards(config.SHARD_COUNT, config.SHARD_PROCESSES)
+    logger.info(f"Iniciando {len(groups)} procesos para {config.SHARD_COUNT} shards: {groups}")
+
+    def spawn(index):
+        env = dict(os.environ,
+                   SHARD_IDS=",".join(str(shard) for shard in groups[index]),
+                   SHARD_PROCESS_INDEX=str(index))
+        return subprocess.Popen([sys.executable, script], env=env)
+
+    workers = {index: spawn(index) for index in range(len(groups))}
+    restarts = {index: [] for index in workers}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for worker in workers.values():
+            if worker.poll() is None:
+                worker.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for index, worker in list(workers.items()):
+            code = worker.poll()
+            if code is None or stopping:
+                continue
+            # Reinicio con espera creciente si el proceso cae repetidamente
+            now = time.monotonic()
+            restarts[index] = [t for t in restarts[index] if now - t < 300] + [now]
+            delay = min(2 ** (len(restarts[index]) - 1), 60)
+            logger.error(f"El proceso de los shards {groups[index]} terminó con código {code}; "
+                         f"se reinicia en {delay} s")
+            time.sleep(delay)
+            if not stopping:
+                workers[index] = spawn(index)
+
+    for worker in workers.values():
+        try:
+            worker.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            worker.kill()
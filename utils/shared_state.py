@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+import config
+from utils.sharding import process_key
+
+logger = logging.getLogger('discord-recording-bot.shared_state')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processes (
+    key TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    shard_ids TEXT,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    process_key TEXT NOT NULL,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (guild_id, channel_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_process ON sessions (process_key);
+"""
+
+
+class SharedState:
+    """
+    Estado compartido entre los procesos del bot cuando se ejecuta por shards.
+
+    Cada proceso publica periódicamente sus grabaciones activas y un latido
+    en una base SQLite local; cualquier proceso puede agregar la vista de
+    todos (para !status y para los límites globales de admisión). Los
+    procesos sin latido reciente se consideran caídos y se ignoran.
+    """
+
+    def __init__(self, db_path, process_key, shard_ids=None):
+        self.db_path = db_path
+        self.process_key = process_key
+        self.shard_ids = shard_ids
+        self.started = time.time()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def publish(self, stats):
+        """
+        Sustituye las grabaciones publicadas por este proceso y renueva su latido
+
+        Args:
+            stats: Lista de estadísticas de sesión (ver RecordingSession.sample)
+        """
+        now = time.time()
+        rows = [
+            (self.process_key, stat['guild_id'], stat['channel_id'], json.dumps(stat, default=_to_json))
+            for stat in stats
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processes (key, pid, shard_ids, started, heartbeat) VALUES (?, ?, ?, ?, ?)",
+                (self.process_key, os.getpid(), json.dumps(self.shard_ids), self.started, now))
+            self._conn.execute("DELETE FROM sessions WHERE process_key = ?", (self.process_key,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions (process_key, guild_id, channel_id, stats) VALUES (?, ?, ?, ?)",
+                rows)
+
+    def aggregate(self, max_age=None):
+        """
+        Vista agregada de las grabaciones de todos los procesos vivos
+
+        Args:
+            max_age: Segundos sin latido tras los que un proceso se da por caído
+
+        Returns:
+            Diccionario con processes (lista de procesos vivos), sessions (total),
+            remote_sessions (de otros procesos), buffered_bytes y packets_per_second
+        """
+        max_age = max_age or config.SHARED_STATE_INTERVAL * 3
+        cutoff = time.time() - max_age
+        with self._lock:
+            processes = [dict(row) for row in self._conn.execute(
+                "SELECT key, pid, shard_ids, heartbeat FROM processes WHERE heartbeat >= ? ORDER BY key", (cutoff,))]
+            alive = [process['key'] for process in processes]
+            rows = self._conn.execute(
+                f"SELECT process_key, stats FROM sessions WHERE process_key IN ({','.join('?' * len(alive))})",
+                alive).fetchall() if alive else []
+
+        result = {
+            'processes': processes,
+            'sessions': len(rows),
+            'remote_sessions': 0,
+            'buffered_bytes': 0,
+            'packets_per_second': 0.0,
+        }
+        for row in rows:
+            stat = json.loads(row['stats'])
+            result['buffered_bytes'] += stat.get('buffered_bytes', 0)
+            result['packets_per_second'] += stat.get('packets_per_second', 0.0)
+            if row['process_key'] != self.process_key:
+                result['remote_sessions'] += 1
+        return result
+
+    def clear(self):
+        """Retira las grabaciones y el latido de este proceso al detenerse"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE process_key = ?", (self.process_key,))
+            self._conn.execute("DELETE FROM processes WHERE key = ?", (self.process_key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _to_json(value):
+    # La duración de las sesiones es un timedelta
+    if hasattr(value, 'total_seconds'):
+        return value.total_seconds()
+    return str(value)
+
+
+_state = None
+
+
+def get_shared_state():
+    """Devuelve el estado compartido de este proceso"""
+    global _state
+    if _state is None:
+        _state = SharedState(config.SHARED_STATE_DB, process_key(), config.SHARD_IDS)
+    return _state
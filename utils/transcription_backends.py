@@ -0,0 +1,243 @@
+import os
+import time
+import zlib
+import atexit
+import importlib.util
+import tempfile
+import threading
+import logging
+import config
+from utils.lazy import lazy_import
+
+logger = logging.getLogger('discord-recording-bot.transcription_backends')
+
+# speech_recognition se carga al transcribir el primer fragmento
+sr = lazy_import('speech_recognition')
+
+
+class TranscriptionError(Exception):
+    """Error del servicio o motor de reconocimiento (el fragmento puede reintentarse)"""
+
+
+class BackendUnavailableError(ValueError):
+    """El motor configurado no se puede usar (falta una dependencia opcional)"""
+
+
+class TranscriptionBackend:
+    """
+    Interfaz común de los motores de transcripción.
+
+    Un motor recibe fragmentos PCM mono de 16 bits y devuelve su texto.
+    transcribe_stream ofrece la versión en streaming: fragmentos con tiempo
+    de entrada, segmentos con tiempo de salida.
+    """
+
+    # Nombre con el que se registra el motor (valor de config.TRANSCRIPTION_API)
+    name = None
+    # Si el motor consume CPU local se ejecuta en el pool de procesos; si no, en el de E/S
+    cpu_bound = False
+    # Si necesita red para funcionar
+    requires_network = True
+    # Dependencias opcionales del motor: {módulo: extra de pyproject.toml que lo instala}
+    requires = {}
+
+    def __init__(self, language='en-US'):
+        self.check_requirements()
+        self.language = language
+
+    @classmethod
+    def check_requirements(cls):
+        """
+        Comprueba que están instaladas las dependencias opcionales del motor
+
+        Raises:
+            BackendUnavailableError: Si falta alguna
+        """
+        for module, extra in cls.requires.items():
+            if importlib.util.find_spec(module) is None:
+                raise BackendUnavailableError(
+                    f"El motor de transcripción '{cls.name}' necesita el paquete {module}; "
+                    f"instálalo con `pip install .[{extra}]` o elige otro TRANSCRIPTION_API")
+
+    @property
+    def settings_key(self):
+        """Identifica la configuración del motor (para cachés y estadísticas)"""
+        return f"{self.name}:{self.language}"
+
+    def transcribe_chunk(self, pcm, sample_rate):
+        """
+        Transcribe un fragmento de audio
+
+        Args:
+            pcm: Audio PCM mono de 16 bits
+            sample_rate: Frecuencia de muestreo del fragmento
+
+        Returns:
+            Texto reconocido ("" si no se entiende nada)
+        """
+        raise NotImplementedError
+
+    def transcribe_stream(self, chunks):
+        """
+        Transcribe una secuencia de fragmentos
+
+        Args:
+            chunks: Iterable de tuplas (inicio_ms, fin_ms, pcm, frecuencia_de_muestreo)
+
+        Yields:
+            Segmentos (inicio_ms, fin_ms, texto)
+        """
+        for start_ms, end_ms, pcm, sample_rate in chunks:
+            yield start_ms, end_ms, self.transcribe_chunk(pcm, sample_rate)
+
+
+BACKENDS = {}
+_instances = {}
+
+
+def register_backend(cls):
+    """Decorador que registra un motor de transcripción por su nombre"""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def get_backend(name):
+    """
+    Devuelve la instancia (compartida por proceso) de un motor registrado
+
+    Args:
+        name: Nombre del motor
+
+    Returns:
+        Instancia de TranscriptionBackend
+    """
+    check_backend(name)
+    backend = _instances.get(name)
+    if backend is None:
+        backend = BACKENDS[name](language=config.TRANSCRIPTION_LANGUAGE)
+        _instances[name] = backend
+    return backend
+
+
+def check_backend(name):
+    """
+    Comprueba que un motor existe y tiene sus dependencias, sin crearlo
+    (no carga speech_recognition, así que sirve al arrancar)
+
+    Raises:
+        ValueError: Si el motor no está registrado
+        BackendUnavailableError: Si falta una dependencia opcional del motor
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported transcription API: {name}")
+    BACKENDS[name].check_requirements()
+
+
+class SpeechRecognitionBackend(TranscriptionBackend):
+    """Base para los motores implementados con la librería speech_recognition"""
+
+    def __init__(self, language='en-US'):
+        super().__init__(language)
+        self.recognizer = sr.Recognizer()
+
+    def _recognize(self, audio):
+        raise NotImplementedError
+
+    def transcribe_chunk(self, pcm, sample_rate):
+        audio = sr.AudioData(pcm, sample_rate, 2)
+        try:
+            return self._recognize(audio)
+        except sr.UnknownValueError:
+            # Fragmento sin voz reconocible
+            return ""
+        except sr.RequestError as e:
+            raise TranscriptionError(f"Could not request results from {self.name} service; {e}")
+
+
+@register_backend
+class GoogleWebBackend(SpeechRecognitionBackend):
+    """API web gratuita de Google (la que usaba el bot originalmente)"""
+    name = 'speech_recognition'
+
+    def _recognize(self, audio):
+        return self.recognizer.recognize_google(audio, language=self.language)
+
+
+@register_backend
+class GoogleCloudBackend(SpeechRecognitionBackend):
+    """Google Cloud Speech-to-Text; requiere GOOGLE_APPLICATION_CREDENTIALS"""
+    name = 'google'
+
+    def _recognize(self, audio):
+        if google_credentials_file() is None:
+            raise TranscriptionError("GOOGLE_APPLICATION_CREDENTIALS no está configurado")
+        return self.recognizer.recognize_google_cloud(audio, language_code=self.language)
+
+
+_credentials_lock = threading.Lock()
+_credentials_path = None
+
+
+def google_credentials_file():
+    """
+    Ruta al archivo de credenciales de Google Cloud
+
+    config.GOOGLE_APPLICATION_CREDENTIALS puede ser la ruta del archivo o su
+    contenido JSON. En ese caso se escribe a un archivo temporal la primera
+    vez que se usa el motor (no al importar la configuración) y se borra al
+    terminar el proceso.
+
+    Returns:
+        Ruta al archivo o None si no hay credenciales configuradas
+    """
+    global _credentials_path
+    credentials = config.GOOGLE_APPLICATION_CREDENTIALS
+    if not credentials:
+        return None
+    if os.path.isfile(credentials):
+        return credentials
+
+    with _credentials_lock:
+        if _credentials_path is None:
+            with tempfile.NamedTemporaryFile('w', delete=False, suffix='.json') as f:
+                f.write(credentials)
+            _credentials_path = f.name
+            atexit.register(_remove_credentials_file, f.name)
+            # La librería de Google lee la ruta de esta variable de entorno
+            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = f.name
+        return _credentials_path
+
+
+def _remove_credentials_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@register_backend
+class SphinxBackend(SpeechRecognitionBackend):
+    """Reconocimiento local con PocketSphinx: sin red ni cuota, consume CPU"""
+    name = 'sphinx'
+    cpu_bound = True
+    requires_network = False
+    requires = {'pocketsphinx': 'sphinx'}
+
+    def _recognize(self, audio):
+        return self.recognizer.recognize_sphinx(audio, language=self.language)
+
+
+@register_backend
+class MockBackend(TranscriptionBackend):
+    """
+    Motor determinista para pruebas de carga: el texto depende solo del audio
+    y la latencia simulada es configurable (config.MOCK_BACKEND_LATENCY)
+    """
+    name = 'mock'
+    requires_network = False
+
+    def transcribe_chunk(self, pcm, sample_rate):
+        if config.MOCK_BACKEND_LATENCY:
+            time.sleep(config.MOCK_BACKEND_LATENCY)
+        duration_ms = len(pcm) * 1000 // (2 * sample_rate)
+        return f"segmento de {duration_ms} ms ({zlib.crc32(pcm):08x})"
@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+import config
+
+logger = logging.getLogger('discord-recording-bot.transcription_cache')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    audio_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_cache (
+    audio_hash TEXT NOT NULL,
+    settings_key TEXT NOT NULL,
+    segments TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (audio_hash, settings_key)
+);
+CREATE TABLE IF NOT EXISTS chunk_cache (
+    chunk_hash TEXT NOT NULL,
+    settings_key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (chunk_hash, settings_key)
+);
+"""
+
+
+def hash_bytes(data):
+    """Huella de un bloque de audio en memoria"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """
+    Huella de un archivo calculada en streaming, sin cargarlo en memoria
+
+    Args:
+        file_path: Ruta al archivo
+        block_size: Tamaño del bloque de lectura
+
+    Returns:
+        Huella hexadecimal del contenido
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Caché de transcripciones direccionada por contenido.
+
+    Guarda dos niveles, ambos asociados a la configuración del motor:
+    - Archivo completo: huella del audio -> segmentos transcritos
+    - Fragmento: huella del PCM de cada fragmento -> texto
+
+    Así, repetir !transcribir sobre la misma grabación es inmediato, y una
+    grabación con una parte modificada solo vuelve a reconocer los
+    fragmentos que cambiaron. La huella de cada archivo se recuerda junto con
+    su tamaño y fecha de modificación para no releerlo si no ha cambiado.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def file_hash(self, file_path):
+        """Huella del contenido de un archivo, reutilizando la calculada si no ha cambiado"""
+        stat = os.stat(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime, audio_hash FROM file_hashes WHERE path = ?", (file_path,)
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+
+        audio_hash = hash_file(file_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime, audio_hash) VALUES (?, ?, ?, ?)",
+                (file_path, stat.st_size, stat.st_mtime, audio_hash)
+            )
+        return audio_hash
+
+    def get_segments(self, audio_hash, settings_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segments FROM file_cache WHERE audio_hash = ? AND settings_key = ?",
+                (audio_hash, settings_key)
+            ).fetchone()
+        return [tuple(segment) for segment in json.loads(row[0])] if row else None
+
+    def put_segments(self, audio_hash, settings_key, segments):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_cache (audio_hash, settings_key, segments, created) VALUES (?, ?, ?, ?)",
+                (audio_hash, settings_key, json.dumps(segments), time.time())
+            )
+
+    def get_chunk(self, chunk_hash, settings_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM chunk_cache WHERE chunk_hash = ? AND settings_key = ?",
+                (chunk_hash, settings_key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_chunk(self, chunk_hash, settings_key, text):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_cache (chunk_hash, settings_key, text, created) VALUES (?, ?, ?, ?)",
+                (chunk_hash, settings_key, text, time.time())
+            )
+
+    def forget_path(self, file_path):
+        """Olvida la huella memorizada de un archivo (al borrarlo o moverlo)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_hashes WHERE path = ?", (file_path,))
+
+
+_cache = None
+_cache_pid = None
+# Cachés heredadas al hacer fork, que el proceso hijo no debe usar ni cerrar
+_inherited = []
+
+
+def get_cache():
+    """
+    Devuelve la caché compartida del proceso, o None si está desactivada
+
+    Cada proceso (incluidos los del pool de CPU) abre su propia conexión: los
+    workers se crean con fork y heredarían la conexión de SQLite y el lock del
+    proceso principal, que no se pueden usar tras el fork, así que se vuelve a
+    abrir cuando cambia el pid.
+    """
+    global _cache, _cache_pid
+    if not config.TRANSCRIPTION_CACHE:
+        return None
+    if _cache is None or _cache_pid != os.getpid():
+        if _cache is not None:
+            _inherited.append(_cache)
+        _cache = TranscriptionCache(config.CACHE_DB)
+        _cache_pid = os.getpid()
+    return _cache
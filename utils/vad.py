@@ -0,0 +1,133 @@
+import logging
+from utils.lazy import lazy_import
+from utils.wav_reader import WavReader
+
+logger = logging.getLogger('discord-recording-bot.vad')
+
+np = lazy_import('numpy')
+
+
+def iter_wav_blocks(file_path, block_duration=10.0):
+    """
+    Lee un WAV por bloques sin cargarlo entero en memoria
+
+    Args:
+        file_path: Ruta al archivo WAV
+        block_duration: Segundos de audio por bloque
+
+    Yields:
+        Tuplas (frame_inicial, muestras int16 con forma (n, canales))
+    """
+    with WavReader(file_path) as reader:
+        for position, data in reader.iter_blocks(int(reader.sample_rate * block_duration)):
+            yield position, np.frombuffer(data, dtype='<i2').reshape(-1, reader.channels)
+
+
+def frame_energies(file_path, frame_ms=30):
+    """
+    Calcula la energía RMS (en dBFS) de cada trama de un WAV en streaming
+
+    Args:
+        file_path: Ruta al archivo WAV
+        frame_ms: Duración de cada trama de análisis en milisegundos
+
+    Returns:
+        Tupla (energías en dBFS por trama, muestras por trama, frecuencia de muestreo)
+    """
+    with WavReader(file_path) as reader:
+        sample_rate = reader.sample_rate
+    frame_samples = sample_rate * frame_ms // 1000
+
+    energies = []
+    carry = np.empty((0,), dtype=np.float32)
+    for _, samples in iter_wav_blocks(file_path):
+        mono = np.concatenate((carry, samples.astype(np.float32).mean(axis=1)))
+        usable = len(mono) - len(mono) % frame_samples
+        frames = mono[:usable].reshape(-1, frame_samples)
+        energies.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        carry = mono[usable:]
+    if len(carry):
+        energies.append(np.array([np.sqrt(np.mean(carry * carry))], dtype=np.float32))
+
+    if not energies:
+        return np.empty((0,), dtype=np.float32), frame_samples, sample_rate
+    rms = np.concatenate(energies)
+    return 20 * np.log10(np.maximum(rms, 1.0) / 32768.0), frame_samples, sample_rate
+
+
+def speech_mask(energies_db, min_db=-50.0, margin_db=10.0):
+    """
+    Marca como voz las tramas que superan el umbral de energía
+
+    El umbral se adapta al ruido de fondo de la grabación (percentil 10 de la
+    energía) más un margen, sin bajar nunca de min_db.
+
+    Returns:
+        Array booleano con una entrada por trama
+    """
+    if not len(energies_db):
+        return np.zeros((0,), dtype=bool)
+    noise_floor = float(np.percentile(energies_db, 10))
+    threshold = max(min_db, noise_floor + margin_db)
+    return energies_db > threshold
+
+
+def split_on_silence(file_path, frame_ms=30, min_silence_ms=500, min_chunk=5.0, max_chunk=30.0,
+                     padding_ms=200, min_db=-50.0, energies=None):
+    """
+    Divide un WAV en fragmentos de voz cortando en los silencios
+
+    Args:
+        file_path: Ruta al archivo WAV
+        frame_ms: Duración de cada trama de análisis en milisegundos
+        min_silence_ms: Silencio mínimo para considerar un punto de corte
+        min_chunk: Duración mínima (segundos) de un fragmento antes de cortar
+        max_chunk: Duración máxima (segundos); se fuerza el corte si no hay silencio
+        padding_ms: Margen que se conserva alrededor de la voz de cada fragmento
+        min_db: Energía mínima (dBFS) para considerar una trama como voz
+        energies: Resultado de frame_energies ya calculado (p. ej. el del
+            resumen de la grabación); si se da, el archivo no se lee
+
+    Returns:
+        Lista de tuplas (frame_inicial, frame_final) de los fragmentos con voz
+    """
+    if energies is None:
+        energies = frame_energies(file_path, frame_ms)
+    energies, frame_samples, sample_rate = energies
+    speech = speech_mask(energies, min_db=min_db)
+    n_frames = len(speech)
+    if not n_frames or not speech.any():
+        return []
+
+    # Puntos de corte candidatos: el centro de cada silencio suficientemente largo
+    padded = np.concatenate(([True], speech, [True])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    silence_starts, silence_ends = changes[0::2], changes[1::2]
+    long_enough = (silence_ends - silence_starts) >= max(min_silence_ms // frame_ms, 1)
+    candidates = (silence_starts[long_enough] + silence_ends[long_enough]) // 2
+
+    min_frames = int(min_chunk * 1000 / frame_ms)
+    max_frames = int(max_chunk * 1000 / frame_ms)
+
+    cuts = [0]
+    for candidate in candidates:
+        while candidate - cuts[-1] > max_frames:
+            cuts.append(cuts[-1] + max_frames)
+        if candidate - cuts[-1] >= min_frames:
+            cuts.append(int(candidate))
+    while n_frames - cuts[-1] > max_frames:
+        cuts.append(cuts[-1] + max_frames)
+    cuts.append(n_frames)
+
+    # Recortar el silencio de los extremos y descartar fragmentos sin voz
+    pad = padding_ms // frame_ms
+    chunks = []
+    for start, end in zip(cuts[:-1], cuts[1:]):
+        voiced = np.flatnonzero(speech[start:end])
+        if not len(voiced):
+            continue
+        first = max(start + voiced[0] - pad, start)
+        last = min(start + voiced[-1] + 1 + pad, end)
+        chunks.append((int(first) * frame_samples, int(last) * frame_samples))
+
+    return chunks
@@ -0,0 +1,139 @@
+import mmap
+import os
+import struct
+import logging
+from utils.audio_writer import build_wav_header
+
+logger = logging.getLogger('discord-recording-bot.wav_reader')
+
+
+class WavReader:
+    """
+    Acceso aleatorio a un WAV PCM de 16 bits mapeado en memoria.
+
+    El archivo no se lee al abrirlo: se mapea y cada lectura copia solo los
+    bytes del intervalo pedido, de modo que extraer un fragmento cuesta lo
+    mismo al principio que al final de una grabación de horas. Los WAV que
+    quedaron sin cerrar (tamaño de datos 0 o desfasado) se leen hasta el
+    final del archivo.
+
+    Se usa como gestor de contexto:
+
+        with WavReader(path) as reader:
+            pcm = reader.read_ms(60_000, 75_000)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            file_size = os.fstat(self._file.fileno()).st_size
+            if file_size == 0:
+                raise ValueError(f"Archivo WAV vacío: {path}")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._parse(file_size)
+        except Exception:
+            self._file.close()
+            raise
+
+    def _parse(self, file_size):
+        if self._map[:4] != b'RIFF' or self._map[8:12] != b'WAVE':
+            raise ValueError(f"No es un archivo WAV: {self.path}")
+
+        fmt = None
+        offset = 12
+        # Recorrer los bloques RIFF hasta 'data' (puede haber LIST u otros antes)
+        while offset + 8 <= file_size:
+            chunk_id, chunk_size = struct.unpack_from('<4sI', self._map, offset)
+            body = offset + 8
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack_from('<HHIIHH', self._map, body)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"WAV sin bloque fmt antes de los datos: {self.path}")
+                available = file_size - body
+                if chunk_size == 0 or chunk_size > available:
+                    chunk_size = available
+                self.data_offset = body
+                self.data_size = chunk_size
+                break
+            offset = body + chunk_size + (chunk_size & 1)
+        else:
+            raise ValueError(f"WAV sin bloque de datos: {self.path}")
+
+        audio_format, self.channels, self.sample_rate, _, _, bits = fmt
+        if audio_format != 1 or bits != 16:
+            raise ValueError(f"Solo se admite PCM de 16 bits: {self.path}")
+        self.frame_size = self.channels * 2
+        self.frames = self.data_size // self.frame_size
+
+    @property
+    def duration_ms(self):
+        return self.frames * 1000 // self.sample_rate
+
+    def frame_at(self, ms):
+        """Frame correspondiente a un instante en milisegundos (limitado a la duración)"""
+        return min(max(ms * self.sample_rate // 1000, 0), self.frames)
+
+    def read(self, start, end):
+        """
+        Lee un intervalo de frames
+
+        Args:
+            start: Primer frame
+            end: Frame final (no incluido)
+
+        Returns:
+            Bytes PCM intercalados del intervalo
+        """
+        start = min(max(start, 0), self.frames)
+        end = min(max(end, start), self.frames)
+        return self._map[self.data_offset + start * self.frame_size:self.data_offset + end * self.frame_size]
+
+    def read_ms(self, start_ms, end_ms):
+        """Lee el audio entre dos instantes en milisegundos"""
+        return self.read(self.frame_at(start_ms), self.frame_at(end_ms))
+
+    def iter_blocks(self, block_frames, start=0, end=None):
+        """
+        Recorre un intervalo por bloques
+
+        Yields:
+            Tuplas (frame_inicial, bytes PCM del bloque)
+        """
+        end = self.frames if end is None else min(end, self.frames)
+        for position in range(start, end, block_frames):
+            yield position, self.read(position, min(position + block_frames, end))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_clip(source_path, output_path, start_ms, end_ms, block_frames=48000):
+    """
+    Escribe un fragmento de un WAV en otro WAV por bloques (memoria constante)
+
+    Args:
+        source_path: WAV de origen
+        output_path: WAV de salida
+        start_ms: Inicio del fragmento en milisegundos
+        end_ms: Fin del fragmento en milisegundos
+        block_frames: Frames copiados por bloque
+
+    Returns:
+        Duración del fragmento escrito en milisegundos
+    """
+    with WavReader(source_path) as reader:
+        start, end = reader.frame_at(start_ms), reader.frame_at(end_ms)
+        with open(output_path, 'wb') as f:
+            f.write(build_wav_header((end - start) * reader.frame_size, reader.sample_rate, reader.channels))
+            for _, block in reader.iter_blocks(block_frames, start, end):
+                f.write(block)
+        return (end - start) * 1000 // reader.sample_rate